@@ -0,0 +1,211 @@
+import cv2
+import sys
+import json
+import os
+import platform
+import argparse
+import statistics
+import numpy as np
+
+from detector import Detector
+from projector import Projector
+from gfxutils import getPerfTime, getTime
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+BASEPATH = 'test/data/'
+
+# images from test/data, and what they are good for
+images = {
+    'hit': 'test-hit.jpg',
+    'glare': 'test-glare.jpg',
+    'target': 'test-target.jpg',
+    'aruco': 'test-aruco.jpg',
+}
+
+resolutions = {
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '4k': (3840, 2160),
+}
+
+THRESH = 14
+TARGET_THRESH = 100
+MIN_RADIUS = 1.0
+
+
+def loadImage(name, resolution):
+    """Image from test/data scaled to resolution (width, height)"""
+    frame = cv2.imread(BASEPATH + images[name])
+    if frame is None:
+        raise FileNotFoundError(BASEPATH + images[name])
+    (width, height) = resolution
+    interpolation = cv2.INTER_AREA if width < frame.shape[1] else cv2.INTER_LINEAR
+    return cv2.resize(frame, (width, height), interpolation=interpolation)
+
+
+def measure(func, repeat, warmup=2):
+    """Call func repeat times, return (median, min) in ms"""
+    for n in range(warmup):
+        func()
+    times = []
+    for n in range(repeat):
+        start = getPerfTime()
+        func()
+        times.append((getPerfTime() - start) * 1000)
+    return statistics.median(times), min(times)
+
+
+def benchDetector(resolution, repeat):
+    """Time the Detector stages on every test image at resolution"""
+    results = {}
+    detector = Detector(None)
+
+    for name in images:
+        frame = loadImage(name, resolution)
+
+        def initFrame():
+            detector.initFrame(frame, THRESH)
+        results['Detector.initFrame/' + name] = measure(initFrame, repeat)
+
+        # the find* functions work on the masks of the last initFrame()
+        detector.initFrame(frame, THRESH)
+        results['Detector.findHits/' + name] = measure(lambda: detector.findHits(MIN_RADIUS), repeat)
+        results['Detector.findBlobs/' + name] = measure(lambda: detector.findBlobs(MIN_RADIUS), repeat)
+        results['Detector.findGlare/' + name] = measure(detector.findGlare, repeat)
+        results['Detector.findTargets/' + name] = measure(lambda: detector.findTargets(TARGET_THRESH), repeat)
+        results['Detector.findAruco/' + name] = measure(detector.findAruco, repeat)
+
+        # background already has the frame: measures the no-change case
+        detector.resetBackground()
+        detector.findHitsDiff(MIN_RADIUS)
+        results['Detector.findHitsDiff/' + name] = measure(lambda: detector.findHitsDiff(MIN_RADIUS), repeat)
+
+        def pyramid():
+            detector.initFramePyramid(frame, THRESH)
+            detector.findHitsPyramid(MIN_RADIUS)
+        results['Detector.pyramid/' + name] = measure(pyramid, repeat)
+
+        def tiled():
+            detector.initFrameTiled(frame, THRESH)
+            detector.findHitsTiled(MIN_RADIUS)
+        results['Detector.tiled/' + name] = measure(tiled, repeat)
+
+        detector.init()
+
+    return results
+
+
+def benchProjector(resolution, repeat):
+    """Time the Projector drawing and the cam->projector transform at resolution"""
+    results = {}
+    (width, height) = resolution
+    if height < 1080:  # the projected aruco layout is fixed, and needs at least 1080p
+        return results
+    projector = Projector(height=height, width=width, withWindow=False)
+
+    # fixed transform, like a cam looking at the projection slightly from the side
+    srcMat = np.array([[0, 0], [500, 0], [500, 500], [0, 500]])
+    dstMat = np.array([[310, 220], [820, 250], [800, 740], [290, 700]])
+    (projector.H, _) = cv2.findHomography(srcMat, dstMat)
+
+    results['Projector.translate'] = measure(lambda: projector.translate(560, 480), repeat * 10)
+    results['Projector._getPicAruco'] = measure(projector._getPicAruco, repeat)
+    return results
+
+
+def getMeta(repeat):
+    return {
+        'time': getTime(),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'repeat': repeat,
+    }
+
+
+def run(outFile, repeat, only=None):
+    benchmarks = {}
+    for resolutionName, resolution in resolutions.items():
+        if only is not None and resolutionName not in only:
+            continue
+        print("Benchmark {} {}x{}".format(resolutionName, resolution[0], resolution[1]))
+        results = benchDetector(resolution, repeat)
+        results.update(benchProjector(resolution, repeat))
+
+        for name, (median, minimum) in results.items():
+            key = resolutionName + '/' + name
+            benchmarks[key] = {'median': round(median, 4), 'min': round(minimum, 4)}
+            print("  {:45} median {:9.3f} ms   min {:9.3f} ms".format(name, median, minimum))
+
+    data = {'meta': getMeta(repeat), 'benchmarks': benchmarks}
+    with open(outFile, 'w') as outfile:
+        json.dump(data, outfile, indent=2)
+    print("Saved to: " + outFile)
+
+
+def compare(baselineFile, newFile, tolerance):
+    """Compare the medians of two runs. Returns the number of regressions"""
+    with open(baselineFile) as f:
+        baseline = json.load(f)
+    with open(newFile) as f:
+        new = json.load(f)
+
+    if baseline['meta'].get('platform') != new['meta'].get('platform') or baseline['meta'].get('cpus') != new['meta'].get('cpus'):
+        print("Warning: runs are from different machines, numbers are not comparable")
+
+    regressions = 0
+    for key, result in new['benchmarks'].items():
+        if key not in baseline['benchmarks']:
+            print("  {:60} new".format(key))
+            continue
+        old = baseline['benchmarks'][key]['median']
+        ratio = result['median'] / old if old > 0 else 1.0
+        status = ''
+        if ratio > 1.0 + tolerance:
+            status = 'REGRESSION'
+            regressions += 1
+        elif ratio < 1.0 - tolerance:
+            status = 'faster'
+        print("  {:60} {:9.3f} -> {:9.3f} ms  {:6.2f}x  {}".format(key, old, result['median'], ratio, status))
+
+    for key in baseline['benchmarks']:
+        if key not in new['benchmarks']:
+            print("  {:60} missing".format(key))
+
+    print("{} regressions (tolerance {:.0f}%)".format(regressions, tolerance * 100))
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Micro-benchmarks of the detector and projector")
+    sub = ap.add_subparsers(dest='command', required=True)
+
+    apRun = sub.add_parser('run', help="Run all benchmarks and save them")
+    apRun.add_argument("--out", help="JSON file to write", default='bench.json')
+    apRun.add_argument("--repeat", help="Measurements per benchmark", type=int, default=20)
+    apRun.add_argument("--resolution", help="Only these resolutions", choices=list(resolutions), action='append')
+
+    apCompare = sub.add_parser('compare', help="Compare a run against a baseline, exit 1 on regressions")
+    apCompare.add_argument("baseline", help="JSON file of the baseline run")
+    apCompare.add_argument("new", help="JSON file of the new run")
+    apCompare.add_argument("--tolerance", help="Allowed slowdown of the median (0.1: 10%%)", type=float, default=0.1)
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.command == 'run':
+        run(args.out, args.repeat, args.resolution)
+    elif args.command == 'compare':
+        if compare(args.baseline, args.new, args.tolerance) > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import cv2
+import logging
+import numpy as np
+
+from gfxutils import clipRoi, toGrey
+
+logger = logging.getLogger(__name__)
+
+
+class Decimator(object):
+    """When to detect hits in a frame, for high fps sources.
+
+    While nothing happens, only every n'th frame gets detected. Once a frame has a hit,
+    all frames are detected for burstFrames frames (burst). The frames skipped before
+    the hit are detected afterwards (backtrack, see DetectorThread.readDecimated()),
+    so the first frame of a hit is the same as without decimation.
+
+    With accumulate, no frame is detected while idle. Instead the brightest pixels of
+    every n frames are collected (MaxAccumulator), and only if they could contain a hit,
+    the n frames get detected. This way short laser pulses are not missed"""
+
+    def __init__(self, every, burstFrames=10, accumulate=False):
+        self.every = every  # detect every n'th frame while idle
+        self.burstFrames = burstFrames  # detect all frames this long after the last hit
+        self.burstLeft = 0
+        self.accumulate = accumulate
+        self.accumulator = MaxAccumulator()
+
+        self.detected = 0
+        self.skipped = 0
+        self.backtracked = 0  # skipped first, and detected after a hit
+
+
+    def isBurst(self):
+        return self.burstLeft > 0
+
+
+    def shouldDetect(self, heldCount):
+        """If the next frame gets detected, with heldCount frames skipped before it"""
+        return self.isBurst() or heldCount + 1 >= self.every
+
+
+    def update(self, isActive):
+        """After frames got detected: isActive if one of them has a hit"""
+        if isActive:
+            self.burstLeft = self.burstFrames
+        elif self.burstLeft > 0:
+            self.burstLeft -= 1
+
+
+    def getStats(self):
+        return {
+            'every': self.every,
+            'detected': self.detected,
+            'skipped': self.skipped,
+            'backtracked': self.backtracked,
+            'accumulated': self.accumulator.windows,
+            'accumulatedCandidates': self.accumulator.candidates,
+        }
+
+
+class MaxAccumulator(object):
+    """Brightest value of every pixel over the frames added since clear(), on downscaled
+    grey frames. A laser dot in any of the frames is still in the composite.
+
+    Static bright areas (glare, reflections) are in every composite. They are learned as
+    background, so only pixels brighter than before make a window a candidate"""
+
+    def __init__(self, levels=1, threshOffset=30, backgroundMargin=30):
+        self.levels = levels  # halve the frames this many times
+        self.threshOffset = threshOffset  # lower threshold than the detector, the frames are downscaled
+        self.backgroundMargin = backgroundMargin  # how much brighter than the background a candidate is
+        self.backgroundAlpha = 0.1  # how fast the background adapts to changes, per window
+        self.composite = None
+        self.count = 0  # frames in the composite
+        self.background = None  # float32, running average of the composites
+
+        self.windows = 0  # checked with hasCandidates()
+        self.candidates = 0  # of them with something bright
+
+
+    def add(self, frame, roi=None):
+        roi = clipRoi(roi, frame.shape)
+        if roi is not None:
+            (x1, y1, x2, y2) = roi
+            frame = frame[y1:y2, x1:x2]
+        small = frame
+        for level in range(self.levels):
+            small = cv2.resize(small, (small.shape[1] // 2, small.shape[0] // 2), interpolation=cv2.INTER_AREA)
+        small = toGrey(small)
+
+        if self.count == 0 or self.composite is None or self.composite.shape != small.shape:
+            self.composite = small.copy()
+        else:
+            cv2.max(self.composite, small, dst=self.composite)
+        self.count += 1
+
+
+    def hasCandidates(self, thresh):
+        """If any pixel of the composite is bright enough to be a hit with thresh"""
+        if self.count == 0:
+            return False
+        self.windows += 1
+
+        _, candidates = cv2.threshold(self.composite, 255 - thresh - self.threshOffset - 1, 255, cv2.THRESH_BINARY)
+        background = self.background
+        if background is None or background.shape != self.composite.shape:
+            self.background = self.composite.astype(np.float32)  # nothing to compare with yet
+        else:
+            diff = cv2.subtract(self.composite, cv2.convertScaleAbs(background))
+            _, brighter = cv2.threshold(diff, self.backgroundMargin, 255, cv2.THRESH_BINARY)
+            cv2.min(candidates, brighter, dst=candidates)
+            cv2.accumulateWeighted(self.composite, background, self.backgroundAlpha)
+
+        if cv2.countNonZero(candidates) > 0:
+            self.candidates += 1
+            return True
+        return False
+
+
+    def clear(self):
+        """Start a new composite, the memory is reused"""
+        self.count = 0
+
+
+    def resetBackground(self):
+        """The scene changed, e.g. after seeking"""
+        self.background = None
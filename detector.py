@@ -1,8 +1,11 @@
 import cv2
 import imutils
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 from gfxutils import *
 from model import *
+from fps import Timer
 
 class Detector():
     def __init__(self, videoStream):
@@ -12,6 +15,25 @@ class Detector():
         self.doDenoise = True
         self.doSharpen = True
 
+        # temporal difference options (HitAlgo.diff)
+        self.backgroundAlpha = 0.05  # how fast the background adapts to changes
+        self.diffThresh = 30  # how much brighter than the background a spot needs to be
+
+        # brightness gate: skip the contour search if there are no bright pixels at all
+        self.gateStep = 1  # only check every nth pixel in x and y. 1 to check all
+        self.timeGated = Timer()  # per frame detection time, frames stopped at the gate
+        self.timeSearched = Timer()  # per frame detection time, frames with contour search
+
+        # coarse to fine options (HitAlgo.pyramid)
+        self.pyramidLevels = 2  # search candidates on a frame halved this many times (2: 1/4)
+        self.pyramidThreshOffset = 60  # lower threshold for the downscaled frame
+        self.pyramidMargin = 16  # in pixel, around candidates for the full resolution search
+
+        # tiled options (HitAlgo.tiled)
+        self.tileBands = 4  # horizontal bands, processed in parallel
+        self.tileOverlap = 16  # in pixel, rows above and below a band for the filters
+        self.tilePool = None  # created on the first tiled frame
+
         self.arucoDict = cv2.aruco.Dictionary_get(cv2.aruco.DICT_ARUCO_ORIGINAL)
         self.arucoParams = cv2.aruco.DetectorParameters_create()
         self.init()
@@ -23,35 +45,52 @@ class Detector():
         self.mask = None
         self.previousMask = None
         self.mask2 = None
+        self.roi = None
+        self.background = None
+
 
+    def resetBackground(self):
+        self.background = None
 
-    def initFrame(self, frame, thresh):
+
+    def initFrame(self, frame, thresh, roi=None):
+        self.frameStartTime = getPerfTime()
         self.frame = frame
         self.previousMask = self.mask
 
+        # Region of interest: only process the area around the target (x1, y1, x2, y2)
+        # all results are mapped back to frame coordinates
+        self.roi = clipRoi(roi, frame.shape)
+        if self.roi is not None:
+            (x1, y1, x2, y2) = self.roi
+            frame = frame[y1:y2, x1:x2]
+
+        self.grey, self.mask2, self.mask = self.preprocess(frame, thresh)
+
+
+    def preprocess(self, frame, thresh):
+        """Returns grey, cleaned up grey (mask2) and thresholded mask of frame"""
         # Mask: Make to grey
-        self.grey = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        ##self.mask3 = self.mask.copy()
+        grey = toGrey(frame)
 
         # Mask: remove small artefacts (helpful for removing some glare, and improving detection)
+        m = grey
         if self.doSharpen:
-            m = cv2.medianBlur(self.grey,5)
+            m = cv2.medianBlur(m, 5)
             # self.mask = cv2.blur(self.mask,(5,5))
             m = cv2.erode(m, (7,7), iterations=3)
 
-        # save copy of mask for now
-        #self.mask2 = self.mask.copy()
-        self.mask2 = m
         # Mask: threshold, throw away all bytes below thresh (bytes)
-        _, self.mask = cv2.threshold(m, 255-thresh, 255, cv2.THRESH_BINARY)
+        _, mask = cv2.threshold(m, 255-thresh, 255, cv2.THRESH_BINARY)
 
-        ##cv2.imshow("m3", self.mask2)
-        
-        # check if there is any change at all
-        # if no change, do not attempt to find contours. 
-        # this can save processing power
-        #if frameIdentical(self.mask, self.previousMask):
-        #    return []
+        return grey, m, mask
+
+
+    def getRoiOffset(self):
+        """Offset of the processed area in the frame"""
+        if self.roi is None:
+            return 0, 0
+        return self.roi[0], self.roi[1]
 
 
     def findAruco(self):
@@ -67,13 +106,14 @@ class Detector():
         cnts = imutils.grab_contours(cnts)
 
         # loop over the contours
+        (offsetX, offsetY) = self.getRoiOffset()
         glare = []
         for c in cnts:
             # compute the bounding box of the contour and then draw the
             # bounding box on both input images to represent where the two
             # images differ
             (x, y, w, h) = cv2.boundingRect(c)
-            opencvRect = OpencvRect(x, y, w, h)
+            opencvRect = OpencvRect(x + offsetX, y + offsetY, w, h)
             glare.append(opencvRect)
             
         return glare
@@ -96,47 +136,339 @@ class Detector():
 
 
     def findHits(self, minRadius):
-        res = []
+        return self._findHitsInMask(self.mask, minRadius)
+
+
+    def findHitsDiff(self, minRadius):
+        """Like findHits(), but only for spots which newly appeared compared to a running background"""
+        if self.background is None or self.background.shape != self.mask2.shape:
+            self.background = self.mask2.astype(np.float32)
+            return []
+
+        # only keep what got brighter than the background. Static glare and
+        # reflections are part of the background and get ignored
+        diff = cv2.subtract(self.mask2, cv2.convertScaleAbs(self.background))
+        cv2.accumulateWeighted(self.mask2, self.background, self.backgroundAlpha)
+        _, diff = cv2.threshold(diff, self.diffThresh, 255, cv2.THRESH_BINARY)
+        diff = cv2.bitwise_and(diff, self.mask)
+
+        # if there is no change at all, the gate in here skips the contour search
+        return self._findHitsInMask(diff, minRadius)
+
+
+    def hasCandidates(self, mask):
+        """Cheap check if mask has any set pixel (subsampled by gateStep)"""
+        if self.gateStep > 1:
+            return np.count_nonzero(mask[::self.gateStep, ::self.gateStep]) > 0
+        return cv2.countNonZero(mask) > 0
+
+
+    def findBlobs(self, minRadius):
+        """All blobs of the mask in one labeling pass, as array of model.BlobDtype (largest first)"""
+        blobs = np.zeros(0, dtype=BlobDtype)
+        if not self.hasCandidates(self.mask):
+            self.timeGated.add(getPerfTime() - self.frameStartTime)
+            return blobs
+
+        # label only the area with set pixels, usually a small part of the frame
+        (x, y, w, h) = cv2.boundingRect(self.mask)
+        mask = self.mask[y:y + h, x:x + w]
+        n, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+        # peak intensity per label, only looking at the (few) set pixels
+        points = cv2.findNonZero(mask).reshape(-1, 2)
+        peak = np.zeros(n, dtype=np.uint8)
+        np.maximum.at(peak, labels[points[:, 1], points[:, 0]], self.grey[y:y + h, x:x + w][points[:, 1], points[:, 0]])
+
+        # label 0 is the background
+        (offsetX, offsetY) = self.getRoiOffset()
+        blobs = np.zeros(n - 1, dtype=BlobDtype)
+        blobs['x'] = np.rint(centroids[1:, 0] + x) + offsetX
+        blobs['y'] = np.rint(centroids[1:, 1] + y) + offsetY
+        blobs['radius'] = np.maximum(stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT]) // 2
+        blobs['area'] = stats[1:, cv2.CC_STAT_AREA]
+        blobs['left'] = stats[1:, cv2.CC_STAT_LEFT] + x + offsetX
+        blobs['top'] = stats[1:, cv2.CC_STAT_TOP] + y + offsetY
+        blobs['width'] = stats[1:, cv2.CC_STAT_WIDTH]
+        blobs['height'] = stats[1:, cv2.CC_STAT_HEIGHT]
+        blobs['peak'] = peak[1:]
+
+        blobs = blobs[blobs['radius'] > minRadius]
+        blobs = blobs[np.argsort(-blobs['area'], kind='stable')]
+
+        self.timeSearched.add(getPerfTime() - self.frameStartTime)
+        return blobs
+
+
+    def _findHitsInMask(self, mask, minRadius):
+        # most frames do not contain a laser at all. Skip all the contour work
+        if not self.hasCandidates(mask):
+            self.timeGated.add(getPerfTime() - self.frameStartTime)
+            return []
+
+        res = self._findLargestHit(mask, minRadius)
+        self.timeSearched.add(getPerfTime() - self.frameStartTime)
+        return res
 
+
+    def _findLargestHit(self, mask, minRadius):
         # find contours in the mask and initialize the current
         # (x, y) center of the ball
-        cnts = cv2.findContours(self.mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        cnts = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         cnts = imutils.grab_contours(cnts)
-        center = None
 
         # only proceed if at least one contour was found
+        if len(cnts) == 0:
+            return []
+
+        # find the largest contour in the mask
+        c = max(cnts, key=cv2.contourArea)
+        (offsetX, offsetY) = self.getRoiOffset()
+        return self._contourToHits(c, minRadius, offsetX, offsetY)
+
+
+    def _contourToHits(self, c, minRadius, offsetX, offsetY):
+        """Use the minimum enclosing circle and centroid of contour c as hit, if its big enough"""
+        res = []
+
+        ((x, y), radius) = cv2.minEnclosingCircle(c)
+        M = cv2.moments(c)
+        if M["m00"] == 0:
+            ##print("DIVISION BY ZERO")
+            return res
+        center = (int(M["m10"] / M["m00"]) + offsetX, int(M["m01"] / M["m00"]) + offsetY)
+
+        # only proceed if the radius meets a minimum size
+        if radius > minRadius:  # orig: 10, for most: 5
+            radius = int(radius)
+            x = int(x) + offsetX
+            y = int(y) + offsetY
+            logger.debug("Found dot with radius " + str(radius) + " at  X:" + str(x) + "  Y:" + str(y))
+
+            recordedHit = RecordedHit()
+            recordedHit.x = x
+            recordedHit.y = y
+            recordedHit.center = center
+            recordedHit.radius = radius
+            res.append(recordedHit)
+        else:
+            logger.info("Too small: " + str(radius))
+            pass
+
+        return res
+
+
+    def initFramePyramid(self, frame, thresh, roi=None):
+        """Like initFrame(), but only creates a downscaled mask of candidates (self.coarseMask).
+        Use findHitsPyramid() afterwards"""
+        self.frameStartTime = getPerfTime()
+        self.frame = frame
+        self.thresh = thresh
+        self.previousMask = self.mask
+        self.grey = None
+        self.mask2 = None
+        self.mask = None
+
+        self.roi = clipRoi(roi, frame.shape)
+        if self.roi is not None:
+            (x1, y1, x2, y2) = self.roi
+            frame = frame[y1:y2, x1:x2]
+        self.pyramidFrame = frame
+
+        # halve a level at a time (much faster than one big INTER_AREA step),
+        # and only convert the small image to grey
+        small = frame
+        for level in range(self.pyramidLevels):
+            small = cv2.resize(small, (small.shape[1] // 2, small.shape[0] // 2), interpolation=cv2.INTER_AREA)
+        grey = toGrey(small)
+
+        # downscaling averages small dots with their surrounding, so use a lower
+        # threshold. Wrong candidates get removed again in full resolution
+        _, self.coarseMask = cv2.threshold(grey, 255 - thresh - self.pyramidThreshOffset, 255, cv2.THRESH_BINARY)
+
+
+    def findHitsPyramid(self, minRadius):
+        """Like findHits(), but only searches windows around the candidates of initFramePyramid()
+        in full resolution"""
+        if not self.hasCandidates(self.coarseMask):
+            self.timeGated.add(getPerfTime() - self.frameStartTime)
+            return []
+
+        n, labels, stats, centroids = cv2.connectedComponentsWithStats(self.coarseMask, connectivity=8)
+        s = 2 ** self.pyramidLevels
+        m = self.pyramidMargin
+
+        # largest contour over all candidate windows, like findHits()
+        best = None
+        bestArea = 0
+        for i in range(1, n):  # label 0 is the background
+            left = stats[i, cv2.CC_STAT_LEFT]
+            top = stats[i, cv2.CC_STAT_TOP]
+            right = left + stats[i, cv2.CC_STAT_WIDTH]
+            bottom = top + stats[i, cv2.CC_STAT_HEIGHT]
+            window = clipRoi((left * s - m, top * s - m, right * s + m, bottom * s + m), self.pyramidFrame.shape)
+            if window is None:
+                continue
+
+            (x1, y1, x2, y2) = window
+            _, _, mask = self.preprocess(self.pyramidFrame[y1:y2, x1:x2], self.thresh)
+            cnts = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            cnts = imutils.grab_contours(cnts)
+            if len(cnts) == 0:
+                continue
+
+            c = max(cnts, key=cv2.contourArea)
+            area = cv2.contourArea(c)
+            if best is None or area > bestArea:
+                best = (c, x1, y1)
+                bestArea = area
+
+        res = []
+        if best is not None:
+            (c, x1, y1) = best
+            (offsetX, offsetY) = self.getRoiOffset()
+            res = self._contourToHits(c, minRadius, x1 + offsetX, y1 + offsetY)
+
+        self.timeSearched.add(getPerfTime() - self.frameStartTime)
+        return res
+
+
+    def initFrameTiled(self, frame, thresh, roi=None):
+        """Like initFrame(), but preprocesses horizontal bands of the frame on a thread pool.
+        Bands overlap by tileOverlap rows, so the result is the same as with initFrame()"""
+        self.frameStartTime = getPerfTime()
+        self.frame = frame
+        self.previousMask = self.mask
+
+        self.roi = clipRoi(roi, frame.shape)
+        if self.roi is not None:
+            (x1, y1, x2, y2) = self.roi
+            frame = frame[y1:y2, x1:x2]
+
+        (height, width) = frame.shape[:2]
+        self.grey = np.empty((height, width), np.uint8)
+        self.mask2 = np.empty((height, width), np.uint8)
+        self.mask = np.empty((height, width), np.uint8)
+        self.bands = getBands(height, self.tileBands)
+        if self.tilePool is None:
+            self.tilePool = ThreadPoolExecutor(max_workers=self.tileBands, thread_name_prefix='Tile')
+        list(self.tilePool.map(lambda band: self.preprocessBand(frame, thresh, band), self.bands))
+
+
+    def preprocessBand(self, frame, thresh, band):
+        """Preprocess the rows of band (y1, y2) with some rows around, and keep the band"""
+        (y1, y2) = band
+        top = max(0, y1 - self.tileOverlap)
+        bottom = min(frame.shape[0], y2 + self.tileOverlap)
+        grey, m, mask = self.preprocess(frame[top:bottom], thresh)
+        self.grey[y1:y2] = grey[y1 - top:y2 - top]
+        self.mask2[y1:y2] = m[y1 - top:y2 - top]
+        self.mask[y1:y2] = mask[y1 - top:y2 - top]
+
+
+    def findHitsTiled(self, minRadius):
+        """Like findHits(), after initFrameTiled(). The contours of the bands are searched in parallel,
+        contours touching the edge between two bands are joined again"""
+        if not self.hasCandidates(self.mask):
+            self.timeGated.add(getPerfTime() - self.frameStartTime)
+            return []
+
+        bandContours = list(self.tilePool.map(self.findBandContours, self.bands))
+        cnts = []
+        for contours in bandContours:
+            cnts += [c for (c, rect, atSeam) in contours if not atSeam]
+        cnts += self.joinSeamContours(bandContours)
+        # the order of findContours() on the whole mask (last found first), for contours of the same area
+        cnts.sort(key=lambda c: (c[0][0][1], c[0][0][0]), reverse=True)
+
+        res = []
         if len(cnts) > 0:
-            # find the largest contour in the mask, then use
-            # it to compute the minimum enclosing circle and
-            # centroid
             c = max(cnts, key=cv2.contourArea)
-            ((x, y), radius) = cv2.minEnclosingCircle(c)
-            M = cv2.moments(c)
-            if M["m00"] == 0:
-                ##print("DIVISION BY ZERO")
-                return res
-            center = (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
-
-            # only proceed if the radius meets a minimum size
-            if radius > minRadius:  # orig: 10, for most: 5
-                radius = int(radius)
-                x = int(x)
-                y = int(y)
-                logger.debug("Found dot with radius " + str(radius) + " at  X:" + str(x) + "  Y:" + str(y))
-
-                recordedHit = RecordedHit()
-                recordedHit.x = x
-                recordedHit.y = y
-                recordedHit.center = center
-                recordedHit.radius = radius
-                res.append(recordedHit)
-            else:
-                logger.info("Too small: " + str(radius))
-                pass
+            (offsetX, offsetY) = self.getRoiOffset()
+            res = self._contourToHits(c, minRadius, offsetX, offsetY)
+        self.timeSearched.add(getPerfTime() - self.frameStartTime)
+        return res
+
+
+    def findBandContours(self, band):
+        """Contours in the mask of band, as (contour, rect, touches the band above or below)"""
+        (y1, y2) = band
+        cnts = cv2.findContours(self.mask[y1:y2], cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(0, y1))
+        cnts = imutils.grab_contours(cnts)
+        res = []
+        for c in cnts:
+            (x, y, w, h) = cv2.boundingRect(c)
+            atSeam = (y == y1 and y1 > 0) or (y + h == y2 and y2 < self.mask.shape[0])
+            res.append((c, (x, y, w, h), atSeam))
+        return res
+
 
+    def joinSeamContours(self, bandContours):
+        """Contours of the blobs which were split by the bands.
+        Draws the parts touching a seam, and searches the contours again in that window"""
+        parts = []
+        for contours in bandContours:
+            parts += [(c, rect) for (c, rect, atSeam) in contours if atSeam]
+        if len(parts) == 0:
+            return []
+
+        # group parts whose rects touch, a blob may go over several bands
+        groups = [[part] for part in parts]
+        joined = True
+        while joined:
+            joined = False
+            for i in range(len(groups)):
+                for j in range(i + 1, len(groups)):
+                    if rectsTouch(groupRect(groups[i]), groupRect(groups[j])):
+                        groups[i] += groups.pop(j)
+                        joined = True
+                        break
+                if joined:
+                    break
+
+        res = []
+        for group in groups:
+            (x, y, w, h) = groupRect(group)
+            window = np.zeros((h, w), np.uint8)
+            cv2.drawContours(window, [c for (c, rect) in group], -1, 255, cv2.FILLED, offset=(-x, -y))
+            cnts = cv2.findContours(window, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x, y))
+            res += imutils.grab_contours(cnts)
         return res
 
 
+def getBands(height, bands):
+    """(y1, y2) of bands rows of about the same height"""
+    bands = max(1, min(bands, height))
+    return [(height * n // bands, height * (n + 1) // bands) for n in range(bands)]
+
+
+def groupRect(group):
+    """Bounding rect (x, y, w, h) of the rects of a group of (contour, rect)"""
+    x1 = min(rect[0] for (c, rect) in group)
+    y1 = min(rect[1] for (c, rect) in group)
+    x2 = max(rect[0] + rect[2] for (c, rect) in group)
+    y2 = max(rect[1] + rect[3] for (c, rect) in group)
+    return (x1, y1, x2 - x1, y2 - y1)
+
+
+def rectsTouch(a, b):
+    """If rects (x, y, w, h) overlap or are 8-connected neighbours"""
+    return a[0] <= b[0] + b[2] and b[0] <= a[0] + a[2] and a[1] <= b[1] + b[3] and b[1] <= a[1] + a[3]
+
+
+def blobsToRecordedHits(blobs):
+    """Convert the result of Detector.findBlobs() to a list of RecordedHit"""
+    res = []
+    for blob in blobs:
+        recordedHit = RecordedHit()
+        recordedHit.x = int(blob['x'])
+        recordedHit.y = int(blob['y'])
+        recordedHit.center = (recordedHit.x, recordedHit.y)
+        recordedHit.radius = int(blob['radius'])
+        res.append(recordedHit)
+    return res
+
+
 def findTriangles(c):
     peri = cv2.arcLength(c, True)
     approx = cv2.approxPolyDP(c, 0.04 * peri, True)
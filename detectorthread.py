@@ -1,78 +1,413 @@
 import logging
+from collections import deque
 
-from detector import Detector
-from threading import Thread
-from queue import Queue
+from detector import Detector, blobsToRecordedHits
+from threading import Thread, Lock
 
-from model import Mode
+from fps import Timer
+from decimator import Decimator
+from framebuffer import FrameBuffer, ReorderBuffer
+from gfxutils import getPerfTime
+from model import Mode, HitAlgo
+from tracer import tracer
 
 logger = logging.getLogger(__name__)
 
 
+class DetectorWorker(object):
+    """A Detector, and what it needs to remember about the frames it got before"""
+
+    def __init__(self, videoStream, workerNr):
+        self.detector = Detector(videoStream)
+        self.workerNr = workerNr
+        self.mode = None  # mode of the last frame
+        self.generation = 0  # of the last frame
+        self.busyTime = 0  # in s, detecting
+        self.frames = 0
+        self.time = Timer()  # per frame
+
+
+    def detected(self, duration):
+        self.busyTime += duration
+        self.frames += 1
+        self.time.add(duration)
+
+
 class DetectorThread():
-    def __init__(self, videoStream):
+    def __init__(self, videoStream, workers=1):
         self.videoStream = videoStream
-        self.detector = Detector(videoStream)
 
         # We support non-threaded implementation for file based video playback
         # as configured in the videostream
         self.doThread = videoStream.threaded
 
+        # With more than one worker, consecutive frames are detected in parallel
+        # by their own Detector, and put back in order by a ReorderBuffer
+        self.workerCount = max(1, workers) if self.doThread else 1
+        self.workers = [DetectorWorker(videoStream, 0)]
+        self.detector = self.workers[0].detector
+
         # Thread stuff
         self.stopped = False
-        self.Q = Queue(maxsize=8)
+        # low latency: only process the newest frame, and hand it over directly
+        self.Q = FrameBuffer(maxsize=1 if videoStream.lowLatency else 8)
         self.threadData = None  # All configurable data consumed by this thread
+        self.inQ = None  # frames for the workers
+        self.reorder = None  # results of the workers
+        self.seq = 0  # of the next frame a worker takes from inQ
+        self.seqLock = Lock()
+        self.workerThreads = []
+        self.startTime = getPerfTime()
+
+        # detect only every n'th frame while there are no hits (threadData['decimate'])
+        self.decimator = None
+        self.pending = deque()  # not threaded: data of frames read already
+
+        # seeking while the thread reads ahead: frames read before the last
+        # seek have an older generation, and get thrown away
+        self.seekLock = Lock()
+        self.generation = 0
+        self.eof = False  # the thread ended at the end of the file
 
 
     def startThread(self, threadData):
         if not self.doThread:
             self.threadData = threadData  # only need this if !doThread, funnily
             return
-        self.thread = Thread(target=self.update, args=(threadData, ))  # give reference to threaddata to the thread function
+        self.threadData = threadData
+        if self.workerCount > 1 and threadData['hitAlgo'] == HitAlgo.diff:
+            logger.warning("HitAlgo.diff needs all frames in order, using one detector worker")
+            self.workerCount = 1
+        ringFrames = self.getRingFrames()
+        if self.workerCount > 1 and ringFrames is not None and self.workerCount + 2 > ringFrames:
+            # every worker holds a frame, and the input queue and reorder buffer at least one
+            workers = max(1, ringFrames - 2)
+            logger.warning("The frame ring has only room for {} detector workers".format(workers))
+            self.workerCount = workers
+        if self.workerCount > 1:
+            self.startWorkers(threadData)
+        if threadData.get('decimate', 1) > 1:
+            if self.workerCount > 1:
+                logger.warning("Decimation is not supported with several detector workers")
+            elif threadData['hitAlgo'] == HitAlgo.diff:
+                logger.warning("HitAlgo.diff needs all frames, not decimating")
+            elif threadData['decimate'] > self.getMaxDecimate():
+                logger.warning("Decimating only 1/{}, the frame ring can't hold more skipped frames".format(
+                    self.getMaxDecimate()))
+        self.startTime = getPerfTime()
+        self.startReader()
+
+
+    def startReader(self):
+        if self.workerCount > 1:
+            target = self.read
+        else:
+            target = self.update
+        self.thread = Thread(target=target, args=(self.threadData, ))  # give reference to threaddata to the thread function
         self.thread.daemon = True
         self.thread.start()
 
 
+    def startWorkers(self, threadData):
+        # a frame for every worker waiting, and the results of the workers ahead of the slowest one
+        inSize = 1 if self.videoStream.lowLatency else self.workerCount
+        outSize = self.workerCount + (0 if self.videoStream.lowLatency else 8)
+        ringFrames = self.getRingFrames()
+        if ringFrames is not None:  # all of them hold a slot of the ring
+            inSize = 1
+            outSize = min(outSize, ringFrames - 1 - self.workerCount)
+        self.inQ = FrameBuffer(maxsize=inSize)
+        self.reorder = ReorderBuffer(maxsize=outSize)
+        for workerNr in range(1, self.workerCount):
+            self.workers.append(DetectorWorker(self.videoStream, workerNr))
+        for worker in self.workers:
+            thread = Thread(target=self.work, args=(threadData, worker), name='Detector-' + str(worker.workerNr))
+            thread.daemon = True
+            thread.start()
+            self.workerThreads.append(thread)
+        logger.info("Using {} detector workers".format(self.workerCount))
+
+
+    def getRingFrames(self):
+        """How many frames of a FrameRing we may hold at once (read, not released yet),
+        None without a ring. The rest: the frame Lazer shows, the one the reader got, and
+        one for the ring to decode into, so a camera gets drained"""
+        if not self.doThread or not self.videoStream.ring:
+            return None
+        return self.videoStream.ringCapacity - 3
+
+
     def shutdownThread(self):
         if not self.doThread:
             return
         self.stopped = True
+        self.Q.stop()
+        if self.inQ is not None:
+            self.inQ.stop()
+            self.reorder.stop()
         self.videoStream.release()
         self.thread.join()
+        for thread in self.workerThreads:
+            thread.join()
+        if self.workerCount > 1 or self.decimator is not None:
+            logger.info("Detector: {}".format(self.getStats()))
 
 
     def setFrameNr(self, frameNr):
-        if self.doThread:
-            logger.warn("SetFrameNr on threaded detector?")
+        """Continue at frameNr (files only)"""
+        if not self.doThread:
+            self.videoStream.setFrame(frameNr)
+            self.detector.resetBackground()
+            if self.decimator is not None:
+                self.decimator.accumulator.resetBackground()
+            self.pending.clear()  # read before the seek
             return
-        self.videoStream.setFrame(frameNr)
+
+        if self.decimator is not None:
+            self.decimator.accumulator.resetBackground()
+        with self.seekLock:
+            self.generation += 1
+            self.videoStream.setFrame(frameNr)
+            if self.eof:  # thread already ended, start it again
+                self.thread.join()
+                self.eof = False
+                self.stopped = False
+                self.startReader()
 
 
     def getFrameData(self):
         if self.doThread:
-            return self.Q.get()
+            while True:
+                if self.reorder is not None:
+                    item = self.reorder.get()
+                else:
+                    item = self.Q.get()
+                if item is None:  # shut down
+                    return((False, None, -1, None, None))
+                (generation, data) = item
+                if generation == self.generation:
+                    return data
+                # read before the last seek
+                if data[0]:
+                    self.videoStream.releaseFrame()
         else:
-            return self._getFrame(self.threadData)
+            if len(self.pending) == 0:
+                for (generation, data) in self.readDecimated(self.threadData, self.workers[0]):
+                    self.pending.append(data)
+            return self.pending.popleft()
 
 
     def update(self, threadData):
         """Thread: Main endless loop"""
+        worker = self.workers[0]
         while not self.stopped:
-            data = self._getFrame(threadData)
-            self.Q.put(data)
+            for (generation, data) in self.readDecimated(threadData, worker):
+                self.Q.put((generation, data), force=not data[0])  # never drop the end of the stream
+                if not data[0]:
+                    return
+
+
+    def readDecimated(self, threadData, worker):
+        """(generation, data) of the frames up to the next one which gets detected.
+        Without decimation, this is only one frame.
+
+        The frames skipped before have no hits. But if the detected frame has a hit, or the
+        accumulated skipped frames may have one, they get detected too. So the hit is found in
+        the same frame as without decimation"""
+        decimator = self.getDecimator(threadData)
+        held = []  # (generation, frameData) of skipped frames
+        while True:
+            (generation, frameData) = self.readFrame()
+            if decimator is None or not frameData[0] or threadData['mode'] != Mode.main:
+                break
+            if len(held) > 0 and held[0][0] != generation:  # seeked, the held frames get thrown away
+                break
+            if decimator.isBurst():
+                break
+            if decimator.accumulate:
+                with tracer.span('MaxAccumulator.add', frameData[2]):
+                    decimator.accumulator.add(frameData[1], threadData['roi'])
+                held.append((generation, frameData))
+                if len(held) >= decimator.every:
+                    frameData = None  # all frames of the window are held
+                    break
+            else:
+                if decimator.shouldDetect(len(held)):
+                    break
+                held.append((generation, frameData))
+
+        data = None
+        isActive = False
+        if frameData is not None:
+            data = self.detect(threadData, frameData, generation, worker)
+            isActive = data[0] and data[3] == Mode.main and len(data[4]['recordedHits']) > 0
+            if decimator is not None and data[3] == Mode.main:
+                decimator.detected += 1
+
+        isCandidate = isActive
+        if decimator is not None and decimator.accumulate:
+            if not isCandidate and len(held) > 0:
+                isCandidate = decimator.accumulator.hasCandidates(threadData['thresh'])
+            decimator.accumulator.clear()
+
+        results = []
+        for (heldGeneration, heldFrameData) in held:
+            if isCandidate and heldGeneration == generation:
+                heldData = self.detect(threadData, heldFrameData, heldGeneration, worker)
+                isActive = isActive or len(heldData[4]['recordedHits']) > 0
+                results.append((heldGeneration, heldData))
+                decimator.backtracked += 1
+            else:
+                results.append((heldGeneration, self.skip(heldFrameData)))
+                decimator.skipped += 1
+        if data is not None:
+            results.append((generation, data))
+        if decimator is not None:
+            decimator.update(isActive)
+        return results
+
 
+    def getDecimator(self, threadData):
+        """The Decimator, None if all frames get detected"""
+        every = min(threadData.get('decimate', 1), self.getMaxDecimate())
+        if every <= 1 or threadData['hitAlgo'] == HitAlgo.diff:
+            return None
+        accumulate = threadData.get('accumulate', False)
+        if self.decimator is None or self.decimator.every != every or self.decimator.accumulate != accumulate:
+            self.decimator = Decimator(every, accumulate=accumulate)
+        return self.decimator
 
-    def _getFrame(self, threadData):
-        isTrue, frame, frameNr = self.videoStream.getFrame()
+
+    def getMaxDecimate(self):
+        """Largest window of held frames. Frames of a FrameRing stay in their slot until
+        Lazer is done with them: the window, the frame Lazer shows and one to read ahead
+        have to fit into the ring, or the reader waits forever for a free slot"""
+        if self.doThread and self.videoStream.ring:
+            return max(1, self.videoStream.ringCapacity - 2)
+        return float('inf')  # frames are not held in place
+
+
+    def skip(self, frameData):
+        """Data of a frame in main mode which did not get detected"""
+        isTrue, frame, frameNr, captureTime = frameData
+        data = {
+            'recordedHits': [],
+            'blobs': None,
+            'mask': None,
+            'captureTime': captureTime,
+            'skipped': True,
+        }
+        return((isTrue, frame, frameNr, Mode.main, data))
+
+
+    def read(self, threadData):
+        """Thread: hand the frames to the detector workers, in order"""
+        while not self.stopped:
+            (generation, frameData) = self.readFrame()
+            self.inQ.put((generation, frameData), force=not frameData[0])
+            if not frameData[0]:
+                break
+
+
+    def readFrame(self):
+        with self.seekLock:
+            generation = self.generation
+            frameData = self.videoStream.getFrame()
+            if not frameData[0]:
+                self.eof = True  # setFrameNr() has to restart us
+        return generation, frameData
+
+
+    def work(self, threadData, worker):
+        """Thread: detect in the frames from the reader. The frames are numbered in the
+        order they were taken, so the reorder buffer can put the results back in order"""
+        while True:
+            with self.seqLock:
+                item = self.inQ.get()
+                seq = self.seq
+                self.seq += 1
+            if item is None:  # shut down
+                break
+            (generation, frameData) = item
+
+            if generation != self.generation and frameData[0]:
+                data = (True, frameData[1], frameData[2], None, None)  # seeked away, will be thrown away
+            else:
+                data = self.detect(threadData, frameData, generation, worker)
+            self.reorder.put(seq, (generation, data))
+
+
+    def detect(self, threadData, frameData, generation, worker):
+        if generation != worker.generation:
+            worker.detector.resetBackground()  # not the next frame anymore
+            worker.generation = generation
+        start = getPerfTime()
+        data = self._getFrame(threadData, frameData, worker)
+        if data[0]:
+            worker.detected(getPerfTime() - start)
+        return data
+
+
+    def getDetectTimes(self):
+        """(ms per gated frame, % of frames gated, ms per searched frame) over all workers,
+        None before the first frame"""
+        gated = [worker.detector.timeGated for worker in self.workers]
+        searched = [worker.detector.timeSearched for worker in self.workers]
+        gatedCount = sum(timer.count for timer in gated)
+        searchedCount = sum(timer.count for timer in searched)
+        if gatedCount + searchedCount == 0:
+            return None
+        return (
+            Timer.getAverageMs(gated),
+            int(100 * gatedCount / (gatedCount + searchedCount)),
+            Timer.getAverageMs(searched))
+
+
+    def getStats(self):
+        """Per worker utilization (time detecting / time since start) and queue depths"""
+        elapsed = max(getPerfTime() - self.startTime, 0.001)
+        return {
+            'workers': len(self.workers),
+            'utilization': [round(worker.busyTime / elapsed, 2) for worker in self.workers],
+            'frames': [worker.frames for worker in self.workers],
+            'detectMs': [worker.time.getMs() for worker in self.workers],
+            'inputDepth': self.inQ.qsize() if self.inQ is not None else 0,
+            'outputDepth': self.reorder.qsize() if self.reorder is not None else self.Q.qsize(),
+            'decimation': self.decimator.getStats() if self.decimator is not None else None,
+        }
+
+
+    def _getFrame(self, threadData, frameData=None, worker=None):
+        if frameData is None:
+            frameData = self.videoStream.getFrame()
+        if worker is None:
+            worker = self.workers[0]
+        isTrue, frame, frameNr, captureTime = frameData
         if not isTrue:
-            self.stopped = True
             return((False, None, frameNr, None, None))
 
-        self.detector.initFrame(frame, threadData['thresh'])
-        if threadData['mode'] == Mode.intro:
-            glare = self.detector.findGlare()
-            contours, reliefs = self.detector.findTargets(threadData['targetThresh'])
-            (corners, ids, rejected) = self.detector.findAruco()
+        detector = worker.detector
+        mode = threadData['mode']
+        if mode != worker.mode:
+            detector.resetBackground()  # scene may have changed completely
+            worker.mode = mode
+
+        with tracer.span('Detector.initFrame', frameNr):
+            if mode == Mode.main and threadData['hitAlgo'] == HitAlgo.pyramid:
+                # does not need the full resolution mask
+                detector.initFramePyramid(frame, threadData['thresh'], threadData['roi'])
+            elif mode == Mode.main and threadData['hitAlgo'] == HitAlgo.tiled:
+                detector.initFrameTiled(frame, threadData['thresh'], threadData['roi'])
+            else:
+                detector.initFrame(frame, threadData['thresh'], threadData['roi'])
+
+        if mode == Mode.intro:
+            with tracer.span('Detector.findGlare', frameNr):
+                glare = detector.findGlare()
+            with tracer.span('Detector.findTargets', frameNr):
+                contours, reliefs = detector.findTargets(threadData['targetThresh'])
+            with tracer.span('Detector.findAruco', frameNr):
+                (corners, ids, rejected) = detector.findAruco()
             data = {
                 'glare': glare,
 
@@ -82,12 +417,37 @@ class DetectorThread():
                 'arucoCorners': corners,
                 'arucoIds': ids,
                 'arucoRejected': rejected,
+
+                'mask': detector.mask,
+                'captureTime': captureTime,
             }
             return((isTrue, frame, frameNr, Mode.intro, data))
 
-        elif threadData['mode'] == Mode.main:
-            recordedHits = self.detector.findHits(minRadius=1.0)
+        elif mode == Mode.main:
+            with tracer.span('Detector.findHits', frameNr):
+                recordedHits, blobs = self._findHits(detector, threadData['hitAlgo'])
             data = {
                 'recordedHits': recordedHits,
+                'blobs': blobs,  # only for HitAlgo.blobs
+
+                'mask': detector.mask,  # None for HitAlgo.pyramid
+                'captureTime': captureTime,
             }
             return((isTrue, frame, frameNr, Mode.main, data))
+
+
+    def _findHits(self, detector, hitAlgo):
+        """Hits with the configured model.HitAlgo, after Detector.initFrame()"""
+        blobs = None
+        if hitAlgo == HitAlgo.diff:
+            recordedHits = detector.findHitsDiff(minRadius=1.0)
+        elif hitAlgo == HitAlgo.blobs:
+            blobs = detector.findBlobs(minRadius=1.0)
+            recordedHits = blobsToRecordedHits(blobs)
+        elif hitAlgo == HitAlgo.pyramid:
+            recordedHits = detector.findHitsPyramid(minRadius=1.0)
+        elif hitAlgo == HitAlgo.tiled:
+            recordedHits = detector.findHitsTiled(minRadius=1.0)
+        else:
+            recordedHits = detector.findHits(minRadius=1.0)
+        return recordedHits, blobs
@@ -0,0 +1,150 @@
+import cv2
+import json
+import yaml
+import logging
+from threading import Thread, Lock
+
+from fps import Timer
+from framebuffer import FrameBuffer
+from gfxutils import getPerfTime
+from model import DropPolicy
+
+logger = logging.getLogger(__name__)
+
+
+class EvidenceWriter(object):
+    """Writes images and their metadata in background threads, so the detection does not
+    wait for encoding and the disk.
+
+    Frames get queued in a bounded queue. If the workers can't keep up, new frames
+    are dropped (and counted), except the ones queued with force (hits)"""
+
+    def __init__(self, workers=2, maxsize=32, batchSize=50):
+        self.Q = FrameBuffer(maxsize=maxsize, policy=DropPolicy.dropNewest)
+        self.batchSize = batchSize  # records per write of a JSON lines file
+        self.batches = {}  # filename: [records] not written yet
+        self.batchLock = Lock()
+        self.statsLock = Lock()
+
+        # back-pressure metrics
+        self.queued = 0
+        self.written = 0
+        self.bytesWritten = 0
+        self.maxDepth = 0
+        self.writeTime = Timer()  # per image, encoding and writing
+
+        self.threads = []
+        for n in range(workers):
+            thread = Thread(target=self.update, args=(), name='EvidenceWriter-' + str(n))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+
+    def writeImage(self, filename, image, force=False):
+        """Queue image to be encoded to filename (type by extension: .jpg, .png).
+        The image must not be modified afterwards (give a copy). False if it got dropped"""
+        return self.put(('image', filename, image), force)
+
+
+    def writeYaml(self, filename, data):
+        """Queue data to be written as its own yaml file"""
+        self.put(('yaml', filename, data), force=True)  # small, and the part we really want
+
+
+    def writeRecord(self, filename, record):
+        """Append record as a line to the JSON lines file filename. Written in batches"""
+        with self.batchLock:
+            batch = self.batches.setdefault(filename, [])
+            batch.append(record)
+            if len(batch) < self.batchSize:
+                return
+            self.batches[filename] = []
+        self.put(('records', filename, batch), force=True)
+
+
+    def run(self, name, func):
+        """Queue func to be called by a worker, e.g. for other formats. Never dropped"""
+        self.put(('call', name, func), force=True)
+
+
+    def put(self, job, force):
+        isQueued = self.Q.put(job, force=force) is None
+        if isQueued:
+            self.queued += 1
+        self.maxDepth = max(self.maxDepth, self.Q.qsize())
+        return isQueued
+
+
+    def update(self):
+        """Thread: write what is queued, until stopped and empty"""
+        while True:
+            job = self.Q.get()
+            if job is None:
+                break
+            try:
+                self.write(job)
+            except Exception as e:  # keep the worker alive, e.g. disk full
+                logger.error("Could not write {}: {}".format(job[1], e))
+
+
+    def write(self, job):
+        (jobType, filename, data) = job
+        if jobType == 'image':
+            start = getPerfTime()
+            ext = '.' + filename.rsplit('.', 1)[-1]
+            isOk, buf = cv2.imencode(ext, data)
+            if not isOk:
+                logger.error("Could not encode: " + filename)
+                return
+            with open(filename, 'wb') as f:
+                f.write(buf)
+            with self.statsLock:
+                self.bytesWritten += len(buf)
+                self.writeTime.add(getPerfTime() - start)
+        elif jobType == 'yaml':
+            with open(filename, 'w') as f:
+                yaml.dump(data, f)
+        elif jobType == 'call':
+            data()
+        elif jobType == 'records':
+            with open(filename, 'a') as f:
+                f.write(''.join(json.dumps(record) + '\n' for record in data))
+        with self.statsLock:
+            self.written += 1
+
+
+    def getDepth(self):
+        return self.Q.qsize()
+
+
+    def getDropped(self):
+        return self.Q.droppedFrames
+
+
+    def getStats(self):
+        return {
+            'queued': self.queued,
+            'written': self.written,
+            'dropped': self.Q.droppedFrames,
+            'depth': self.Q.qsize(),
+            'maxDepth': self.maxDepth,
+            'bytesWritten': self.bytesWritten,
+            'writeMs': self.writeTime.getMs(),
+        }
+
+
+    def close(self):
+        """Write everything still queued or batched, and stop the workers"""
+        with self.batchLock:
+            batches = self.batches
+            self.batches = {}
+        for filename, batch in batches.items():
+            if len(batch) > 0:
+                self.put(('records', filename, batch), force=True)
+
+        # workers exit once the queue is empty
+        self.Q.stop()
+        for thread in self.threads:
+            thread.join()
+        logger.info("Evidence writer: {}".format(self.getStats()))
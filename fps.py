@@ -1,4 +1,6 @@
-from gfxutils import getTime
+import time
+
+from gfxutils import getTime, getPerfTime
 
 
 class Fps(object):
@@ -29,3 +31,54 @@ class Fps(object):
             return 0
         else:
             return int(1 / avg)
+
+
+class Timer(Fps):
+    """Average duration between start() and stop() over the last 100 measurements"""
+    def __init__(self):
+        super().__init__()
+        self.startTime = 0
+        self.count = 0
+
+    def start(self):
+        self.startTime = getPerfTime()
+
+    def stop(self):
+        self.add(getPerfTime() - self.startTime)
+
+    def add(self, duration):
+        self.tick(duration)
+        self.count += 1
+
+    def getMs(self):
+        n = min(self.count, self.ticklistSize)
+        if n == 0:
+            return 0
+        return round(self.ticksum / n * 1000, 1)
+
+    @staticmethod
+    def getAverageMs(timers):
+        """Average of the last measurements of several Timers, e.g. of several threads"""
+        n = sum(min(timer.count, timer.ticklistSize) for timer in timers)
+        if n == 0:
+            return 0
+        return round(sum(timer.ticksum for timer in timers) / n * 1000, 1)
+
+
+class CpuUsage(object):
+    """CPU time of this process (all threads) per wall time in %, over 100 with more than one core.
+    Updated every interval seconds"""
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.lastTime = getPerfTime()
+        self.lastCpu = time.process_time()
+        self.usage = 0
+
+    def get(self):
+        now = getPerfTime()
+        if now - self.lastTime >= self.interval:
+            cpu = time.process_time()
+            self.usage = int(100 * (cpu - self.lastCpu) / (now - self.lastTime))
+            self.lastTime = now
+            self.lastCpu = cpu
+        return self.usage
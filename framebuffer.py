@@ -0,0 +1,136 @@
+import logging
+from threading import Condition
+from collections import deque
+
+from fps import Fps
+from model import DropPolicy
+
+logger = logging.getLogger(__name__)
+
+
+class FrameBuffer(object):
+    """Bounded FIFO between a producer and a consumer thread.
+    What happens when it is full is decided by a model.DropPolicy"""
+
+    def __init__(self, maxsize, policy=DropPolicy.block):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.items = deque()
+        self.cond = Condition()
+        self.stopped = False
+
+        self.droppedFrames = 0
+        self.droppedFramesPS = Fps()
+
+
+    def put(self, item, force=False):
+        """Add item. With force, it is always added (e.g. end of stream).
+        Returns the item which got dropped, if any"""
+        dropped = None
+        with self.cond:
+            if len(self.items) >= self.maxsize and not force:
+                if self.policy == DropPolicy.dropNewest:
+                    self.dropped()
+                    return item
+                elif self.policy == DropPolicy.dropOldest:
+                    dropped = self.items.popleft()
+                    self.dropped()
+                else:
+                    while len(self.items) >= self.maxsize and not self.stopped:
+                        self.cond.wait()
+                    if self.stopped:
+                        return item
+
+            self.items.append(item)
+            self.cond.notify_all()
+        return dropped
+
+
+    def get(self):
+        """Oldest item. Blocks until there is one, None if stopped"""
+        with self.cond:
+            while len(self.items) == 0 and not self.stopped:
+                self.cond.wait()
+            if len(self.items) == 0:
+                return None
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+
+    def dropped(self):
+        self.droppedFrames += 1
+        self.droppedFramesPS.tack()
+
+
+    def qsize(self):
+        return len(self.items)
+
+
+    def full(self):
+        return len(self.items) >= self.maxsize
+
+
+    def flush(self):
+        """Remove all items, and accept new ones again after stop(). Returns the removed items"""
+        with self.cond:
+            items = list(self.items)
+            self.items.clear()
+            self.stopped = False
+            self.cond.notify_all()
+        return items
+
+
+    def stop(self):
+        """Wake up everyone waiting"""
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+
+class ReorderBuffer(object):
+    """Results of several worker threads, handed to the consumer in order of their
+    sequence numbers (0, 1, 2, ...) no matter which worker finishes first.
+    Workers wait if they are more than maxsize items ahead of the consumer"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = {}  # seq: item
+        self.nextSeq = 0  # the consumer waits for this one
+        self.cond = Condition()
+        self.stopped = False
+
+
+    def put(self, seq, item):
+        """Worker: add the result with the sequence number seq"""
+        with self.cond:
+            while seq >= self.nextSeq + self.maxsize and not self.stopped:
+                self.cond.wait()
+            if self.stopped:
+                return
+            self.items[seq] = item
+            self.cond.notify_all()
+
+
+    def get(self):
+        """Next item in order. Blocks until it is there, None if stopped"""
+        with self.cond:
+            while self.nextSeq not in self.items and not self.stopped:
+                self.cond.wait()
+            if self.nextSeq not in self.items:
+                return None
+            item = self.items.pop(self.nextSeq)
+            self.nextSeq += 1
+            self.cond.notify_all()
+            return item
+
+
+    def qsize(self):
+        """Results waiting, including the ones waiting for an earlier result"""
+        return len(self.items)
+
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
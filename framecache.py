@@ -0,0 +1,132 @@
+import cv2
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+
+from gfxutils import toGrey
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_DIR = '.framecache'  # next to the video file
+
+
+class FrameCache(object):
+    """All frames of a video file decoded once to grey (and optionally cropped or scaled),
+    stored in a file and memory mapped. Keyed by the path, size and modification time of
+    the file, crop and resolution, so a changed video or other settings create a new cache"""
+
+    def __init__(self, filename, crop=None, resolution=None, cacheDir=None):
+        self.filename = filename
+        self.crop = crop  # [(x1, y1), (x2, y2)] like VideoStream.setCrop()
+        self.resolution = resolution  # (width, height) to scale to, after cropping. None to keep
+        if cacheDir is None:
+            cacheDir = os.path.join(os.path.dirname(os.path.abspath(filename)), CACHE_DIR)
+        self.cacheDir = cacheDir
+        self.frames = None  # np.memmap (frameCount, height, width)
+        self.fps = 0
+
+
+    def getKey(self):
+        """Cheap to get: hashing the content of a large video would cost more than decoding it"""
+        stat = os.stat(self.filename)
+        h = hashlib.sha1()
+        h.update(json.dumps({
+            'filename': os.path.abspath(self.filename),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'crop': self.crop,
+            'resolution': self.resolution,
+        }).encode())
+        return h.hexdigest()
+
+
+    def open(self):
+        """Map the cache, decode the video into it first if it does not exist yet"""
+        basename = os.path.join(self.cacheDir, self.getKey())
+        if not os.path.isfile(basename + '.json'):
+            if not self.build(basename):
+                return False
+
+        with open(basename + '.json') as f:
+            meta = json.load(f)
+        self.fps = meta['fps']
+        if meta['frameCount'] == 0:
+            self.frames = np.zeros((0, meta['height'], meta['width']), dtype=np.uint8)
+            return True
+
+        # copy on write: frames can be drawn on, without changing the cache
+        self.frames = np.memmap(
+            basename + '.raw', dtype=np.uint8, mode='c',
+            shape=(meta['frameCount'], meta['height'], meta['width']))
+        return True
+
+
+    def build(self, basename):
+        logger.info("Decoding {} into frame cache {}".format(self.filename, basename))
+        capture = cv2.VideoCapture(self.filename)
+        if not capture.isOpened():
+            logger.error("Could not open: " + self.filename)
+            return False
+        fps = capture.get(cv2.CAP_PROP_FPS)
+
+        os.makedirs(self.cacheDir, exist_ok=True)
+        tmp = '.tmp' + str(os.getpid())
+        frameCount = 0
+        shape = (0, 0)
+        # write to temporary files first, so an aborted run does not leave a broken cache
+        with open(basename + '.raw' + tmp, 'wb') as f:
+            while True:
+                (grabbed, frame) = capture.read()
+                if not grabbed:
+                    break
+                frame = self.transform(frame)
+                shape = frame.shape
+                f.write(np.ascontiguousarray(frame).data)
+                frameCount += 1
+        capture.release()
+
+        meta = {
+            'filename': os.path.basename(self.filename),
+            'crop': self.crop,
+            'resolution': self.resolution,
+            'frameCount': frameCount,
+            'height': shape[0],
+            'width': shape[1],
+            'fps': fps,
+        }
+        with open(basename + '.json' + tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(basename + '.raw' + tmp, basename + '.raw')
+        os.replace(basename + '.json' + tmp, basename + '.json')  # last: marks the cache as complete
+        logger.info("Frame cache: {} frames of {}x{}".format(frameCount, shape[1], shape[0]))
+        return True
+
+
+    def transform(self, frame):
+        """Decoded frame to what we store"""
+        if self.crop is not None and len(self.crop) == 2:
+            ((x1, y1), (x2, y2)) = self.crop
+            frame = frame[y1:y2, x1:x2]
+        if self.resolution is not None:
+            frame = cv2.resize(frame, self.resolution, interpolation=cv2.INTER_AREA)
+        return toGrey(frame)
+
+
+    def getFrameCount(self):
+        if self.frames is None:
+            return 0
+        return len(self.frames)
+
+
+    def getResolution(self):
+        """(width, height) of the cached frames"""
+        if self.frames is None:
+            return 0, 0
+        return self.frames.shape[2], self.frames.shape[1]
+
+
+    def release(self):
+        self.frames = None
@@ -0,0 +1,132 @@
+import logging
+import numpy as np
+
+from framering import FrameArena
+
+logger = logging.getLogger(__name__)
+
+
+class FrameHistory(object):
+    """The last capacity frames with their frame numbers, copied into preallocated memory.
+    Once the first frame is known, pushing a frame does not allocate anything, except
+    for slots whose frame was lent out (see lend())"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.arena = None  # allocated with the first frame
+        self.slots = None  # frame per slot, views into the arena until a slot was lent out
+        self.lent = set()  # slots whose frame must not be overwritten anymore
+        self.frameNrs = [-1] * capacity  # per slot
+        self.next = 0  # slot written next
+        self.count = 0
+        self.lastFrameNr = -1
+
+
+    def push(self, frame, frameNr):
+        """Copy frame into the history"""
+        if self.arena is None or self.arena.shape != frame.shape or self.arena.dtype != frame.dtype:
+            self.arena = FrameArena(self.capacity, frame.shape, frame.dtype)
+            self.slots = list(self.arena.frames)
+            self.lent = set()
+            self.clear()
+        elif self.count > 0 and frameNr <= self.lastFrameNr:  # seeked back, or rewound
+            self.clear()
+
+        slot = self.next
+        if slot in self.lent:  # somebody still uses the old frame, write into new memory
+            self.slots[slot] = np.empty(self.arena.shape, self.arena.dtype)
+            self.lent.discard(slot)
+        self.slots[slot][...] = frame
+        self.frameNrs[slot] = frameNr
+        self.next = (slot + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.lastFrameNr = frameNr
+
+
+    def get(self, frameNr):
+        """Frame frameNr if it is still in the history, else None. Valid until it gets overwritten"""
+        if self.count == 0:
+            return None
+        # frame numbers are usually consecutive
+        offset = self.lastFrameNr - frameNr
+        if 0 <= offset < self.count:
+            slot = (self.next - 1 - offset) % self.capacity
+            if self.frameNrs[slot] == frameNr:
+                return self.slots[slot]
+        for n in range(self.count):
+            slot = (self.next - 1 - n) % self.capacity
+            if self.frameNrs[slot] == frameNr:
+                return self.slots[slot]
+        return None
+
+
+    def getRange(self, firstFrameNr, lastFrameNr):
+        """(frameNr, frame) of all frames from firstFrameNr to lastFrameNr still in the history, oldest first"""
+        return [(self.frameNrs[slot], self.slots[slot]) for slot in self.getSlots(firstFrameNr, lastFrameNr)]
+
+
+    def lend(self, firstFrameNr, lastFrameNr):
+        """Like getRange(), but the frames stay valid for good, without copying them (e.g. for
+        another thread): their slots get new memory when they are written next"""
+        slots = self.getSlots(firstFrameNr, lastFrameNr)
+        self.lent.update(slots)
+        return [(self.frameNrs[slot], self.slots[slot]) for slot in slots]
+
+
+    def getSlots(self, firstFrameNr, lastFrameNr):
+        """Slots of the frames from firstFrameNr to lastFrameNr, oldest first"""
+        slots = []
+        for n in range(self.count - 1, -1, -1):
+            slot = (self.next - 1 - n) % self.capacity
+            if firstFrameNr <= self.frameNrs[slot] <= lastFrameNr:
+                slots.append(slot)
+        return slots
+
+
+    def clear(self):
+        self.frameNrs = [-1] * self.capacity
+        self.next = 0
+        self.count = 0
+        self.lastFrameNr = -1
+
+
+class TriggeredWindow(object):
+    """Remembers triggers (e.g. hits) until the frames up to post frames after them were seen.
+    Together with a FrameHistory of at least pre + post + 1 frames, this gives the frames around a trigger"""
+
+    def __init__(self, pre, post):
+        self.pre = pre  # frames before the trigger
+        self.post = post  # frames after the trigger
+        self.pending = []  # (frameNr, data)
+
+
+    def trigger(self, frameNr, data):
+        self.pending.append((frameNr, data))
+
+
+    def update(self, frameNr):
+        """Triggers which are complete when frameNr arrives, as (frameNr, data).
+        Call it before frameNr is added to the FrameHistory, so seeking back does not mix up frames"""
+        if len(self.pending) == 0:
+            return []
+        done = []
+        pending = []
+        for (nr, data) in self.pending:
+            if frameNr > nr + self.post or frameNr < nr:
+                done.append((nr, data))
+            else:
+                pending.append((nr, data))
+        self.pending = pending
+        return done
+
+
+    def getRange(self, frameNr):
+        """First and last frame number of the window of the trigger at frameNr"""
+        return frameNr - self.pre, frameNr + self.post
+
+
+    def flush(self):
+        """All pending triggers, e.g. at the end of the video"""
+        done = self.pending
+        self.pending = []
+        return done
@@ -0,0 +1,145 @@
+import logging
+from threading import Thread, Lock, Event
+from collections import OrderedDict
+
+from inputstream import SimpleInputStream
+
+logger = logging.getLogger(__name__)
+
+
+class FrameLru(object):
+    """Recently decoded frames by frame number, least recently used ones are
+    thrown away once they use more than maxBytes. Thread safe"""
+
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.frames = OrderedDict()  # frameNr: frame
+        self.bytes = 0
+        self.lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, frameNr):
+        """Frame frameNr, or None if it is not cached. Do not modify it"""
+        with self.lock:
+            frame = self.frames.get(frameNr)
+            if frame is None:
+                self.misses += 1
+                return None
+            self.frames.move_to_end(frameNr)
+            self.hits += 1
+            return frame
+
+
+    def put(self, frameNr, frame):
+        with self.lock:
+            if frameNr in self.frames:
+                self.frames.move_to_end(frameNr)
+                return
+            self.frames[frameNr] = frame
+            self.bytes += frame.nbytes
+            while self.bytes > self.maxBytes and len(self.frames) > 1:
+                (oldNr, oldFrame) = self.frames.popitem(last=False)
+                self.bytes -= oldFrame.nbytes
+
+
+    def getCount(self):
+        with self.lock:
+            return len(self.frames)
+
+
+    def contains(self, frameNr):
+        with self.lock:
+            return frameNr in self.frames
+
+
+    def getCapacity(self, frameBytes):
+        """How many frames of frameBytes fit"""
+        return max(1, self.maxBytes // max(1, frameBytes))
+
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.bytes = 0
+
+
+class FramePrefetcher(object):
+    """Thread: decodes the frames around the playhead of a video file into a FrameLru
+    with its own capture, so stepping forward and back does not wait for decoding"""
+
+    def __init__(self, filename, lru, ahead=30, behind=30):
+        self.lru = lru
+        self.ahead = ahead  # frames after the playhead, decoded first
+        self.behind = behind  # frames before the playhead
+        self.playhead = None  # idle until the first seek, normal playback needs no prefetching
+        self.endFrame = None  # first frame number behind the end of the file, once we know it
+
+        self.inputStream = SimpleInputStream(filename)
+        self.pos = 0  # next frame self.inputStream decodes
+        self.stopped = False
+        self.wakeup = Event()
+        self.thread = Thread(target=self.update, args=())
+        self.thread.daemon = True
+
+
+    def start(self):
+        self.inputStream.initStream()
+        self.thread.start()
+
+
+    def setPlayhead(self, frameNr):
+        self.playhead = frameNr
+        self.wakeup.set()
+
+
+    def setFrameBytes(self, frameBytes):
+        """Limit the window to what fits into the LRU, with some room for the frames played"""
+        capacity = self.lru.getCapacity(frameBytes) // 2
+        self.ahead = min(self.ahead, capacity // 2)
+        self.behind = min(self.behind, capacity - self.ahead)
+
+
+    def getMissing(self):
+        """Next frame to decode: the first one missing after the playhead, then before it"""
+        playhead = self.playhead
+        if playhead is None:
+            return None
+        end = playhead + self.ahead
+        if self.endFrame is not None:
+            end = min(end, self.endFrame - 1)
+        for frameNr in range(playhead, end + 1):
+            if not self.lru.contains(frameNr):
+                return frameNr
+        for frameNr in range(max(0, playhead - self.behind), playhead):
+            if not self.lru.contains(frameNr):
+                return frameNr
+        return None
+
+
+    def update(self):
+        while not self.stopped:
+            frameNr = self.getMissing()
+            if frameNr is None:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+
+            if frameNr != self.pos:
+                self.inputStream.seek(frameNr)
+                self.pos = frameNr
+            (grabbed, frame, captureTime) = self.inputStream.read()
+            self.pos += 1
+            if not grabbed:
+                self.endFrame = frameNr
+                continue
+            self.lru.put(frameNr, frame)
+
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+        self.thread.join()
+        self.inputStream.release()
@@ -0,0 +1,173 @@
+import logging
+import numpy as np
+from threading import Condition
+from collections import deque
+from multiprocessing import shared_memory
+
+from fps import Fps
+from model import DropPolicy
+
+logger = logging.getLogger(__name__)
+
+
+class FrameArena(object):
+    """Preallocated memory for capacity frames of the same shape, optionally in shared memory
+    so another process can attach to it by name"""
+
+    def __init__(self, capacity, shape, dtype=np.uint8, shared=False, name=None):
+        self.capacity = capacity
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.shm = None
+        self.isOwner = name is None
+
+        if shared or name is not None:
+            size = capacity * int(np.prod(self.shape)) * self.dtype.itemsize
+            if name is None:
+                self.shm = shared_memory.SharedMemory(create=True, size=size)
+            else:
+                self.shm = shared_memory.SharedMemory(name=name)
+            self.frames = np.ndarray((capacity,) + self.shape, dtype=self.dtype, buffer=self.shm.buf)
+        else:
+            self.frames = np.empty((capacity,) + self.shape, dtype=self.dtype)
+
+
+    @classmethod
+    def attach(cls, name, capacity, shape, dtype=np.uint8):
+        """Use the shared memory arena created by another process"""
+        return cls(capacity, shape, dtype, name=name)
+
+
+    def getName(self):
+        if self.shm is None:
+            return None
+        return self.shm.name
+
+
+    def release(self):
+        if self.shm is None:
+            return
+        self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:  # frames still referenced somewhere, memory gets freed with them
+            logger.warning("Shared frame arena still in use")
+        if self.isOwner:
+            self.shm.unlink()
+        self.shm = None
+
+
+class FrameRing(object):
+    """Frame slots shared between one writer and one reader thread, without copying or allocating.
+
+    The writer acquires a free slot, decodes directly into it and commits it.
+    The reader gets the oldest committed frame in place, and owns it until it
+    is released again by its sequence number."""
+
+    def __init__(self, capacity, shape, dtype=np.uint8, shared=False):
+        self.arena = FrameArena(capacity, shape, dtype, shared=shared)
+        self.cond = Condition()
+        self.free = deque(range(capacity))  # slots the writer can use
+        self.committed = deque()  # (seq, slot, grabbed) ready for the reader
+        self.held = {}  # seq: slot, read but not yet released
+        self.captureTimes = [0] * capacity  # per slot
+        self.writeSeq = 0
+        self.stopped = False
+
+        self.droppedFrames = 0
+        self.droppedFramesPS = Fps()
+
+
+    def acquire(self, policy=DropPolicy.block):
+        """Writer: get a free (slot, frame) to write into, None if stopped.
+        If there is no free slot, wait for one, or with DropPolicy.dropOldest
+        reuse the slot of the oldest frame not yet read"""
+        with self.cond:
+            if len(self.free) == 0 and policy == DropPolicy.dropOldest and len(self.committed) > 0:
+                (seq, slot, grabbed) = self.committed.popleft()
+                self.dropped()
+                return slot, self.arena.frames[slot]
+
+            while len(self.free) == 0 and not self.stopped:
+                self.cond.wait()
+            if self.stopped:
+                return None
+            slot = self.free.popleft()
+            return slot, self.arena.frames[slot]
+
+
+    def commit(self, slot, grabbed, captureTime=0):
+        """Writer: hand the written slot to the reader"""
+        with self.cond:
+            self.captureTimes[slot] = captureTime
+            self.committed.append((self.writeSeq, slot, grabbed))
+            self.writeSeq += 1
+            self.cond.notify_all()
+
+
+    def read(self):
+        """Reader: oldest committed (grabbed, frame, seq). Blocks until there is one.
+        The frame is owned by the reader until release(seq)"""
+        with self.cond:
+            while len(self.committed) == 0 and not self.stopped:
+                self.cond.wait()
+            if len(self.committed) == 0:
+                return False, None, -1
+            (seq, slot, grabbed) = self.committed.popleft()
+            self.held[seq] = slot
+            return grabbed, self.arena.frames[slot], seq
+
+
+    def release(self, seq):
+        """Reader: give the slot of frame seq back to the writer"""
+        with self.cond:
+            slot = self.held.pop(seq, None)
+            if slot is None:
+                return
+            self.free.append(slot)
+            self.cond.notify_all()
+
+
+    def getCaptureTime(self, seq):
+        """Reader: capture time of a frame still held"""
+        return self.captureTimes[self.held[seq]]
+
+
+    def releaseOldest(self):
+        """Reader: release the oldest frame still held (frames are consumed in order)"""
+        with self.cond:
+            if len(self.held) == 0:
+                return
+            seq = next(iter(self.held))
+        self.release(seq)
+
+
+    def hasFree(self):
+        return len(self.free) > 0
+
+
+    def dropped(self):
+        self.droppedFrames += 1
+        self.droppedFramesPS.tack()
+
+
+    def getDepth(self):
+        """Number of committed frames not yet read"""
+        return len(self.committed)
+
+
+    def flush(self):
+        """Give all frames not read yet back to the writer, and accept new ones again after stop().
+        Frames held by the reader stay valid"""
+        with self.cond:
+            for (seq, slot, grabbed) in self.committed:
+                self.free.append(slot)
+            self.committed.clear()
+            self.stopped = False
+            self.cond.notify_all()
+
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
@@ -1,3 +1,4 @@
+import cv2
 import math
 import numpy as np
 import time
@@ -14,6 +15,11 @@ def getTime():
     #return time.clock()
 
 
+def getPerfTime():
+    """High resolution time for measuring durations (not wall clock)"""
+    return time.perf_counter()
+
+
 def frameIdentical(image1, image2):
     return image1.shape == image2.shape and not(np.bitwise_xor(image1, image2).any())
 
@@ -23,6 +29,29 @@ def calculateDistance(x1, y1, x2, y2):
     return dist
 
 
+def clipRoi(roi, shape):
+    """Clip roi (x1, y1, x2, y2) to an image of shape, None if there is nothing left"""
+    if roi is None:
+        return None
+
+    height, width = shape[0], shape[1]
+    x1 = max(0, int(roi[0]))
+    y1 = max(0, int(roi[1]))
+    x2 = min(width, int(roi[2]))
+    y2 = min(height, int(roi[3]))
+    if x2 <= x1 or y2 <= y1:
+        return None
+
+    return (x1, y1, x2, y2)
+
+
+def toGrey(frame):
+    """frame as grey image, without converting frames which already are (e.g. from FrameCache)"""
+    if frame.ndim == 2:
+        return frame
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
 def imageCopyInto(l_img, s_img, x_offset, y_offset):
     l_img[y_offset:y_offset + s_img.shape[0], x_offset:x_offset + s_img.shape[1], 0] = s_img
     l_img[y_offset:y_offset + s_img.shape[0], x_offset:x_offset + s_img.shape[1], 1] = s_img
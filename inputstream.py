@@ -1,8 +1,13 @@
-from threading import Thread
+from threading import Thread, Event
 import cv2
 import time
-from queue import Queue
-from fps import Fps
+from framering import FrameRing
+from framebuffer import FrameBuffer
+from framecache import FrameCache
+from seekindex import SeekIndex
+from model import DropPolicy
+from gfxutils import getTime
+from tracer import tracer
 
 
 class InputStream():
@@ -12,6 +17,8 @@ class InputStream():
             self.isCam = True
         else:
             self.isCam = False
+        self.cropped = False  # frames from read() already have the crop of the VideoStream
+        self.seekIndex = None  # files: keyframes, loaded on the first seek
 
 
     def initStream(self):
@@ -23,7 +30,7 @@ class InputStream():
             self.capture = cv2.VideoCapture(self.path)
 
     def read(self):
-        # return next frame in the queue
+        # return next (grabbed, frame, captureTime)
         pass
 
 
@@ -31,6 +38,53 @@ class InputStream():
         pass
 
 
+    def seek(self, frameNr):
+        # next read() returns frameNr. Not for cams
+        self.seekCapture(frameNr)
+
+
+    def seekCapture(self, frameNr):
+        """Position the capture so the next frame is frameNr: jump to the keyframe
+        before it, and decode forward from there"""
+        if self.isCam:
+            return
+        if self.seekIndex is None:
+            self.seekIndex = SeekIndex(self.path)
+            self.seekIndex.load()
+
+        keyframe = self.seekIndex.getKeyframe(frameNr)
+        if keyframe is None:  # no index, let the backend do it
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, frameNr)
+            return
+
+        pos = int(self.capture.get(cv2.CAP_PROP_POS_FRAMES))
+        if not (keyframe <= pos <= frameNr):  # no need to jump if we are already in front of it
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+            pos = keyframe
+        for n in range(frameNr - pos):
+            if not self.capture.grab():
+                break
+
+
+    def getResolution(self):
+        # (width, height) of the frames
+        return int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+
+    def releaseFrame(self):
+        # the consumer is done with the oldest frame it got from read()
+        pass
+
+
+    def getDroppedFrames(self):
+        return 0
+
+
+    def getFps(self):
+        # frame rate of the source, 0 if unknown
+        return self.capture.get(cv2.CAP_PROP_FPS)
+
+
     def release(self):
         pass
 
@@ -40,27 +94,28 @@ class SimpleInputStream(InputStream):
         super().__init__(path)
 
     def read(self):
-        return self.capture.read()
+        (grabbed, frame) = self.capture.read()
+        return grabbed, frame, getTime()
 
     def release(self):
         self.capture.release()
 
 
 class QueueInputStream(InputStream):
-    def __init__(self, path):
+    def __init__(self, path, policy=DropPolicy.block, maxsize=8):
         super().__init__(path)
 
         self.stopped = False
         self.transform = False
 
         # initialize the queue used to store frames read from
-        # the video file
-        self.Q = Queue(maxsize=8)
+        # the video file. policy decides what happens if its full
+        self.Q = FrameBuffer(maxsize=maxsize, policy=policy)
         # intialize thread
         self.thread = Thread(target=self.update, args=())
         self.thread.daemon = True
 
-        self.droppedFramesPS = Fps()
+        self.droppedFramesPS = self.Q.droppedFramesPS
 
 
     def start(self):
@@ -76,41 +131,55 @@ class QueueInputStream(InputStream):
             if self.stopped:
                 break
 
-            # otherwise, ensure the queue has room in it
-            if not self.Q.full():
-                # read the next frame from the file
+            # read the next frame from the file
+            with tracer.span('capture.read'):
                 (grabbed, frame) = self.capture.read()
+            captureTime = getTime()
+
+            # if the `grabbed` boolean is `False`, then we have
+            # reached the end of the video file
+            if not grabbed:
+                self.stopped = True
+
+            # if there are transforms to be done, might as well
+            # do them on producer thread before handing back to
+            # consumer thread. ie. Usually the producer is so far
+            # ahead of consumer that we have time to spare.
+            #
+            # Python is not parallel but the transform operations
+            # are usually OpenCV native so release the GIL.
+            #
+            # Really just trying to avoid spinning up additional
+            # native threads and overheads of additional
+            # producer/consumer queues since this one was generally
+            # idle grabbing frames.
+            if self.transform:
+                frame = self.transform(frame)
 
-                # if the `grabbed` boolean is `False`, then we have
-                # reached the end of the video file
-                if not grabbed:
-                    self.stopped = True
-
-                # if there are transforms to be done, might as well
-                # do them on producer thread before handing back to
-                # consumer thread. ie. Usually the producer is so far
-                # ahead of consumer that we have time to spare.
-                #
-                # Python is not parallel but the transform operations
-                # are usually OpenCV native so release the GIL.
-                #
-                # Really just trying to avoid spinning up additional
-                # native threads and overheads of additional
-                # producer/consumer queues since this one was generally
-                # idle grabbing frames.
-                if self.transform:
-                    frame = self.transform(frame)
-
-                # add the frame to the queue
-                self.Q.put((grabbed, frame))
-            else:
-                time.sleep(0.01)  # Rest for 10ms, we have a full queue
-                #self.droppedFramesPS.tack()
-                #print("Dropping a frame: " + str(self.droppedFramesPS.get()))
+            # add the frame to the queue. If its full, this waits for the
+            # consumer or drops a frame, depending on the policy.
+            # The end of the stream is never dropped
+            self.Q.put((grabbed, frame, captureTime), force=not grabbed)
+
+    def seek(self, frameNr):
+        # stop the reader, throw away what it read ahead, and restart it at frameNr
+        self.stop()
+        self.Q.flush()
+        self.seekCapture(frameNr)
+        self.stopped = False
+        self.thread = Thread(target=self.update, args=())
+        self.thread.daemon = True
+        self.thread.start()
 
     def read(self):
         # return next frame in the queue
-        return self.Q.get()
+        item = self.Q.get()
+        if item is None:  # stopped
+            return False, None, 0
+        return item
+
+    def getDroppedFrames(self):
+        return self.Q.droppedFrames
 
     # Insufficient to have consumer use while(more()) which does
     # not take into account if the producer has reached end of
@@ -130,9 +199,162 @@ class QueueInputStream(InputStream):
     def stop(self):
         # indicate that the thread should be stopped
         self.stopped = True
+        self.Q.stop()
         # wait until stream resources are released (producer thread might be still grabbing frame)
         self.thread.join()
 
     def release(self):
         self.stop()
         self.capture.release()
+
+
+class RingInputStream(InputStream):
+    """Like QueueInputStream, but the reader thread decodes straight into the preallocated
+    slots of a FrameRing. Frames returned by read() are used in place, and have to be given
+    back with releaseFrame() once the consumer is done with them."""
+
+    def __init__(self, path, capacity=16, shared=False, policy=DropPolicy.block):
+        super().__init__(path)
+        self.capacity = capacity
+        self.shared = shared
+        self.policy = policy
+        self.ring = None
+        self.ringReady = Event()  # the size of the ring is known after the first frame
+
+        self.stopped = False
+        self.thread = Thread(target=self.update, args=())
+        self.thread.daemon = True
+
+
+    def start(self):
+        self.thread.start()
+        return self
+
+
+    def update(self):
+        if self.ring is None:
+            # the first frame tells us the frame size
+            (grabbed, frame) = self.capture.read()
+            if not grabbed:
+                self.stopped = True
+                self.ringReady.set()
+                return
+            self.ring = FrameRing(self.capacity, frame.shape, frame.dtype, shared=self.shared)
+            slot, buf = self.ring.acquire()
+            buf[...] = frame
+            self.ring.commit(slot, True, getTime())
+            self.ringReady.set()
+
+        while not self.stopped:
+            if self.policy == DropPolicy.dropNewest and not self.ring.hasFree():
+                # no room: keep the camera buffer drained, but do not decode
+                if self.capture.grab():
+                    self.ring.dropped()
+                    continue
+
+            res = self.ring.acquire(self.policy)
+            if res is None:  # stopped
+                break
+            slot, buf = res
+
+            # decodes in place if the frame has the same size
+            with tracer.span('capture.read'):
+                (grabbed, frame) = self.capture.read(buf)
+            if grabbed and frame is not buf:
+                buf[...] = frame
+
+            self.ring.commit(slot, grabbed, getTime())
+            if not grabbed:
+                self.stopped = True
+
+
+    def seek(self, frameNr):
+        """Stop the reader, give the frames it read ahead back to the ring, and restart it at frameNr.
+        Frames held by the consumer stay valid"""
+        self.stopped = True
+        if self.ring is not None:
+            self.ring.stop()
+        self.thread.join()
+        if self.ring is not None:
+            self.ring.flush()
+        else:
+            self.ringReady.clear()
+
+        self.seekCapture(frameNr)
+        self.stopped = False
+        self.thread = Thread(target=self.update, args=())
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def read(self):
+        self.ringReady.wait()
+        if self.ring is None:
+            return False, None, 0
+
+        grabbed, frame, seq = self.ring.read()
+        if not grabbed:
+            # end of stream, there is nothing the consumer could hold on to
+            self.ring.release(seq)
+            return False, None, 0
+        return grabbed, frame, self.ring.getCaptureTime(seq)
+
+
+    def releaseFrame(self):
+        if self.ring is not None:
+            self.ring.releaseOldest()
+
+
+    def getDroppedFrames(self):
+        if self.ring is None:
+            return 0
+        return self.ring.droppedFrames
+
+
+    def release(self):
+        self.stopped = True
+        if self.ring is not None:
+            self.ring.stop()
+        self.thread.join()
+        self.capture.release()
+        if self.ring is not None:
+            self.ring.arena.release()
+
+
+class CachedInputStream(InputStream):
+    """Reads the grey frames of a video file from a FrameCache (decoded once, memory mapped)
+    instead of decoding them. Frames are read-only views into the cache, no thread is needed"""
+
+    def __init__(self, path, crop=None, resolution=None):
+        super().__init__(path)
+        self.cache = FrameCache(path, crop=crop, resolution=resolution)
+        self.cropped = bool(crop)
+        self.pos = 0
+
+
+    def initStream(self):
+        self.cache.open()
+
+
+    def read(self):
+        if self.pos >= self.cache.getFrameCount():
+            return False, None, getTime()
+        frame = self.cache.frames[self.pos]
+        self.pos += 1
+        return True, frame, getTime()
+
+
+    def seek(self, frameNr):
+        self.pos = max(0, frameNr)
+
+
+    def getResolution(self):
+        return self.cache.getResolution()
+
+
+    def getFps(self):
+        return self.cache.fps
+
+
+    def release(self):
+        self.cache.release()
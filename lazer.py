@@ -3,9 +3,17 @@ import yaml
 import logging
 import numpy as np
 
-from gfxutils import calculateDistance
-from model import Mode
+from gfxutils import calculateDistance, getTime
+from fps import Timer
+from tracer import tracer
+from model import Mode, HitAlgo
 from detectorthread import DetectorThread
+from evidencewriter import EvidenceWriter
+from framehistory import FrameHistory, TriggeredWindow
+from snippets import SnippetWriter
+from replay import ReplayWriter
+from recorder import Recorder
+from sessionlog import SessionLog
 from projector import Projector
 from gamemode import GameMode
 from plugin_hits import PluginHits
@@ -22,19 +30,55 @@ class Lazer(object):
 
     def __init__(
         self, videoStream, thresh=14,
-        withProjector=False, saveFrames=False, saveHits=False, mode=Mode.main, enableTarget=False, debug=True
+        withProjector=False, saveFrames=False, saveHits=False, mode=Mode.main, enableTarget=False, debug=True,
+        roi=False, hitAlgo=HitAlgo.contour, saveFormat='jpg', saveSnippets=False,
+        sessionLog=None, lane=0, replay=False, record=False, recordSkip=1, recordScale=1.0, recordFormat='avi',
+        detectorWorkers=1, decimate=1, accumulate=False
     ):
         self.saveFrames = saveFrames
         self.saveHits = saveHits
-        self.detectorThread = DetectorThread(videoStream)
+        self.saveFormat = saveFormat  # jpg or png
+        self.evidenceWriter = None  # created on the first save
+
+        # save small crops of the frames around hits (instead of the full frame with saveHits)
+        self.saveSnippets = saveSnippets
+        self.snippetPre = 8  # frames before the hit
+        self.snippetPost = 8  # frames after the hit
+        self.snippetWindow = TriggeredWindow(self.snippetPre, self.snippetPost)
+        self.snippetWriter = None
+
+        # instant replay: save the raw frames around hits as video
+        self.replay = replay
+        self.replayFps = videoStream.getSourceFps()
+        self.replayPre = int(round(self.replayFps * 0.5))  # frames before the hit (0.5s)
+        self.replayPost = self.replayPre
+        self.replayWindow = TriggeredWindow(self.replayPre, self.replayPost)
+        self.replayWriter = None
+
+        # the last raw frames for snippets and replays, created on the first frame in main mode
+        self.frameHistory = None
+
+        # record what is shown in the window (with all overlays) as video
+        self.recorder = None
+        if record:
+            filename = videoStream.getFilenameBase() + '_record_' + str(int(getTime())) + '.' + recordFormat
+            self.recorder = Recorder(filename, fps=videoStream.getSourceFps(), skip=recordSkip, scale=recordScale)
+
+        # append all hits to this file (see sessionlog.py)
+        self.sessionLog = SessionLog(sessionLog, lane) if sessionLog is not None else None
+
+        self.detectorThread = DetectorThread(videoStream, workers=detectorWorkers)
         self.projector = None
         self.withProjector = withProjector
-        self.projector = Projector()
+        if withProjector:
+            self.projector = Projector()
         self.gameMode = GameMode()
 
         self.debug = debug
         self.glareEnabled = True
         self.targetEnabled = enableTarget
+        self.roiEnabled = roi  # only detect hits around the target in main mode
+        self.roiMargin = 50  # in pixel, around the target radius
 
         self.pluginHits = PluginHits()
         self.pluginGlare = PluginGlare()
@@ -43,8 +87,12 @@ class Lazer(object):
 
         # per frame
         self.frame = None
+        self.mask = None
         self.frameNr = 0
         self.mode = None
+        self.captureTime = 0
+
+        self.latency = Timer()  # capture of a frame until it is processed here
 
         self.resetDynamic()
 
@@ -55,6 +103,10 @@ class Lazer(object):
             'thresh': thresh,  # threshold for mask in bit
             'targetThresh': 60,  # going up, looked good with testing
             'crop': None,  # when input image from the webcam should be cropped
+            'roi': None,  # (x1, y1, x2, y2) area of the frame to detect hits in, None for all
+            'hitAlgo': hitAlgo,  # model.HitAlgo, how to detect hits in main mode
+            'decimate': decimate,  # main mode: only detect every n'th frame while there are no hits
+            'accumulate': accumulate,  # with decimate: check the max of every n frames instead of the n'th frame
         }
         self.detectorThread.startThread(self.threadData)
 
@@ -71,10 +123,20 @@ class Lazer(object):
 
     def nextFrame(self):
         """Retrieves next frame from video/cam via VideoStream, process it and draw into self.frame"""
+        if self.frame is not None:
+            # done with the previous frame, it may be reused for decoding
+            self.detectorThread.videoStream.releaseFrame()
+            self.frame = None
+
         isTrue, self.frame, self.frameNr, self.mode, data = self.detectorThread.getFrameData()
         if not isTrue:  # end of file or stream
+            self.flushHistory()
             return False, None
 
+        self.captureTime = data['captureTime']
+        self.mask = data['mask']
+        self.latency.add(getTime() - self.captureTime)
+
         # reset stats if file rewinds
         if self.frameNr == 0:
             self.resetDynamic()
@@ -83,18 +145,24 @@ class Lazer(object):
 
         if self.mode == Mode.intro:
             if self.glareEnabled:
-                self.pluginGlare.handle(self.frame, data['glare'])
+                with tracer.span('PluginGlare.handle', self.frameNr):
+                    self.pluginGlare.handle(self.frame, data['glare'])
             if self.targetEnabled:
-                self.pluginTarget.handle(self.frame, data['targetContours'], data['targetReliefs'])
+                with tracer.span('PluginTarget.handle', self.frameNr):
+                    self.pluginTarget.handle(self.frame, data['targetContours'], data['targetReliefs'])
                 self.threadData["targetThresh"] = self.pluginTarget.targetThresh
             if self.withProjector:
-                self.pluginAruco.handle(self.frame, data['arucoCorners'], data['arucoIds'], data['arucoRejected'])
+                with tracer.span('PluginAruco.handle', self.frameNr):
+                    self.pluginAruco.handle(self.frame, data['arucoCorners'], data['arucoIds'], data['arucoRejected'])
                 if len(self.pluginAruco.arucoCornersAll) == 4 and self.projector.H is None:
                     corners = np.array(list(self.pluginAruco.arucoCornersAll.values()))
                     ids = np.array(list(self.pluginAruco.arucoIdsAll.values()))
                     self.projector.setCamAruco(corners, ids)
         elif self.mode == Mode.main:
-            self.handleMain(self.frame, self.frameNr, data['recordedHits'])
+            if self.saveSnippets or self.replay:
+                self.updateHistory()
+            with tracer.span('PluginHits.handle', self.frameNr):
+                self.handleMain(self.frame, self.frameNr, data['recordedHits'])
 
         # if we wanna record everything
         if self.saveFrames:
@@ -104,8 +172,16 @@ class Lazer(object):
 
 
     def handleMain(self, frame, frameNr, recordedHits):
-        hit = self.pluginHits.handle(frame, frameNr, recordedHits)
-        if hit is not None:
+        if self.threadData['hitAlgo'] == HitAlgo.blobs:
+            hits = self.pluginHits.handleAll(frame, frameNr, recordedHits)
+        else:
+            hit = self.pluginHits.handle(frame, frameNr, recordedHits)
+            hits = [hit] if hit is not None else []
+        if len(hits) == 0:
+            return
+
+        reactionTime = self.gameMode.reset()  # same for all hits of this frame
+        for hit in hits:
             # check if we have a target (to measure distance to)
             if self.pluginTarget.targetRadius is not None:
                 p = int(calculateDistance(self.pluginTarget.targetCenterX, self.pluginTarget.targetCenterY, hit.x, hit.y))
@@ -113,23 +189,30 @@ class Lazer(object):
                 d = int((p / r) * 100)
                 hit.distance = d
 
-            hit.time = self.gameMode.reset()
+            hit.time = reactionTime
+            hit.captureTime = self.captureTime
+            hit.latency = int((getTime() - self.captureTime) * 1000)
             self.hits.append(hit)
+            if self.sessionLog is not None:
+                self.sessionLog.add(hit, frameNr)
 
             if self.saveHits:
                 self.saveCurrentFrame(hit)
+            if self.saveSnippets:
+                self.snippetWindow.trigger(frameNr, hit)
+
+        if self.replay:
+            self.replayWindow.trigger(frameNr, None)  # one for all hits of this frame
 
 
     def displayFrame(self):
         """Displays the current frame in the window, with UI data written on it"""
-        if self.targetEnabled:
-            self.pluginTarget.draw(self.frame)
-        if self.withProjector and self.mode == Mode.intro:
-            self.pluginAruco.draw(self.frame)
-        self.drawUi()
-        self.drawHits()
-        self.drawGameMode()
+        with tracer.span('Lazer.displayFrame', self.frameNr):
+            self._displayFrame()
+
 
+    def _displayFrame(self):
+        self.drawFrame()
         cv2.imshow('Video', self.frame)
         if self.debug:
             #cv2.imshow('Mask', self.detector.mask)
@@ -141,11 +224,27 @@ class Lazer(object):
                 self.projector.showTarget()
 
 
+    def drawFrame(self):
+        """Draw the UI, hits and plugins onto self.frame (without showing it)"""
+        if self.targetEnabled:
+            self.pluginTarget.draw(self.frame)
+        if self.withProjector and self.mode == Mode.intro:
+            self.pluginAruco.draw(self.frame)
+        self.drawUi()
+        self.drawHits()
+        self.drawGameMode()
+
+        if self.recorder is not None:
+            with tracer.span('Recorder.add', self.frameNr):
+                self.recorder.add(self.frame, self.frameNr)
+
+
     def changeMode(self, mode):
         self.threadData['mode'] = mode
         print("new mode: " + str(self.threadData['mode']))
         if mode == Mode.main:
             self.pluginTarget.useCurrentTarget()
+            self.updateRoi()
             self.gameMode.start()
             if self.withProjector:
                 self.projector.setTargetCenter(
@@ -154,6 +253,20 @@ class Lazer(object):
         elif mode == Mode.intro:
             self.gameMode.stop()
             self.resetDynamic()
+            self.updateRoi()
+
+
+    def setTargetCenter(self, x, y, targetRadius):
+        self.pluginTarget.setTargetCenter(x, y, targetRadius)
+        self.updateRoi()
+
+
+    def updateRoi(self):
+        """Restrict hit detection to the target area, if enabled and in main mode"""
+        roi = None
+        if self.roiEnabled and self.threadData['mode'] == Mode.main:
+            roi = self.pluginTarget.getRoi(self.roiMargin)
+        self.threadData['roi'] = roi
 
 
     def drawUi(self):
@@ -177,6 +290,26 @@ class Lazer(object):
         if self.detectorThread.videoStream.fps.get() < 28:
             s = "FPS: " + str(self.detectorThread.videoStream.fps.get())
             cv2.putText(self.frame, s, (o * 1, 90), cv2.FONT_HERSHEY_TRIPLEX, 1.0, color, 2)
+        s = "Latency: {}ms".format(int(self.latency.getMs()))
+        if len(self.hits) > 0:
+            s += " (hit: {}ms)".format(self.hits[-1].latency)
+        cv2.putText(self.frame, s, (o * 0, 60), cv2.FONT_HERSHEY_TRIPLEX, 1.0, color, 2)
+
+        droppedFrames = self.detectorThread.videoStream.getDroppedFrames()
+        if droppedFrames > 0:
+            s = "Dropped: " + str(droppedFrames)
+            cv2.putText(self.frame, s, (o * 2, 90), cv2.FONT_HERSHEY_TRIPLEX, 1.0, color, 2)
+
+        if self.evidenceWriter is not None and (self.evidenceWriter.getDepth() > 0 or self.evidenceWriter.getDropped() > 0):
+            s = "Writer: {} queued {} dropped".format(self.evidenceWriter.getDepth(), self.evidenceWriter.getDropped())
+            cv2.putText(self.frame, s, (o * 2, 120), cv2.FONT_HERSHEY_TRIPLEX, 1.0, color, 2)
+
+        if self.recorder is not None and self.recorder.droppedFrames > 0:
+            s = "Recorder: {} dropped".format(self.recorder.droppedFrames)
+            cv2.putText(self.frame, s, (o * 2, 150), cv2.FONT_HERSHEY_TRIPLEX, 1.0, color, 2)
+
+        if tracer.enabled:
+            cv2.putText(self.frame, "Tracing", (o * 2, 60), cv2.FONT_HERSHEY_TRIPLEX, 1.0, (0, 0, 255), 2)
 
         if self.debug:
             s = 'Frame: ' + str(self.frameNr)
@@ -189,6 +322,31 @@ class Lazer(object):
             s = "Target: {}/{} {}".format(self.pluginTarget.targetCenterX, self.pluginTarget.targetCenterY, self.pluginTarget.targetRadius)
             cv2.putText(self.frame, s, (o * 1, 120), cv2.FONT_HERSHEY_TRIPLEX, 1.0, color, 2)
 
+            detectTimes = self.detectorThread.getDetectTimes()
+            if detectTimes is not None:
+                s = "Detect: {}ms ({}% gated) / {}ms".format(*detectTimes)
+                cv2.putText(self.frame, s, (o * 2, 30), cv2.FONT_HERSHEY_TRIPLEX, 1.0, color, 2)
+
+            if self.detectorThread.workerCount > 1:
+                stats = self.detectorThread.getStats()
+                s = "Workers: {} busy, queued {}/{}".format(
+                    ' '.join(str(int(u * 100)) + '%' for u in stats['utilization']),
+                    stats['inputDepth'], stats['outputDepth'])
+                cv2.putText(self.frame, s, (o * 1, 150), cv2.FONT_HERSHEY_TRIPLEX, 1.0, color, 2)
+
+            decimator = self.detectorThread.decimator
+            if decimator is not None and self.threadData['mode'] == Mode.main:
+                s = "Decimate: 1/{}".format(decimator.every)
+                if decimator.accumulate:
+                    s += " max"
+                if decimator.isBurst():
+                    s += " (burst)"
+                cv2.putText(self.frame, s, (o * 1, 180), cv2.FONT_HERSHEY_TRIPLEX, 1.0, color, 2)
+
+            roi = self.threadData['roi']
+            if roi is not None:
+                cv2.rectangle(self.frame, (roi[0], roi[1]), (roi[2], roi[3]), (100, 100, 100), 1)
+
         # hints
         color = (0, 0, 255)
         if self.threadData['mode'] == Mode.intro:
@@ -215,10 +373,11 @@ class Lazer(object):
 
     def drawHits(self):
         for idx, hit in enumerate(self.hits):
+            info = " (r:" + str(hit.radius) + " t: " + str(hit.time) + " l: " + str(hit.latency) + "ms)"
             if hit.distance > 0:
-                s = str(idx) + " distance: " + str(hit.distance) + " (r:" + str(hit.radius) + " t: " + str(hit.time) + ")"
+                s = str(idx) + " distance: " + str(hit.distance) + info
             else:
-                s = str(idx) + " (r:" + str(hit.radius) + " t: " + str(hit.time) + ")"
+                s = str(idx) + info
 
             if idx == 0:
                 color = (0, 200, 0)
@@ -243,26 +402,95 @@ class Lazer(object):
         cv2.putText(self.frame, "Shoot!", (500, 440), cv2.FONT_HERSHEY_TRIPLEX, 1.0, color, 2)
 
 
-    def saveCurrentFrame(self, recordedHit=None):
-        """Save current frame as file"""
-        filenameBase = self.videoStream.getFilenameBase()
-        filenameBase += '_' + str(self.frameNr) + '_'
+    def getEvidenceWriter(self):
+        if self.evidenceWriter is None:
+            self.evidenceWriter = EvidenceWriter()
+        return self.evidenceWriter
+
+
+    def updateHistory(self):
+        """Save the snippets and replays of hits whose frames are complete, and remember the current frame"""
+        if self.frameHistory is None:
+            self.initHistory()
+
+        for (frameNr, hit) in self.snippetWindow.update(self.frameNr):
+            self.saveSnippet(frameNr, hit)
+        for (frameNr, data) in self.replayWindow.update(self.frameNr):
+            self.saveReplay(frameNr)
+        with tracer.span('FrameHistory.push', self.frameNr):
+            self.frameHistory.push(self.frame, self.frameNr)
+
+
+    def initHistory(self):
+        capacity = 1
+        filenameBase = self.detectorThread.videoStream.getFilenameBase()
+        if self.saveSnippets:
+            capacity = max(capacity, self.snippetPre + self.snippetPost + 1)
+            filename = filenameBase + '_snippets_' + str(int(getTime())) + '.tar'
+            self.snippetWriter = SnippetWriter(filename, self.getEvidenceWriter())
+        if self.replay:
+            capacity = max(capacity, self.replayPre + self.replayPost + 1)
+            self.replayWriter = ReplayWriter(filenameBase, self.getEvidenceWriter(), fps=self.replayFps)
+        self.frameHistory = FrameHistory(capacity)
+
+
+    def flushHistory(self):
+        """Save the snippets and replays of hits still waiting for frames after them"""
+        for (frameNr, hit) in self.snippetWindow.flush():
+            self.saveSnippet(frameNr, hit)
+        for (frameNr, data) in self.replayWindow.flush():
+            self.saveReplay(frameNr)
 
-        logger.info("Saving current frame:")
+
+    def saveSnippet(self, frameNr, hit):
+        (first, last) = self.snippetWindow.getRange(frameNr)
+        self.snippetWriter.add(frameNr, hit, self.frameHistory.getRange(first, last))
+
+
+    def saveReplay(self, frameNr):
+        (first, last) = self.replayWindow.getRange(frameNr)
+        self.replayWriter.add(frameNr, self.frameHistory.lend(first, last))
+
+
+    def getReplay(self):
+        """(hit frameNr, [(frameNr, frame)]) of the last instant replay, or None"""
+        if self.replayWriter is None:
+            return None
+        return self.replayWriter.getLast()
+
+
+    def saveCurrentFrame(self, recordedHit=None, epilog=''):
+        """Save current frame as file. Done in the background by the EvidenceWriter"""
+        writer = self.getEvidenceWriter()
+
+        videoFilenameBase = self.detectorThread.videoStream.getFilenameBase()
+        filenameBase = videoFilenameBase + '_' + str(self.frameNr) + epilog + '_'
+
+        # every frame (saveFrames) may be dropped if the disk is too slow, hits and manual saves not
+        force = recordedHit is not None or epilog != ''
+        record = {
+            'frameNr': self.frameNr,
+            'captureTime': self.captureTime,
+        }
         if recordedHit is not None:
             filenameBase += 'hit.'
             fname = filenameBase + "info.yaml"
-            logger.info("  Save yaml to : " + fname)
-            with open(fname, 'w') as outfile:
-                yaml.dump(recordedHit.toDict(), outfile)
+            logger.debug("  Save yaml to : " + fname)
+            writer.writeYaml(fname, recordedHit.toDict())
+            record['hit'] = recordedHit.toDict()
 
-        fname = filenameBase + 'frame.jpg'
-        logger.info("  Save Frame to: " + fname)
-        cv2.imwrite(fname, self.frame)
+        fname = filenameBase + 'frame.' + self.saveFormat
+        logger.debug("  Save Frame to: " + fname)
+        if writer.writeImage(fname, self.frame.copy(), force=force):  # frame gets drawn on, or reused
+            record['frame'] = fname
 
-        fname = filenameBase + 'mask.jpg'
-        logger.info("  Save Mask to : " + fname)
-        cv2.imwrite(fname, self.mask)
+        if self.mask is not None:  # not with HitAlgo.pyramid
+            fname = filenameBase + 'mask.' + self.saveFormat
+            logger.debug("  Save Mask to : " + fname)
+            if writer.writeImage(fname, self.mask, force=force):  # new for every frame, no copy needed
+                record['mask'] = fname
+
+        writer.writeRecord(videoFilenameBase + '_evidence.jsonl', record)
 
 
     def setFrameRel(self, frameOffset):
@@ -290,5 +518,27 @@ class Lazer(object):
         return self.threadData['mode']
 
 
+    def toggleTrace(self):
+        """Start recording a trace, or stop and save it next to the video"""
+        if not tracer.enabled:
+            tracer.enable()
+        else:
+            tracer.disable()
+            filename = self.detectorThread.videoStream.getFilenameBase()
+            tracer.save(filename + '_trace_' + str(int(getTime())) + '.json')
+
+
     def release(self):
+        if tracer.enabled:
+            self.toggleTrace()
         self.detectorThread.shutdownThread()
+        if self.frameHistory is not None:
+            self.flushHistory()
+        if self.evidenceWriter is not None:
+            self.evidenceWriter.close()
+        if self.snippetWriter is not None:
+            self.snippetWriter.close()  # after all snippets are written
+        if self.sessionLog is not None:
+            self.sessionLog.close()
+        if self.recorder is not None:
+            self.recorder.close()
@@ -1,4 +1,5 @@
 from enum import Enum
+import numpy as np
 
 class RecordedHit(object):
     def __init__(self):
@@ -10,6 +11,9 @@ class RecordedHit(object):
         self.distance = 0
         self.time = 0
 
+        self.captureTime = 0  # when the frame was captured, in s (wall clock)
+        self.latency = 0  # from capture until detection, in ms
+
     def toDict(self):
         me = {
             'center': self.center,
@@ -33,6 +37,48 @@ class Mode(Enum):
     main = 2
 
 
+class HitAlgo(Enum):
+    contour = 1  # largest contour of the thresholded frame
+    diff = 2  # only spots which newly appeared compared to a running background
+    blobs = 3  # all blobs with one labeling pass (multiple hits per frame). Labels the bounding box of all bright pixels: slower with glare far from the hit
+    pyramid = 4  # candidates on a downscaled frame, refined in full resolution
+    tiled = 5  # like contour, with the frame split into bands processed in parallel
+
+
+class DropPolicy(Enum):
+    block = 1  # wait for the consumer (file playback)
+    dropOldest = 2  # throw away the oldest frame in the queue (live camera)
+    dropNewest = 3  # throw away the new frame
+
+
+# One row per blob, as returned by Detector.findBlobs()
+BlobDtype = np.dtype([
+    ('x', np.int32),  # centroid
+    ('y', np.int32),
+    ('radius', np.int32),
+    ('area', np.int32),  # in pixel
+    ('left', np.int32),  # bounding box
+    ('top', np.int32),
+    ('width', np.int32),
+    ('height', np.int32),
+    ('peak', np.uint8),  # brightest grey value
+])
+
+
+# One record per hit in a session log (see sessionlog.py). Fixed width and little endian,
+# append only: do not change existing fields, add new ones with a new SessionLog version
+HitRecordDtype = np.dtype([
+    ('frameNr', '<i8'),
+    ('captureTime', '<f8'),  # in s (wall clock), 0 if unknown
+    ('x', '<i4'),
+    ('y', '<i4'),
+    ('radius', '<i4'),
+    ('distance', '<i4'),  # to the target center, in % of the target radius
+    ('time', '<i4'),  # reaction time, in frames
+    ('lane', '<i4'),  # shooting lane / camera
+])
+
+
 class OpencvRect():
     def __init__(self, x, y, w, h):
         self.x = x
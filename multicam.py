@@ -0,0 +1,217 @@
+import cv2
+import math
+import logging
+import numpy as np
+from threading import Thread, Lock
+
+from lazer import Lazer
+from model import Mode
+from fps import CpuUsage
+from sessionlog import SessionLog
+
+logger = logging.getLogger(__name__)
+
+
+class CamHit(object):
+    """A hit of one camera in the fused hit stream"""
+
+    def __init__(self, camId, frameNr, hit):
+        self.camId = camId
+        self.frameNr = frameNr
+        self.hit = hit  # RecordedHit
+        self.captureTime = hit.captureTime
+
+
+class HitStream(object):
+    """Hits of all cameras, in order of their capture time. Thread safe.
+
+    The cameras detect at their own pace. A hit is only handed out once all cameras in camIds
+    processed their frames up to its capture time (their watermark), so a camera which is
+    behind can't deliver an earlier hit after it anymore"""
+
+    def __init__(self, camIds=()):
+        self.hits = []  # CamHit, not taken yet
+        self.watermarks = {camId: 0 for camId in camIds}  # capture time of the last processed frame, of running cameras
+        self.lock = Lock()
+
+
+    def put(self, camHit):
+        with self.lock:
+            self.hits.append(camHit)
+
+
+    def advance(self, camId, captureTime):
+        """Camera camId processed its frames up to captureTime, after put() of their hits"""
+        with self.lock:
+            if camId in self.watermarks:
+                self.watermarks[camId] = max(self.watermarks[camId], captureTime)
+
+
+    def finish(self, camId):
+        """Camera camId does not deliver hits anymore, don't wait for it"""
+        with self.lock:
+            self.watermarks.pop(camId, None)
+
+
+    def getHits(self, flush=False):
+        """New hits no other camera can be before anymore (with flush: all), oldest capture first"""
+        with self.lock:
+            if flush or len(self.watermarks) == 0:
+                hits = self.hits
+                self.hits = []
+            else:
+                watermark = min(self.watermarks.values())
+                hits = [camHit for camHit in self.hits if camHit.captureTime <= watermark]
+                self.hits = [camHit for camHit in self.hits if camHit.captureTime > watermark]
+        hits.sort(key=lambda camHit: camHit.captureTime)
+        return hits
+
+
+class Mosaic(object):
+    """The frames of all cameras in a grid of tiles, to show them in one window"""
+
+    def __init__(self, count, tileWidth=640, tileHeight=360):
+        self.tileWidth = tileWidth
+        self.tileHeight = tileHeight
+        self.cols = math.ceil(math.sqrt(count))
+        self.rows = math.ceil(count / self.cols)
+        self.image = np.zeros((self.rows * tileHeight, self.cols * tileWidth, 3), np.uint8)
+
+
+    def getTile(self, index):
+        """The part of self.image of tile index"""
+        x = (index % self.cols) * self.tileWidth
+        y = (index // self.cols) * self.tileHeight
+        return self.image[y:y + self.tileHeight, x:x + self.tileWidth]
+
+
+    def put(self, index, frame):
+        """Downscale frame into its tile. Tiles can be written by different threads"""
+        tile = self.getTile(index)
+        small = cv2.resize(frame, (self.tileWidth, self.tileHeight), interpolation=cv2.INTER_AREA)
+        if small.ndim == 2:
+            small = cv2.cvtColor(small, cv2.COLOR_GRAY2BGR)
+        tile[...] = small
+
+
+class CamLane(object):
+    """One camera: its Lazer (with its own reader and detector thread), and the thread running it"""
+
+    def __init__(self, index, camId, lazer):
+        self.index = index  # in the mosaic
+        self.camId = camId
+        self.lazer = lazer
+        self.thread = None
+        self.newMode = None  # set by the UI, applied by the lane thread
+
+
+class MultiCam(object):
+    """Detects hits on several cameras in one process, and shows them in one window.
+    The hits of all cameras go into one HitStream, tagged with their camera"""
+
+    def __init__(self, videoStreams, camIds, sessionLog=None, **lazerArgs):
+        """videoStreams: initialized CamVideoStream per camera in camIds.
+        lazerArgs: options for the Lazer of every camera"""
+        self.lanes = []
+        for (index, (videoStream, camId)) in enumerate(zip(videoStreams, camIds)):
+            lazer = Lazer(videoStream, mode=Mode.intro, **lazerArgs)
+            self.lanes.append(CamLane(index, camId, lazer))
+
+        self.hitStream = HitStream(camIds)
+        self.mosaic = Mosaic(len(self.lanes))
+        self.cpuUsage = CpuUsage()
+        self.sessionLog = SessionLog(sessionLog) if sessionLog is not None else None  # lane: camera id
+        self.stopped = False
+
+
+    def init(self):
+        cv2.namedWindow('Cams')
+        for lane in self.lanes:
+            lane.thread = Thread(target=self.update, args=(lane, ), name='Cam-' + str(lane.camId))
+            lane.thread.daemon = True
+            lane.thread.start()
+
+
+    def update(self, lane):
+        """Thread: detect in the frames of one camera, and give its hits and frames to the UI"""
+        lazer = lane.lazer
+        while not self.stopped:
+            if lane.newMode is not None:
+                lazer.changeMode(lane.newMode)
+                lane.newMode = None
+
+            hitCount = len(lazer.hits)
+            isTrue, data = lazer.nextFrame()
+            if not isTrue:
+                logger.warning("Cam {}: no frames anymore".format(lane.camId))
+                break
+            for hit in lazer.hits[hitCount:]:
+                self.hitStream.put(CamHit(lane.camId, lazer.frameNr, hit))
+            self.hitStream.advance(lane.camId, lazer.captureTime)
+
+            lazer.drawFrame()
+            s = "Cam {}: {} fps".format(lane.camId, lazer.detectorThread.videoStream.fps.get())
+            cv2.putText(lazer.frame, s, (10, lazer.frame.shape[0] - 20), cv2.FONT_HERSHEY_TRIPLEX, 1.5, (0, 255, 0), 2)
+            self.mosaic.put(lane.index, lazer.frame)
+        self.hitStream.finish(lane.camId)
+
+
+    def play(self):
+        """Show all cameras and handle the fused hits, until q is pressed"""
+        while True:
+            for camHit in self.hitStream.getHits():
+                self.handleHit(camHit)
+
+            image = self.mosaic.image.copy()
+            s = "CPU: {}%".format(self.cpuUsage.get())
+            cv2.putText(image, s, (10, 30), cv2.FONT_HERSHEY_TRIPLEX, 1.0, (0, 255, 0), 2)
+            cv2.imshow('Cams', image)
+
+            key = cv2.waitKey(10)
+            if key == ord(' '):  # mode of all cameras
+                for lane in self.lanes:
+                    if lane.lazer.getMode() == Mode.intro:
+                        lane.newMode = Mode.main
+                    else:
+                        lane.newMode = Mode.intro
+            if key == ord('q'):
+                break
+
+        self.release()
+        cv2.destroyAllWindows()
+
+
+    def handleHit(self, camHit):
+        hit = camHit.hit
+        logger.info("Hit: cam {} frame {} at {}/{} (r:{} t:{})".format(
+            camHit.camId, camHit.frameNr, hit.x, hit.y, hit.radius, hit.time))
+        if self.sessionLog is not None:
+            self.sessionLog.add(hit, camHit.frameNr, lane=camHit.camId)
+
+
+    def getStats(self):
+        """CPU usage of the process, and fps and detector stats per camera"""
+        return {
+            'cpu': self.cpuUsage.get(),
+            'cams': {
+                lane.camId: {
+                    'fps': lane.lazer.detectorThread.videoStream.fps.get(),
+                    'dropped': lane.lazer.detectorThread.videoStream.getDroppedFrames(),
+                    'hits': len(lane.lazer.hits),
+                    'detector': lane.lazer.detectorThread.getStats(),
+                } for lane in self.lanes
+            },
+        }
+
+
+    def release(self):
+        self.stopped = True
+        for lane in self.lanes:
+            lane.thread.join(2)  # done with the next frame
+        logger.info("Multi cam: {}".format(self.getStats()))
+        for lane in self.lanes:
+            lane.lazer.release()
+        for camHit in self.hitStream.getHits(flush=True):
+            self.handleHit(camHit)
+        if self.sessionLog is not None:
+            self.sessionLog.close()
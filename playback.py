@@ -4,7 +4,7 @@ import logging
 
 from lazer import Lazer
 from cursesui import CursesUi
-from model import Mode
+from model import Mode, HitAlgo
 from gfxutils import calculateDistance
 
 
@@ -14,14 +14,17 @@ logger = logging.getLogger(__name__)
 class Playback(object):
     """Opens a window to play back a video/cam via VideoStream and uses Lazer for detection and visualization"""
 
-    def __init__(self, videoStream, withProjector, thresh=14, saveFrames=False, saveHits=False, cursesEnabled=False, enableTarget=False):
+    def __init__(self, videoStream, withProjector, thresh=14, saveFrames=False, saveHits=False, cursesEnabled=False, enableTarget=False, roi=False, hitAlgo=HitAlgo.contour, saveFormat='jpg', saveSnippets=False, sessionLog=None, lane=0, replay=False, record=False, recordSkip=1, recordScale=1.0, recordFormat='avi', detectorWorkers=1, decimate=1):
         """Call init() before use"""
         self.videoStream = videoStream
         self.cursesEnabled = cursesEnabled
         self.lazer = Lazer(
             videoStream,
             withProjector=withProjector, thresh=thresh,
-            saveFrames=saveFrames, saveHits=saveHits, mode=Mode.intro, enableTarget=enableTarget)
+            saveFrames=saveFrames, saveHits=saveHits, mode=Mode.intro, enableTarget=enableTarget, roi=roi, hitAlgo=hitAlgo,
+            saveFormat=saveFormat, saveSnippets=saveSnippets, sessionLog=sessionLog, lane=lane, replay=replay,
+            record=record, recordSkip=recordSkip, recordScale=recordScale, recordFormat=recordFormat,
+            detectorWorkers=detectorWorkers, decimate=decimate)
 
         self.cursesUi = None
         self.isPaused = False
@@ -133,8 +136,14 @@ class Playback(object):
 
         # Note: when we press a key in paused mode, we actually go to the next
         # frame. We have to manually go one back every time with setFrame(lazer.FrameNr)
+        if key == ord('r'):  # start/stop trace
+            self.lazer.toggleTrace()
+
         if key == ord('s'):  # save frame
             self.lazer.saveCurrentFrame(epilog=".live")
+
+        if key == ord('i'):  # instant replay of the last hit
+            self.showReplay()
         #if key == ord('j'):  # decrease threshhold
         #    self.lazer.addThresh(-1)
         #if key == ord('k'):  # increase threshhold
@@ -142,6 +151,23 @@ class Playback(object):
 
         return ret
 
+    def showReplay(self):
+        """Play the frames around the last hit in a window, slowed down. Any key stops it"""
+        replay = self.lazer.getReplay()
+        if replay is None:
+            logger.info("No replay yet (needs --replay and a hit)")
+            return
+        (hitFrameNr, frames) = replay
+        for (frameNr, frame) in frames:
+            frame = frame.copy()
+            color = (0, 0, 255) if frameNr == hitFrameNr else (255, 255, 255)
+            cv2.putText(frame, "Replay: {} ({:+d})".format(frameNr, frameNr - hitFrameNr), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+            cv2.imshow('Replay', frame)
+            if cv2.waitKey(100) != -1:
+                break
+        cv2.destroyWindow('Replay')
+
+
     def handleCurses(self):
         if not self.cursesEnabled:
             return
@@ -1,6 +1,8 @@
 import logging
 import cv2
 
+from gfxutils import calculateDistance
+
 logger = logging.getLogger(__name__)
 
 
@@ -8,10 +10,13 @@ class PluginHits(object):
     def __init__(self):
         self.hitLastFoundFrameNr = 0  # Track when last hit was found
         self.hitGraceTime = 30  # How many frames between detections (~1s)
+        self.hitGraceDistance = 50  # handleAll(): hits further away than this are from another shooter
+        self.recentHits = []  # handleAll(): (frameNr, hit) still in grace time
 
     def init(self):
         self.hitLastFoundFrameNr = 0  # Track when last hit was found
         self.hitGraceTime = 30  # How many frames between detections (~1s)
+        self.recentHits = []
 
 
     def handle(self, frame, frameNr, recordedHits, staticImage=False):
@@ -38,6 +43,29 @@ class PluginHits(object):
         return hit
 
 
+    def handleAll(self, frame, frameNr, recordedHits):
+        """Like handle(), but returns all new hits in the frame (e.g. two shooters on one target).
+        The grace time is applied per location instead of per frame."""
+        self.recentHits = [(nr, hit) for (nr, hit) in self.recentHits if (frameNr - nr) < self.hitGraceTime]
+
+        hits = []
+        for hit in recordedHits:
+            isRecent = False
+            for (nr, recentHit) in self.recentHits:
+                if calculateDistance(hit.x, hit.y, recentHit.x, recentHit.y) < self.hitGraceDistance:
+                    isRecent = True
+                    break
+            if isRecent:
+                continue
+
+            logger.info("Found hit at frame #" + str(frameNr) + " with radius " + str(hit.radius))
+            self.recentHits.append((frameNr, hit))
+            self.hitLastFoundFrameNr = frameNr
+            hits.append(hit)
+
+        return hits
+
+
     def draw(self, frame, recordedHit):
         cv2.circle(frame, (int(recordedHit.x), int(recordedHit.y)), int(recordedHit.radius), (0, 100, 50), 2)
         cv2.circle(frame, recordedHit.center, 5, (0, 250, 50), -1)
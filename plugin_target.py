@@ -63,6 +63,15 @@ class PluginTarget(object):
         self.targetRadius = int(self.relief.w / 2)
 
 
+    def getRoi(self, margin):
+        """Bounding box (x1, y1, x2, y2) of the target plus margin, or None if no target is set"""
+        if self.targetCenterX is None:
+            return None
+
+        r = self.targetRadius + margin
+        return (self.targetCenterX - r, self.targetCenterY - r, self.targetCenterX + r, self.targetCenterY + r)
+
+
     def draw(self, frame):
         if self.targetCenterX is not None:
             cv2.circle(frame, (self.targetCenterX, self.targetCenterY), self.targetRadius, (0, 200, 0), 2)
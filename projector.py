@@ -10,7 +10,7 @@ logger = logging.getLogger(__name__)
 
 
 class Projector():
-    def __init__(self, height=1080, width=1920):
+    def __init__(self, height=1080, width=1920, withWindow=True):
         self.recordedHit = None
         self.width = width
         self.height = height
@@ -59,10 +59,11 @@ class Projector():
         self.picAruco = self._getPicAruco()
         self.picTargetBase = self._getPicTarget()
 
-        cv2.namedWindow("Projector")
-        cv2.createTrackbar('lineWidth', 'Projector', 30, 60, self.trackbarCallbackLineWidth)
-        cv2.createTrackbar('lineHalfWidth', 'Projector', 30, 60, self.trackbarCallbackLineHalfWidth)
-        cv2.createTrackbar('lineFsck', 'Projector', 50, 60, self.trackbarCallbackLineFsck)
+        if withWindow:
+            cv2.namedWindow("Projector")
+            cv2.createTrackbar('lineWidth', 'Projector', 30, 60, self.trackbarCallbackLineWidth)
+            cv2.createTrackbar('lineHalfWidth', 'Projector', 30, 60, self.trackbarCallbackLineHalfWidth)
+            cv2.createTrackbar('lineFsck', 'Projector', 50, 60, self.trackbarCallbackLineFsck)
 
     def trackbarCallbackLineWidth(self, preset):
         self.lineWidth = preset
@@ -0,0 +1,126 @@
+import cv2
+import logging
+import multiprocessing
+from queue import Empty
+
+from fps import Fps
+from framering import FrameArena
+
+logger = logging.getLogger(__name__)
+
+
+class Recorder(object):
+    """Records the annotated frames into a video file, encoded by a separate process.
+
+    Frames are copied (and downscaled) into a few slots of shared memory, the encoder
+    process gets only the slot numbers. Only every skip'th frame is recorded, and if
+    the encoder can't keep up, frames are dropped instead of waiting for it"""
+
+    def __init__(self, filename, fps=30, skip=1, scale=1.0, slots=4):
+        self.filename = filename
+        self.fps = fps  # of the source
+        self.skip = max(1, skip)  # record every skip'th frame
+        self.scale = scale  # of the recorded frames
+        self.slots = slots
+
+        self.arena = None  # created with the first frame, its size is the size of the video
+        self.free = []  # slots we can write into
+        self.todo = None  # slots to encode, to the encoder
+        self.done = None  # encoded slots, from the encoder
+        self.process = None
+
+        self.recorded = 0
+        self.skipped = 0
+        self.droppedFrames = 0
+        self.droppedFramesPS = Fps()
+
+
+    def start(self, frame):
+        (height, width) = frame.shape[:2]
+        size = (int(width * self.scale) // 2 * 2, int(height * self.scale) // 2 * 2)  # even, for most codecs
+        shape = (size[1], size[0]) + frame.shape[2:]
+        self.arena = FrameArena(self.slots, shape, frame.dtype, shared=True)
+        self.free = list(range(self.slots))
+        self.todo = multiprocessing.Queue()
+        self.done = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=encode,
+            args=(self.arena.getName(), self.slots, shape, frame.dtype.str, self.filename, self.fps / self.skip, self.todo, self.done),
+            name='Recorder')
+        self.process.daemon = True
+        self.process.start()
+        logger.info("Recording {}x{} to {}".format(size[0], size[1], self.filename))
+
+
+    def add(self, frame, frameNr):
+        """Record frame, if it is not skipped. Never waits for the encoder"""
+        if frameNr % self.skip != 0:
+            self.skipped += 1
+            return
+        if self.arena is None:
+            self.start(frame)
+
+        self.collectDone()
+        if len(self.free) == 0:  # encoder is behind
+            self.droppedFrames += 1
+            self.droppedFramesPS.tack()
+            return
+        slot = self.free.pop()
+
+        dst = self.arena.frames[slot]
+        if frame.shape == dst.shape:
+            dst[...] = frame
+        else:  # downscaled, or the crop changed
+            cv2.resize(frame, (dst.shape[1], dst.shape[0]), dst=dst, interpolation=cv2.INTER_AREA)
+        self.todo.put(slot)
+        self.recorded += 1
+
+
+    def collectDone(self):
+        """Slots the encoder is finished with can be written again"""
+        while True:
+            try:
+                self.free.append(self.done.get_nowait())
+            except Empty:
+                break
+
+
+    def getStats(self):
+        return {
+            'recorded': self.recorded,
+            'skipped': self.skipped,
+            'dropped': self.droppedFrames,
+        }
+
+
+    def close(self):
+        """Encode the frames still queued, and close the video file"""
+        if self.process is None:
+            return
+        self.todo.put(None)
+        self.process.join()
+        self.process = None
+        self.arena.release()
+        self.arena = None
+        logger.info("Recorder: {} to {}".format(self.getStats(), self.filename))
+
+
+def encode(arenaName, slots, shape, dtype, filename, fps, todo, done):
+    """Encoder process: write the frames of the slots from todo into filename,
+    until it gets None"""
+    arena = FrameArena.attach(arenaName, slots, shape, dtype)
+    fourcc = 'mp4v' if filename.endswith('.mp4') else 'MJPG'
+    writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*fourcc), fps, (shape[1], shape[0]), len(shape) == 3)
+    if not writer.isOpened():
+        logger.error("Could not open video writer: " + filename)
+
+    while True:
+        slot = todo.get()
+        if slot is None:
+            break
+        if writer.isOpened():
+            writer.write(arena.frames[slot])
+        done.put(slot)
+
+    writer.release()
+    arena.release()
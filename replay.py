@@ -0,0 +1,46 @@
+import cv2
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayWriter(object):
+    """Instant replay: saves the raw frames around a hit as <video>_<frameNr>_replay.avi
+    (in the background, by the EvidenceWriter), and keeps the last one for showing it"""
+
+    def __init__(self, filenameBase, evidenceWriter, fps=30):
+        self.filenameBase = filenameBase
+        self.evidenceWriter = evidenceWriter
+        self.fps = fps
+        self.last = None  # (hit frameNr, [(frameNr, frame)])
+        self.saved = 0
+
+
+    def add(self, hitFrameNr, frames):
+        """Save frames around the hit at hitFrameNr: (frameNr, frame) which don't change anymore,
+        from FrameHistory.lend(). They are not copied, encoding them is done by the EvidenceWriter"""
+        if len(frames) == 0:
+            return
+        self.last = (hitFrameNr, frames)
+
+        filename = self.filenameBase + '_' + str(hitFrameNr) + '_replay.avi'
+        self.evidenceWriter.run(filename, lambda: self.write(filename, frames))
+        self.saved += 1
+
+
+    def write(self, filename, frames):
+        """Worker: encode frames into filename"""
+        (height, width) = frames[0][1].shape[:2]
+        isColor = frames[0][1].ndim == 3
+        writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'MJPG'), self.fps, (width, height), isColor)
+        if not writer.isOpened():
+            logger.error("Could not open video writer: " + filename)
+            return
+        for (frameNr, frame) in frames:
+            writer.write(frame)
+        writer.release()
+
+
+    def getLast(self):
+        """(hit frameNr, [(frameNr, frame)]) of the last replay, or None"""
+        return self.last
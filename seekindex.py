@@ -0,0 +1,79 @@
+import cv2
+import os
+import json
+import bisect
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SeekIndex(object):
+    """Frame numbers of the keyframes of a video file. Built once by scanning the file,
+    and saved next to it as <video>.seek.json.
+
+    Seeking to a keyframe is exact and fast, the frames up to the wanted one
+    are then decoded forward (see InputStream.seek())"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.indexFilename = filename + '.seek.json'
+        self.keyframes = None  # sorted frame numbers, None if the backend can't tell
+        self.frameCount = 0
+
+
+    def load(self):
+        """Read the index from its file, or build and save it if missing or outdated"""
+        stat = os.stat(self.filename)
+        if os.path.isfile(self.indexFilename):
+            try:
+                with open(self.indexFilename) as f:
+                    data = json.load(f)
+                if data['size'] == stat.st_size and data['mtime'] == stat.st_mtime:
+                    self.keyframes = data['keyframes']
+                    self.frameCount = data['frameCount']
+                    return
+            except (ValueError, KeyError) as e:
+                logger.warning("Broken seek index {}: {}".format(self.indexFilename, e))
+
+        self.build()
+        data = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'frameCount': self.frameCount,
+            'keyframes': self.keyframes,
+        }
+        try:
+            with open(self.indexFilename, 'w') as f:
+                json.dump(data, f)
+        except OSError as e:  # e.g. read only directory, just build it again next time
+            logger.warning("Could not save seek index: {}".format(e))
+
+
+    def build(self):
+        logger.info("Building seek index of " + self.filename)
+        capture = cv2.VideoCapture(self.filename)
+        keyframes = []
+        frameNr = 0
+        while capture.grab():  # no need to convert the frames
+            if capture.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                keyframes.append(frameNr)
+            frameNr += 1
+        capture.release()
+
+        self.frameCount = frameNr
+        if len(keyframes) == 0:  # not supported by the backend
+            logger.warning("No keyframes found in " + self.filename)
+            self.keyframes = None
+        else:
+            self.keyframes = keyframes
+        logger.info("Seek index: {} frames, {} keyframes".format(frameNr, len(keyframes)))
+
+
+    def getKeyframe(self, frameNr):
+        """Last keyframe at or before frameNr, None if unknown"""
+        if self.keyframes is None:
+            return None
+        i = bisect.bisect_right(self.keyframes, frameNr) - 1
+        if i < 0:
+            return 0
+        return self.keyframes[i]
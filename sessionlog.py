@@ -0,0 +1,188 @@
+import os
+import re
+import sys
+import glob
+import yaml
+import argparse
+import logging
+import numpy as np
+
+from model import HitRecordDtype
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'XTHITLOG'
+UNKNOWN = -1  # distance and captureTime of hits converted from files which don't have them
+VERSION = 1
+HeaderDtype = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('recordSize', '<u4'),
+])
+
+
+class SessionLog(object):
+    """Append only log of the hits of sessions, as fixed width records (HitRecordDtype)
+    after a small header. Read it back with readSessionLog()"""
+
+    def __init__(self, filename, lane=0):
+        self.filename = filename
+        self.lane = lane  # of all hits added with add()
+        self.file = None  # opened with the first hit
+
+
+    def open(self):
+        if os.path.isfile(self.filename) and os.path.getsize(self.filename) > 0:
+            readHeader(self.filename)  # don't append to something else
+            self.file = open(self.filename, 'r+b')
+            # cut off a partly written last record (crash), or all following records are shifted
+            size = os.path.getsize(self.filename) - HeaderDtype.itemsize
+            end = HeaderDtype.itemsize + size // HitRecordDtype.itemsize * HitRecordDtype.itemsize
+            if end != size + HeaderDtype.itemsize:
+                logger.warning("Removing a partly written hit at the end of " + self.filename)
+                self.file.truncate(end)
+            self.file.seek(end)
+        else:
+            self.file = open(self.filename, 'wb')
+            self.file.write(makeHeader().tobytes())
+
+
+    def add(self, hit, frameNr, lane=None):
+        """Append the RecordedHit hit, of lane (default: the lane of this log)"""
+        record = np.zeros(1, HitRecordDtype)
+        record['frameNr'] = frameNr
+        record['captureTime'] = hit.captureTime
+        record['x'] = hit.x
+        record['y'] = hit.y
+        record['radius'] = hit.radius
+        record['distance'] = hit.distance
+        record['time'] = hit.time
+        record['lane'] = self.lane if lane is None else lane
+        self.append(record)
+
+
+    def append(self, records):
+        """Append an array of HitRecordDtype"""
+        if self.file is None:
+            self.open()
+        self.file.write(records.astype(HitRecordDtype, copy=False).tobytes())
+        self.file.flush()  # a few bytes per hit, don't lose them if we crash
+
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def makeHeader():
+    header = np.zeros(1, HeaderDtype)
+    header['magic'] = MAGIC
+    header['version'] = VERSION
+    header['recordSize'] = HitRecordDtype.itemsize
+    return header
+
+
+def readHeader(filename):
+    """Check the header of the session log filename, raises ValueError"""
+    with open(filename, 'rb') as f:
+        data = f.read(HeaderDtype.itemsize)
+    if len(data) < HeaderDtype.itemsize:
+        raise ValueError("Not a session log: " + filename)
+    header = np.frombuffer(data, HeaderDtype)[0]
+    if header['magic'] != MAGIC:
+        raise ValueError("Not a session log: " + filename)
+    if header['version'] != VERSION or header['recordSize'] != HitRecordDtype.itemsize:
+        raise ValueError("Unsupported session log version {} (record size {}): {}".format(
+            header['version'], header['recordSize'], filename))
+    return header
+
+
+def readSessionLog(filename):
+    """All hits of the session log filename as a read only, memory mapped array of HitRecordDtype"""
+    readHeader(filename)
+    size = os.path.getsize(filename) - HeaderDtype.itemsize
+    count = size // HitRecordDtype.itemsize  # ignore a partly written last record
+    if count == 0:  # can't map zero bytes
+        return np.zeros(0, HitRecordDtype)
+    return np.memmap(filename, HitRecordDtype, mode='r', offset=HeaderDtype.itemsize, shape=(count,))
+
+
+def readSessionLogs(filenames):
+    """Hits of all session logs in one array (copied)"""
+    logs = [readSessionLog(filename) for filename in filenames]
+    if len(logs) == 0:
+        return np.zeros(0, HitRecordDtype)
+    return np.concatenate(logs)
+
+
+def convertInfoYaml(yamlFiles, lane=0):
+    """Hits of *_info.yaml files (<video>_<frameNr>_info.yaml and <video>_<frameNr>_hit.info.yaml)
+    as an array of HitRecordDtype, sorted by frameNr. They have no distance and capture time (UNKNOWN)"""
+    records = []
+    for yamlFile in yamlFiles:
+        match = re.search(r'_(\d+)_(hit\.)?info\.yaml$', yamlFile)
+        if match is None:
+            logger.warning("No frame number in " + yamlFile)
+            continue
+        with open(yamlFile) as file:
+            data = yaml.load(file, Loader=yaml.FullLoader)
+        if data is None:
+            continue
+        records.append((
+            int(match.group(1)), data.get('captureTime', UNKNOWN),
+            data.get('x', 0), data.get('y', 0), data.get('radius', 0),
+            data.get('distance', UNKNOWN), data.get('time', 0), lane))
+    records = np.array(records, dtype=HitRecordDtype)
+    return np.sort(records, order='frameNr')
+
+
+def printStats(records):
+    print("Hits: {}".format(len(records)))
+    for lane in np.unique(records['lane']):
+        laneRecords = records[records['lane'] == lane]
+        distances = laneRecords['distance'][laneRecords['distance'] != UNKNOWN]
+        if len(distances) > 0:
+            distance = "distance mean {:.1f} median {:.1f}".format(distances.mean(), np.median(distances))
+        else:
+            distance = "distance unknown"
+        print("  Lane {}: {} hits, {}, reaction time mean {:.1f} frames".format(
+            lane, len(laneRecords), distance, laneRecords['time'].mean()))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Session logs of hits")
+    sub = ap.add_subparsers(dest='command', required=True)
+    apConvert = sub.add_parser('convert', help="Append the hits of *_info.yaml files to a session log")
+    apConvert.add_argument("log", help="Session log to append to")
+    apConvert.add_argument("yaml", nargs='+', help="*_info.yaml files, or directories with them")
+    apConvert.add_argument("--lane", type=int, default=0)
+    apStats = sub.add_parser('stats', help="Statistics of session logs")
+    apStats.add_argument("log", nargs='+', help="Session logs")
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == 'convert':
+        yamlFiles = []
+        for path in args.yaml:
+            if os.path.isdir(path):
+                yamlFiles += sorted(glob.glob(os.path.join(path, '*info.yaml')))
+            else:
+                yamlFiles.append(path)
+        records = convertInfoYaml(yamlFiles, args.lane)
+        sessionLog = SessionLog(args.log)
+        sessionLog.append(records)
+        sessionLog.close()
+        print("Appended {} hits to {}".format(len(records), args.log))
+    elif args.command == 'stats':
+        try:
+            records = readSessionLogs(args.log)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        printStats(records)
+
+
+if __name__ == "__main__":
+    main()
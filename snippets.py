@@ -0,0 +1,104 @@
+import cv2
+import io
+import json
+import time
+import tarfile
+import logging
+import numpy as np
+from threading import Lock
+
+from gfxutils import clipRoi
+
+logger = logging.getLogger(__name__)
+
+
+class SnippetWriter(object):
+    """Saves small crops around hits, for some frames before and after the hit,
+    into one tar of PNGs per session with an index.json at the end.
+
+    Members are named <hit frameNr>/<frameNr>.png"""
+
+    def __init__(self, filename, evidenceWriter, minSize=32, radiusFactor=4):
+        self.filename = filename
+        self.evidenceWriter = evidenceWriter  # does the encoding and writing
+        self.minSize = minSize  # half size of the crop at least, in pixel
+        self.radiusFactor = radiusFactor  # half size of the crop in hit radius
+        self.tar = None  # opened with the first snippet
+        self.index = []
+        self.lock = Lock()
+        self.bytesWritten = 0
+
+
+    def getCrop(self, hit, shape):
+        """(x1, y1, x2, y2) around hit"""
+        size = max(self.minSize, int(hit.radius * self.radiusFactor))
+        return clipRoi((hit.x - size, hit.y - size, hit.x + size, hit.y + size), shape)
+
+
+    def add(self, hitFrameNr, hit, frames):
+        """Crop hit out of frames ((frameNr, frame) around hitFrameNr), and queue them for writing"""
+        if len(frames) == 0:
+            return
+        crop = self.getCrop(hit, frames[0][1].shape)
+        if crop is None:
+            return
+        (x1, y1, x2, y2) = crop
+        crops = [(frameNr, frame[y1:y2, x1:x2].copy()) for (frameNr, frame) in frames]  # frames get reused
+
+        entry = {
+            'frameNr': hitFrameNr,
+            'hit': hit.toDict(),
+            'crop': [x1, y1, x2, y2],
+            'frames': [frameNr for (frameNr, c) in crops],
+        }
+        self.evidenceWriter.run(self.filename, lambda: self.write(entry, crops))
+
+
+    def write(self, entry, crops):
+        """Worker: encode crops and append them to the tar"""
+        members = []
+        for (frameNr, c) in crops:
+            isOk, buf = cv2.imencode('.png', c)
+            if isOk:
+                members.append(("{}/{}.png".format(entry['frameNr'], frameNr), buf.tobytes()))
+
+        with self.lock:
+            if self.tar is None:
+                self.tar = tarfile.open(self.filename, 'w')
+            for (name, data) in members:
+                self.addMember(name, data)
+            self.index.append(entry)
+
+
+    def addMember(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.tar.addfile(info, io.BytesIO(data))
+        self.bytesWritten += len(data)
+
+
+    def close(self):
+        """Write the index and close the tar. Call after the EvidenceWriter is closed"""
+        with self.lock:
+            if self.tar is None:
+                return
+            data = json.dumps({'hits': self.index}, indent=1).encode()
+            self.addMember('index.json', data)
+            self.tar.close()
+            self.tar = None
+        logger.info("Saved {} hit snippets to {} ({} bytes)".format(len(self.index), self.filename, self.bytesWritten))
+
+
+def readSnippets(filename):
+    """Index and crops of a snippet tar: ({'hits': [...]}, {name: image})"""
+    crops = {}
+    index = None
+    with tarfile.open(filename, 'r') as tar:
+        for member in tar.getmembers():
+            data = tar.extractfile(member).read()
+            if member.name == 'index.json':
+                index = json.loads(data)
+            else:
+                crops[member.name] = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    return index, crops
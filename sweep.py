@@ -0,0 +1,181 @@
+import sys
+import json
+import argparse
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from detector import Detector
+from plugin_hits import PluginHits
+from videostream import FileVideoStream
+from videotests import readGroundTruth, scoreHits
+from gfxutils import getPerfTime, readVideoFileConfig, toGrey
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SweepConfig(object):
+    """One set of detector parameters, and what it detected"""
+
+    def __init__(self, thresh, targetThresh, minRadius, doSharpen):
+        self.thresh = thresh
+        self.targetThresh = targetThresh
+        self.minRadius = minRadius
+        self.doSharpen = doSharpen
+
+        self.detector = Detector(None)
+        self.detector.doSharpen = doSharpen
+        self.pluginHits = PluginHits()  # same grace time as in Lazer
+
+        self.hits = []  # dicts with frameNr, x, y, radius
+        self.targets = None  # number of target circles found in the first frame
+        self.time = 0  # in s, all frames
+        self.frames = 0
+
+
+    def handleFrame(self, frame, frameNr):
+        """Detect hits in frame, like DetectorThread and Lazer in Mode.main do"""
+        start = getPerfTime()
+        self.detector.initFrame(frame, self.thresh)
+        if self.targets is None:
+            contours, reliefs = self.detector.findTargets(self.targetThresh)
+            self.targets = len(reliefs)
+        recordedHits = self.detector.findHits(self.minRadius)
+        hit = self.pluginHits.handle(frame, frameNr, recordedHits)
+        self.time += getPerfTime() - start
+        self.frames += 1
+
+        if hit is not None:
+            self.hits.append({'frameNr': frameNr, 'x': int(hit.x), 'y': int(hit.y), 'radius': int(hit.radius)})
+
+
+    def getMsPerFrame(self):
+        if self.frames == 0:
+            return 0
+        return 1000 * self.time / self.frames
+
+
+def makeConfigs(threshs, targetThreshs, minRadiuses, sharpens):
+    """All combinations of the parameters"""
+    return [
+        SweepConfig(thresh, targetThresh, minRadius, doSharpen)
+        for (thresh, targetThresh, minRadius, doSharpen)
+        in itertools.product(threshs, targetThreshs, minRadiuses, sharpens)
+    ]
+
+
+def handleGroup(configs, frame, frameNr):
+    """Thread: evaluate frame with some of the configs"""
+    for config in configs:
+        config.handleFrame(frame, frameNr)
+
+
+def sweep(filename, configs, workers=4, cached=False):
+    """Decode every frame of filename once, and evaluate it with all configs.
+    The configs are split into groups run on a thread pool (OpenCV releases the GIL),
+    all of them use the same frame without copying it"""
+    videoFileConfig = readVideoFileConfig(filename)
+    videoStream = FileVideoStream(threaded=False, endless=False, cached=cached)
+    videoStream.setCrop(videoFileConfig['crop'])
+    if not videoStream.initFile(filename):
+        return None
+
+    workers = min(workers, len(configs))
+    groups = [configs[n::workers] for n in range(workers)]
+
+    start = getPerfTime()
+    frames = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        isTrue, frame, frameNr, captureTime = videoStream.getFrame()
+        while isTrue:
+            frame = toGrey(frame)  # once, instead of in every Detector
+            futures = [executor.submit(handleGroup, group, frame, frameNr) for group in groups]
+            # decode the next frame while the configs work on this one
+            isTrue, nextFrame, nextFrameNr, captureTime = videoStream.getFrame()
+            for future in futures:
+                future.result()
+            frames += 1
+            frame, frameNr = nextFrame, nextFrameNr
+    videoStream.release()
+    wallTime = getPerfTime() - start
+
+    basedir, basename = os.path.split(os.path.splitext(filename)[0])
+    groundTruth = readGroundTruth(basename, basedir + '/' if basedir else '')
+
+    results = []
+    for config in configs:
+        score = scoreHits(config.hits, groundTruth)
+        results.append({
+            'thresh': config.thresh,
+            'targetThresh': config.targetThresh,
+            'minRadius': config.minRadius,
+            'doSharpen': config.doSharpen,
+            'targets': config.targets,
+            'msPerFrame': round(config.getMsPerFrame(), 3),
+            'score': score,
+            'hits': config.hits,
+        })
+
+    # best first: most correct hits, least false positives, fastest
+    results.sort(key=lambda r: (
+        -r['score']['correct'], len(r['score']['falsePositives']) + len(r['score']['wrongPosition']), r['msPerFrame']))
+
+    return {
+        'filename': filename,
+        'frames': frames,
+        'configs': len(configs),
+        'workers': workers,
+        'wallTime': round(wallTime, 2),
+        'expected': len(groundTruth),
+        'results': results,
+    }
+
+
+def printReport(report):
+    print("{}: {} frames, {} configs in {:.1f}s, {} hits expected".format(
+        report['filename'], report['frames'], report['configs'], report['wallTime'], report['expected']))
+    print("  thresh targetThresh minRadius sharpen | correct wrongPos falsePos missed | targets | ms/frame")
+    for r in report['results']:
+        score = r['score']
+        print("  {:6} {:12} {:9} {:7} | {:7} {:8} {:8} {:6} | {:7} | {:8.2f}".format(
+            r['thresh'], r['targetThresh'], r['minRadius'], int(r['doSharpen']),
+            score['correct'], len(score['wrongPosition']), len(score['falsePositives']), len(score['missed']),
+            r['targets'], r['msPerFrame']))
+
+
+def parseList(s, type=int):
+    return [type(v) for v in s.split(',')]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Evaluate many detector parameters with one pass over a video")
+    ap.add_argument("video", help="Video file, with *_info.yaml files of its hits next to it")
+    ap.add_argument("--thresh", help="Comma separated list", default='10,12,14,16,18')
+    ap.add_argument("--targetThresh", help="Comma separated list", default='60')
+    ap.add_argument("--minRadius", help="Comma separated list", default='1.0')
+    ap.add_argument("--sharpen", help="Comma separated list of 0/1: preprocessing off/on", default='1')
+    ap.add_argument("--workers", help="Threads", type=int, default=os.cpu_count())
+    ap.add_argument("--cached", help="Read the frames from the frame cache (see xtarget.py --cached)", action='store_true', default=False)
+    ap.add_argument("--out", help="JSON file to write the results to")
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    configs = makeConfigs(
+        parseList(args.thresh), parseList(args.targetThresh), parseList(args.minRadius, float),
+        [bool(v) for v in parseList(args.sharpen)])
+    report = sweep(args.video, configs, args.workers, args.cached)
+    if report is None:
+        sys.exit(1)
+    printReport(report)
+
+    if args.out is not None:
+        with open(args.out, 'w') as outfile:
+            json.dump(report, outfile, indent=2)
+        print("Saved to: " + args.out)
+
+
+if __name__ == "__main__":
+    main()
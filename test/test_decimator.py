@@ -0,0 +1,168 @@
+import os
+import cv2
+import unittest
+import tempfile
+import numpy as np
+from threading import Thread
+
+from decimator import Decimator, MaxAccumulator
+from detectorthread import DetectorThread
+from model import Mode, HitAlgo
+from videostream import FileVideoStream
+
+
+class FakeVideoStream(object):
+    """Dark frames, with a dot in the frames of dotFrames, and optionally static glare"""
+
+    def __init__(self, frameCount, dotFrames, glare=False):
+        self.threaded = False
+        self.lowLatency = False
+        self.frameCount = frameCount
+        self.dotFrames = dotFrames
+        self.glare = glare
+        self.frameNr = -1
+
+
+    def getFrame(self):
+        self.frameNr += 1
+        if self.frameNr >= self.frameCount:
+            return False, None, self.frameNr, 0
+        frame = np.full((120, 160, 3), 40, np.uint8)
+        if self.glare:
+            frame[10:30, 10:50] = 230
+        if self.frameNr in self.dotFrames:
+            cv2.circle(frame, (80, 60), 6, (255, 255, 255), -1)
+        return True, frame, self.frameNr, 0
+
+
+class DecimatorTest(unittest.TestCase):
+    def test_decimator(self):
+        decimator = Decimator(4, burstFrames=2)
+        self.assertFalse(decimator.shouldDetect(0))
+        self.assertFalse(decimator.shouldDetect(2))
+        self.assertTrue(decimator.shouldDetect(3))
+
+        decimator.update(True)
+        self.assertTrue(decimator.shouldDetect(0))
+        decimator.update(False)
+        decimator.update(False)
+        self.assertFalse(decimator.shouldDetect(0))
+
+
+    def test_accumulator(self):
+        accumulator = MaxAccumulator()
+        frame = np.full((120, 160, 3), 40, np.uint8)
+        accumulator.add(frame)
+        cv2.circle(frame, (80, 60), 6, (255, 255, 255), -1)
+        accumulator.add(frame)
+        accumulator.add(np.full((120, 160, 3), 40, np.uint8))
+        self.assertEqual(accumulator.composite.shape, (60, 80))
+        self.assertTrue(accumulator.hasCandidates(14))
+
+        accumulator.clear()
+        accumulator.add(np.full((120, 160, 3), 40, np.uint8))
+        self.assertFalse(accumulator.hasCandidates(14))
+
+
+    def test_accumulator_glare(self):
+        # a static bright area becomes background, a dot on top of it is still found
+        accumulator = MaxAccumulator()
+        glare = np.full((120, 160, 3), 40, np.uint8)
+        glare[10:30, 10:50] = 230
+        accumulator.add(glare)
+        self.assertTrue(accumulator.hasCandidates(14))  # nothing learned yet
+        accumulator.clear()
+        accumulator.add(glare)
+        self.assertFalse(accumulator.hasCandidates(14))
+
+        accumulator.clear()
+        frame = glare.copy()
+        cv2.circle(frame, (100, 60), 6, (255, 255, 255), -1)
+        accumulator.add(frame)
+        self.assertTrue(accumulator.hasCandidates(14))
+
+
+    def detectAll(self, videoStream, accumulate=False):
+        """Frame numbers of all frames, and of the frames with hits"""
+        detectorThread = DetectorThread(videoStream)
+        detectorThread.startThread({
+            'mode': Mode.main, 'thresh': 14, 'targetThresh': 60, 'crop': None, 'roi': None,
+            'hitAlgo': HitAlgo.contour, 'decimate': 4, 'accumulate': accumulate,
+        })
+
+        frameNrs = []
+        hitFrameNrs = []
+        while True:
+            (isTrue, frame, frameNr, mode, data) = detectorThread.getFrameData()
+            if not isTrue:
+                break
+            frameNrs.append(frameNr)
+            if len(data['recordedHits']) > 0:
+                hitFrameNrs.append(frameNr)
+        return frameNrs, hitFrameNrs, detectorThread.decimator.getStats()
+
+
+    def test_backtrack(self):
+        # the dot appears in a skipped frame, and is still found there
+        (frameNrs, hitFrameNrs, stats) = self.detectAll(FakeVideoStream(40, range(13, 18)))
+        self.assertEqual(frameNrs, list(range(40)))
+        self.assertEqual(hitFrameNrs, list(range(13, 18)))
+        self.assertGreater(stats['skipped'], 15)
+        self.assertGreater(stats['backtracked'], 0)
+
+
+    def test_accumulate(self):
+        # a dot in only one skipped frame is missed, except with the accumulator
+        (frameNrs, hitFrameNrs, stats) = self.detectAll(FakeVideoStream(40, [13]))
+        self.assertEqual(hitFrameNrs, [])
+
+        (frameNrs, hitFrameNrs, stats) = self.detectAll(FakeVideoStream(40, [13]), accumulate=True)
+        self.assertEqual(frameNrs, list(range(40)))
+        self.assertEqual(hitFrameNrs, [13])
+        self.assertEqual(stats['accumulatedCandidates'], 1)
+        self.assertGreater(stats['skipped'], 15)
+
+
+    def test_ring(self):
+        # the held frames stay in their ring slots, a window larger than the ring must not stall the reader
+        with tempfile.TemporaryDirectory() as tmpDir:
+            filename = os.path.join(tmpDir, 'test.avi')
+            writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'MJPG'), 30, (160, 120))
+            for n in range(40):
+                writer.write(np.full((120, 160, 3), 40, np.uint8))
+            writer.release()
+
+            for (capacity, every) in ((4, 5), (16, 17)):
+                videoStream = FileVideoStream(threaded=True, endless=False, ring=True)
+                videoStream.ringCapacity = capacity
+                videoStream.initFile(filename)
+                detectorThread = DetectorThread(videoStream)
+                detectorThread.startThread({
+                    'mode': Mode.main, 'thresh': 14, 'targetThresh': 60, 'crop': None, 'roi': None,
+                    'hitAlgo': HitAlgo.contour, 'decimate': every,
+                })
+
+                frameNrs = []
+                def consume():
+                    # like Lazer: hold the frame until the next one is taken
+                    while True:
+                        (isTrue, frame, frameNr, mode, data) = detectorThread.getFrameData()
+                        if frameNrs:
+                            videoStream.releaseFrame()
+                        if not isTrue:
+                            break
+                        frameNrs.append(frameNr)
+                thread = Thread(target=consume)
+                thread.daemon = True
+                thread.start()
+                thread.join(10)
+                self.assertEqual(frameNrs, list(range(40)))
+                self.assertLessEqual(detectorThread.decimator.every, capacity - 2)
+                detectorThread.shutdownThread()
+
+
+    def test_accumulate_glare(self):
+        # static glare does not make every window a candidate
+        (frameNrs, hitFrameNrs, stats) = self.detectAll(FakeVideoStream(80, [45], glare=True), accumulate=True)
+        self.assertEqual(hitFrameNrs, [45])
+        self.assertLessEqual(stats['accumulatedCandidates'], 3)
@@ -1,5 +1,5 @@
 import unittest
-from detector import Detector
+from detector import Detector, blobsToRecordedHits
 import cv2
 
 Basepath = 'test/data/'
@@ -10,8 +10,8 @@ class DetectorTest(unittest.TestCase):
         capture = cv2.VideoCapture(Basepath + filename)
         ok, frame = capture.read()
         self.assertTrue(ok)
-        detector = Detector(thresh=14)
-        detector.initFrame(frame)
+        detector = Detector(None)
+        detector.initFrame(frame, 14)
 
         # needs to find some glare
         glare = detector.findGlare()
@@ -23,8 +23,8 @@ class DetectorTest(unittest.TestCase):
         capture = cv2.VideoCapture(Basepath + filename)
         ok, frame = capture.read()
         self.assertTrue(ok)
-        detector = Detector(thresh=14)
-        detector.initFrame(frame)
+        detector = Detector(None)
+        detector.initFrame(frame, 14)
 
         # need to find a hit
         hits = detector.findHits(minRadius=1.0)
@@ -41,8 +41,8 @@ class DetectorTest(unittest.TestCase):
         capture = cv2.VideoCapture(Basepath + filename)
         ok, frame = capture.read()
         self.assertTrue(ok)
-        detector = Detector(thresh=14)
-        detector.initFrame(frame)
+        detector = Detector(None)
+        detector.initFrame(frame, 14)
 
         # need to find a target
         contours, reliefs = detector.findTargets(targetThresh=60)
@@ -61,8 +61,8 @@ class DetectorTest(unittest.TestCase):
         capture = cv2.VideoCapture(Basepath + filename)
         ok, frame = capture.read()
         self.assertTrue(ok)
-        detector = Detector(thresh=14)
-        detector.initFrame(frame)
+        detector = Detector(None)
+        detector.initFrame(frame, 14)
 
         (corners, ids, rejected) = detector.findAruco()
         self.assertEqual(len(corners), 4)
@@ -77,8 +77,8 @@ class DetectorTest(unittest.TestCase):
         capture = cv2.VideoCapture(Basepath + filename)
         ok, frame = capture.read()
         self.assertTrue(ok)
-        detector = Detector(thresh=14)
-        detector.initFrame(frame)
+        detector = Detector(None)
+        detector.initFrame(frame, 14)
 
         (corners, ids, rejected) = detector.findAruco()
         self.assertEqual(len(corners), 4)
@@ -90,8 +90,8 @@ class DetectorTest(unittest.TestCase):
         capture = cv2.VideoCapture(Basepath + filename)
         ok, frame = capture.read()
         self.assertTrue(ok)
-        detector = Detector(thresh=14)
-        detector.initFrame(frame)
+        detector = Detector(None)
+        detector.initFrame(frame, 14)
 
         (corners, ids, rejected) = detector.findAruco()
         self.assertEqual(len(corners), 4)
@@ -103,10 +103,163 @@ class DetectorTest(unittest.TestCase):
         capture = cv2.VideoCapture(Basepath + filename)
         ok, frame = capture.read()
         self.assertTrue(ok)
-        detector = Detector(thresh=14)
-        detector.initFrame(frame)
+        detector = Detector(None)
+        detector.initFrame(frame, 14)
 
         (corners, ids, rejected) = detector.findAruco()
         self.assertEqual(len(corners), 4)
         self.assertEqual(len(ids), 4)
 
+
+    def test_hit_roi(self):
+        filename = "test-hit.jpg"
+        capture = cv2.VideoCapture(Basepath + filename)
+        ok, frame = capture.read()
+        self.assertTrue(ok)
+        detector = Detector(None)
+
+        detector.initFrame(frame, 14)
+        hits = detector.findHits(minRadius=1.0)
+        self.assertEqual(len(hits), 1)
+
+        # same hit, in frame coordinates, when only looking at the area around it
+        detector.initFrame(frame, 14, roi=(400, 450, 700, 750))
+        self.assertEqual(detector.mask.shape, (300, 300))
+        hitsRoi = detector.findHits(minRadius=1.0)
+        self.assertEqual(len(hitsRoi), 1)
+        self.assertEqual(hitsRoi[0].x, hits[0].x)
+        self.assertEqual(hitsRoi[0].y, hits[0].y)
+        self.assertEqual(hitsRoi[0].center, hits[0].center)
+
+        # nothing outside of the roi
+        detector.initFrame(frame, 14, roi=(0, 0, 300, 300))
+        self.assertEqual(len(detector.findHits(minRadius=1.0)), 0)
+
+
+    def test_hit_diff(self):
+        filename = "test-hit.jpg"
+        capture = cv2.VideoCapture(Basepath + filename)
+        ok, frame = capture.read()
+        self.assertTrue(ok)
+        dark = (frame * 0.3).astype(frame.dtype)
+        detector = Detector(None)
+
+        # first frame only initializes the background
+        detector.initFrame(dark, 14)
+        self.assertEqual(len(detector.findHitsDiff(minRadius=1.0)), 0)
+
+        # the dot appears
+        detector.initFrame(frame, 14)
+        hits = detector.findHitsDiff(minRadius=1.0)
+        self.assertEqual(len(hits), 1)
+        self.assertAlmostEqual(hits[0].x, 557, delta=2)
+        self.assertAlmostEqual(hits[0].y, 602, delta=2)
+
+        # static spots are ignored
+        detector.resetBackground()
+        detector.initFrame(frame, 14)
+        detector.findHitsDiff(minRadius=1.0)
+        detector.initFrame(frame, 14)
+        self.assertEqual(len(detector.findHitsDiff(minRadius=1.0)), 0)
+
+
+    def test_hit_gate(self):
+        filename = "test-hit.jpg"
+        capture = cv2.VideoCapture(Basepath + filename)
+        ok, frame = capture.read()
+        self.assertTrue(ok)
+        detector = Detector(None)
+
+        # dark frame: stops at the gate
+        detector.initFrame((frame * 0.3).astype(frame.dtype), 14)
+        self.assertEqual(len(detector.findHits(minRadius=1.0)), 0)
+        self.assertEqual(detector.timeGated.count, 1)
+        self.assertEqual(detector.timeSearched.count, 0)
+
+        detector.initFrame(frame, 14)
+        self.assertEqual(len(detector.findHits(minRadius=1.0)), 1)
+        self.assertEqual(detector.timeSearched.count, 1)
+
+        # subsampled gate still sees the dot
+        detector.gateStep = 4
+        self.assertTrue(detector.hasCandidates(detector.mask))
+
+
+    def test_blobs(self):
+        filename = "test-hit.jpg"
+        capture = cv2.VideoCapture(Basepath + filename)
+        ok, frame = capture.read()
+        self.assertTrue(ok)
+        detector = Detector(None)
+        detector.initFrame(frame, 14)
+
+        # same as the largest contour
+        hits = detector.findHits(minRadius=1.0)
+        blobs = detector.findBlobs(minRadius=1.0)
+        self.assertEqual(len(blobs), 1)
+        self.assertAlmostEqual(blobs[0]['x'], hits[0].x, delta=10)
+        self.assertAlmostEqual(blobs[0]['y'], hits[0].y, delta=10)
+        self.assertAlmostEqual(blobs[0]['radius'], hits[0].radius, delta=5)
+        self.assertEqual(blobs[0]['peak'], 255)
+
+        # a second dot gets found too
+        cv2.circle(frame, (200, 200), 20, (255, 255, 255), -1)
+        detector.initFrame(frame, 14)
+        blobs = detector.findBlobs(minRadius=1.0)
+        self.assertEqual(len(blobs), 2)
+        recordedHits = blobsToRecordedHits(blobs)
+        self.assertAlmostEqual(recordedHits[1].x, 200, delta=2)
+        self.assertAlmostEqual(recordedHits[1].y, 200, delta=2)
+
+        # only the area around the set pixels is labeled, the coordinates stay in the frame, also with a roi
+        detector.initFrame(frame, 14, roi=(100, 100, 400, 400))
+        roiBlobs = detector.findBlobs(minRadius=1.0)
+        self.assertEqual(len(roiBlobs), 1)
+        self.assertEqual(roiBlobs[0], blobs[1])
+
+
+    def test_hit_pyramid(self):
+        filename = "test-hit.jpg"
+        capture = cv2.VideoCapture(Basepath + filename)
+        ok, frame = capture.read()
+        self.assertTrue(ok)
+        detector = Detector(None)
+
+        # a small dot on a dark frame, and the big dot from the picture
+        dark = (frame * 0.3).astype(frame.dtype)
+        cv2.circle(dark, (301, 203), 6, (255, 255, 255), -1)
+        for f in (frame, dark):
+            detector.initFrame(f, 14)
+            hits = detector.findHits(minRadius=1.0)
+            detector.initFramePyramid(f, 14)
+            hitsPyramid = detector.findHitsPyramid(minRadius=1.0)
+
+            # within the tolerance of videotests.testHandleHit()
+            self.assertEqual(len(hitsPyramid), 1)
+            self.assertLessEqual(abs(hitsPyramid[0].x - hits[0].x), 10)
+            self.assertLessEqual(abs(hitsPyramid[0].y - hits[0].y), 10)
+            self.assertLessEqual(abs(hitsPyramid[0].radius - hits[0].radius), 10)
+
+
+    def test_hit_tiled(self):
+        filename = "test-glare.jpg"
+        capture = cv2.VideoCapture(Basepath + filename)
+        ok, frame = capture.read()
+        self.assertTrue(ok)
+        detector = Detector(None)
+        detector.initFrame(frame, 14)
+        hits = detector.findHits(minRadius=1.0)
+        mask = detector.mask
+
+        # the big hit goes over several bands, and is still one hit
+        for bands in (2, 4, 16):
+            detector.tileBands = bands
+            detector.tilePool = None
+            detector.initFrameTiled(frame, 14)
+            self.assertTrue((detector.mask == mask).all())
+            hitsTiled = detector.findHitsTiled(minRadius=1.0)
+            self.assertEqual(len(hitsTiled), 1)
+            self.assertEqual(hitsTiled[0].x, hits[0].x)
+            self.assertEqual(hitsTiled[0].y, hits[0].y)
+            self.assertEqual(hitsTiled[0].radius, hits[0].radius)
+            self.assertEqual(hitsTiled[0].center, hits[0].center)
@@ -0,0 +1,52 @@
+import os
+import cv2
+import unittest
+import tempfile
+import numpy as np
+from threading import Thread
+
+from detectorthread import DetectorThread
+from model import Mode, HitAlgo
+from videostream import FileVideoStream
+
+
+class DetectorThreadTest(unittest.TestCase):
+    def test_workers_ring(self):
+        # workers, their queues and Lazer never hold all slots of the ring, one is left for decoding
+        with tempfile.TemporaryDirectory() as tmpDir:
+            filename = os.path.join(tmpDir, 'test.avi')
+            writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'MJPG'), 30, (160, 120))
+            for n in range(60):
+                writer.write(np.full((120, 160, 3), 40, np.uint8))
+            writer.release()
+
+            capacity = 8
+            videoStream = FileVideoStream(threaded=True, endless=False, ring=True)
+            videoStream.ringCapacity = capacity
+            videoStream.initFile(filename)
+            detectorThread = DetectorThread(videoStream, workers=4)
+            detectorThread.startThread({
+                'mode': Mode.main, 'thresh': 14, 'targetThresh': 60, 'crop': None, 'roi': None,
+                'hitAlgo': HitAlgo.contour,
+            })
+            self.assertEqual(detectorThread.workerCount, 3)
+
+            frameNrs = []
+            held = []
+            def consume():
+                # like Lazer: hold the frame until the next one is taken
+                while True:
+                    (isTrue, frame, frameNr, mode, data) = detectorThread.getFrameData()
+                    held.append(len(videoStream.inputStream.ring.held))
+                    if frameNrs:
+                        videoStream.releaseFrame()
+                    if not isTrue:
+                        break
+                    frameNrs.append(frameNr)
+            thread = Thread(target=consume)
+            thread.daemon = True
+            thread.start()
+            thread.join(10)
+            self.assertEqual(frameNrs, list(range(60)))
+            self.assertLessEqual(max(held), capacity - 1)
+            detectorThread.shutdownThread()
@@ -0,0 +1,39 @@
+import os
+import json
+import unittest
+import tempfile
+import numpy as np
+
+from evidencewriter import EvidenceWriter
+
+
+class EvidenceWriterTest(unittest.TestCase):
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            writer = EvidenceWriter(workers=2, maxsize=4, batchSize=3)
+            image = np.zeros((20, 30, 3), np.uint8)
+            self.assertTrue(writer.writeImage(os.path.join(tmpDir, 'a.jpg'), image, force=True))
+            writer.writeImage(os.path.join(tmpDir, 'b.png'), image, force=True)
+            writer.writeYaml(os.path.join(tmpDir, 'c.yaml'), {'x': 1})
+            for n in range(5):
+                writer.writeRecord(os.path.join(tmpDir, 'd.jsonl'), {'frameNr': n})
+            writer.close()
+
+            self.assertTrue(os.path.isfile(os.path.join(tmpDir, 'a.jpg')))
+            self.assertTrue(os.path.isfile(os.path.join(tmpDir, 'b.png')))
+            self.assertTrue(os.path.isfile(os.path.join(tmpDir, 'c.yaml')))
+            with open(os.path.join(tmpDir, 'd.jsonl')) as f:
+                frameNrs = sorted(json.loads(line)['frameNr'] for line in f)
+            self.assertEqual(frameNrs, [0, 1, 2, 3, 4])  # batches, and the rest on close()
+            self.assertEqual(writer.getStats()['dropped'], 0)
+
+
+    def test_drop(self):
+        writer = EvidenceWriter(workers=0, maxsize=2)  # nobody writes
+        image = np.zeros((20, 30, 3), np.uint8)
+        self.assertTrue(writer.writeImage('a.jpg', image))
+        self.assertTrue(writer.writeImage('b.jpg', image))
+        self.assertFalse(writer.writeImage('c.jpg', image))
+        self.assertTrue(writer.writeImage('d.jpg', image, force=True))  # e.g. hits
+        self.assertEqual(writer.getDropped(), 1)
+        self.assertEqual(writer.getDepth(), 3)
@@ -1,7 +1,7 @@
 import unittest
 import time
 
-from fps import Fps
+from fps import Fps, Timer
 
 class FpsTest(unittest.TestCase):
     def test_fps(self):
@@ -21,3 +21,14 @@ class FpsTest(unittest.TestCase):
 
         # around 10
         self.assertTrue(fps > 8 and fps < 11)
+
+
+class TimerTest(unittest.TestCase):
+    def test_timer(self):
+        timer = Timer()
+        self.assertEqual(timer.getMs(), 0)
+
+        timer.add(0.010)
+        timer.add(0.020)
+        self.assertEqual(timer.count, 2)
+        self.assertEqual(timer.getMs(), 15.0)
@@ -0,0 +1,100 @@
+import unittest
+from threading import Thread
+
+from framebuffer import FrameBuffer, ReorderBuffer
+from model import DropPolicy
+
+
+class FrameBufferTest(unittest.TestCase):
+    def test_block(self):
+        buffer = FrameBuffer(2, DropPolicy.block)
+        buffer.put(1)
+        buffer.put(2)
+
+        # waits until the consumer made room
+        thread = Thread(target=buffer.put, args=(3, ))
+        thread.start()
+        thread.join(0.1)
+        self.assertTrue(thread.is_alive())
+        self.assertEqual(buffer.get(), 1)
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+
+        self.assertEqual(buffer.get(), 2)
+        self.assertEqual(buffer.get(), 3)
+        self.assertEqual(buffer.droppedFrames, 0)
+
+
+    def test_drop(self):
+        buffer = FrameBuffer(2, DropPolicy.dropOldest)
+        for n in range(4):
+            buffer.put(n)
+        self.assertEqual(buffer.droppedFrames, 2)
+        self.assertEqual(buffer.get(), 2)
+        self.assertEqual(buffer.get(), 3)
+
+        buffer = FrameBuffer(2, DropPolicy.dropNewest)
+        for n in range(4):
+            buffer.put(n)
+        buffer.put(None, force=True)  # end of stream
+        self.assertEqual(buffer.droppedFrames, 2)
+        self.assertEqual(buffer.get(), 0)
+        self.assertEqual(buffer.get(), 1)
+        self.assertEqual(buffer.qsize(), 1)
+
+        # nothing left to wait for
+        buffer.get()
+        buffer.stop()
+        self.assertIsNone(buffer.get())
+
+
+    def test_flush(self):
+        buffer = FrameBuffer(2, DropPolicy.block)
+        buffer.put(1)
+        buffer.put(2)
+        buffer.stop()
+        self.assertEqual(buffer.flush(), [1, 2])
+        self.assertEqual(buffer.qsize(), 0)
+
+        # usable again
+        buffer.put(3)
+        self.assertEqual(buffer.get(), 3)
+
+
+class ReorderBufferTest(unittest.TestCase):
+    def test_order(self):
+        buffer = ReorderBuffer(4)
+        buffer.put(1, 'b')
+        buffer.put(2, 'c')
+
+        # waits for the first one
+        results = []
+        thread = Thread(target=lambda: results.append(buffer.get()))
+        thread.start()
+        thread.join(0.1)
+        self.assertTrue(thread.is_alive())
+        buffer.put(0, 'a')
+        thread.join(1)
+        self.assertEqual(results, ['a'])
+        self.assertEqual(buffer.get(), 'b')
+        self.assertEqual(buffer.get(), 'c')
+
+
+    def test_ahead(self):
+        buffer = ReorderBuffer(2)
+        buffer.put(1, 'b')
+
+        # too far ahead of the consumer
+        thread = Thread(target=buffer.put, args=(2, 'c'))
+        thread.start()
+        thread.join(0.1)
+        self.assertTrue(thread.is_alive())
+        buffer.put(0, 'a')
+        self.assertEqual(buffer.get(), 'a')
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(buffer.get(), 'b')
+        self.assertEqual(buffer.get(), 'c')
+
+        buffer.stop()
+        self.assertIsNone(buffer.get())
@@ -0,0 +1,87 @@
+import os
+import cv2
+import unittest
+import tempfile
+import numpy as np
+
+from framecache import FrameCache
+from inputstream import CachedInputStream
+from videostream import FileVideoStream
+
+
+def writeVideo(filename, frameCount):
+    writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'MJPG'), 30, (160, 120))
+    for n in range(frameCount):
+        frame = np.zeros((120, 160, 3), np.uint8)
+        cv2.circle(frame, (20 + n * 10, 60), 5, (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+
+
+class FrameCacheTest(unittest.TestCase):
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            filename = os.path.join(tmpDir, 'test.avi')
+            writeVideo(filename, 10)
+
+            cache = FrameCache(filename, crop=[(10, 20), (110, 100)])
+            self.assertTrue(cache.open())
+            self.assertEqual(cache.getFrameCount(), 10)
+            self.assertEqual(cache.getResolution(), (100, 80))
+            self.assertTrue(os.path.isdir(os.path.join(tmpDir, '.framecache')))
+
+            # same settings use the same cache, other crop a new one
+            self.assertEqual(cache.getKey(), FrameCache(filename, crop=[(10, 20), (110, 100)]).getKey())
+            self.assertNotEqual(cache.getKey(), FrameCache(filename).getKey())
+
+            # a changed video too
+            key = cache.getKey()
+            stat = os.stat(filename)
+            os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+            self.assertNotEqual(cache.getKey(), key)
+            cache.release()
+
+    def test_cached_inputstream(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            filename = os.path.join(tmpDir, 'test.avi')
+            writeVideo(filename, 10)
+
+            inputStream = CachedInputStream(filename)
+            inputStream.initStream()
+            grabbed, frame, captureTime = inputStream.read()
+            self.assertTrue(grabbed)
+            self.assertEqual(frame.shape, (120, 160))
+
+            # dot moves 10 pixel per frame
+            inputStream.seek(5)
+            grabbed, frame, captureTime = inputStream.read()
+            (minVal, maxVal, minLoc, maxLoc) = cv2.minMaxLoc(frame)
+            self.assertAlmostEqual(maxLoc[0], 70, delta=3)
+
+            inputStream.seek(10)
+            grabbed, frame, captureTime = inputStream.read()
+            self.assertFalse(grabbed)
+            inputStream.release()
+
+
+    def test_crop(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            filename = os.path.join(tmpDir, 'test.avi')
+            writeVideo(filename, 10)
+
+            # crop of the cache, another one can't be applied to the cropped frames
+            videoStream = FileVideoStream(threaded=False, endless=False, cached=True)
+            videoStream.setCrop([(10, 20), (110, 100)])
+            videoStream.initFile(filename)
+            videoStream.setCrop([(0, 0), (50, 50)])
+            isTrue, frame, frameNr, captureTime = videoStream.getFrame()
+            self.assertEqual(frame.shape, (80, 100))
+            videoStream.release()
+
+            # without, the crop is applied to the cached frames
+            videoStream = FileVideoStream(threaded=False, endless=False, cached=True)
+            videoStream.initFile(filename)
+            videoStream.setCrop([(0, 0), (50, 40)])
+            isTrue, frame, frameNr, captureTime = videoStream.getFrame()
+            self.assertEqual(frame.shape, (40, 50))
+            videoStream.release()
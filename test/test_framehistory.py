@@ -0,0 +1,56 @@
+import unittest
+import numpy as np
+
+from framehistory import FrameHistory, TriggeredWindow
+
+
+class FrameHistoryTest(unittest.TestCase):
+    def makeFrame(self, n):
+        return np.full((4, 4), n, np.uint8)
+
+
+    def test_history(self):
+        history = FrameHistory(3)
+        for n in range(5):
+            history.push(self.makeFrame(n), n)
+
+        self.assertIsNone(history.get(1))
+        self.assertEqual(history.get(3)[0, 0], 3)
+        frames = history.getRange(0, 10)
+        self.assertEqual([frameNr for (frameNr, frame) in frames], [2, 3, 4])
+        self.assertEqual([frame[0, 0] for (frameNr, frame) in frames], [2, 3, 4])
+
+        # seeking back starts over
+        history.push(self.makeFrame(1), 1)
+        self.assertEqual([frameNr for (frameNr, frame) in history.getRange(0, 10)], [1])
+
+
+
+    def test_lend(self):
+        # lent frames are not overwritten, the history writes into new memory instead
+        history = FrameHistory(3)
+        for n in range(3):
+            history.push(self.makeFrame(n), n)
+        lent = history.lend(1, 2)
+        for n in range(3, 6):
+            history.push(self.makeFrame(n), n)
+        self.assertEqual([frame[0, 0] for (frameNr, frame) in lent], [1, 2])
+        self.assertEqual([frame[0, 0] for (frameNr, frame) in history.getRange(0, 10)], [3, 4, 5])
+
+
+    def test_window(self):
+        history = FrameHistory(5)
+        window = TriggeredWindow(2, 2)
+        done = []
+        for n in range(10):
+            for (frameNr, data) in window.update(n):
+                first, last = window.getRange(frameNr)
+                done.append((data, [nr for (nr, frame) in history.getRange(first, last)]))
+            history.push(self.makeFrame(n), n)
+            if n == 4:
+                window.trigger(n, 'hit')
+        self.assertEqual(done, [('hit', [2, 3, 4, 5, 6])])
+
+        window.trigger(9, 'last')
+        self.assertEqual(window.flush(), [(9, 'last')])
+        self.assertEqual(window.update(10), [])
@@ -0,0 +1,38 @@
+import unittest
+import numpy as np
+
+from framelru import FrameLru, FramePrefetcher
+
+
+class FrameLruTest(unittest.TestCase):
+    def test_lru(self):
+        frame = np.zeros((10, 10), np.uint8)  # 100 bytes
+        lru = FrameLru(maxBytes=300)
+        self.assertEqual(lru.getCapacity(frame.nbytes), 3)
+
+        lru.put(1, frame.copy())
+        lru.put(2, frame.copy())
+        lru.put(3, frame.copy())
+        self.assertIsNotNone(lru.get(1))  # now 2 is the least recently used
+
+        lru.put(4, frame.copy())
+        self.assertIsNone(lru.get(2))
+        self.assertIsNotNone(lru.get(1))
+        self.assertIsNotNone(lru.get(3))
+        self.assertIsNotNone(lru.get(4))
+        self.assertEqual(lru.bytes, 300)
+        self.assertEqual(lru.misses, 1)
+
+
+    def test_prefetcher_idle(self):
+        # nothing is decoded before the first seek
+        lru = FrameLru(maxBytes=1000)
+        prefetcher = FramePrefetcher('test.avi', lru, ahead=2, behind=2)
+        self.assertIsNone(prefetcher.getMissing())
+
+        prefetcher.setPlayhead(5)
+        self.assertEqual(prefetcher.getMissing(), 5)
+        for frameNr in (5, 6, 7):
+            lru.put(frameNr, np.zeros((10, 10), np.uint8))
+        self.assertEqual(prefetcher.getMissing(), 3)
+        self.assertEqual(lru.getCount(), 3)
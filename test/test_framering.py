@@ -0,0 +1,59 @@
+import unittest
+import numpy as np
+from threading import Thread
+
+from framering import FrameRing, FrameArena
+
+
+class FrameRingTest(unittest.TestCase):
+    def test_ring(self):
+        ring = FrameRing(2, (4, 4, 3))
+
+        # writer fills all slots
+        for n in range(2):
+            slot, frame = ring.acquire()
+            frame[...] = n
+            ring.commit(slot, True)
+        self.assertEqual(len(ring.free), 0)
+
+        # reader gets the frames in order, in place
+        grabbed, frame, seq = ring.read()
+        self.assertTrue(grabbed)
+        self.assertEqual(seq, 0)
+        self.assertEqual(frame[0, 0, 0], 0)
+        self.assertTrue(np.shares_memory(frame, ring.arena.frames))
+
+        # writer waits until a slot gets released
+        written = []
+        def write():
+            slot, frame = ring.acquire()
+            frame[...] = 2
+            ring.commit(slot, True)
+            written.append(slot)
+        thread = Thread(target=write)
+        thread.start()
+        thread.join(0.1)
+        self.assertEqual(len(written), 0)
+
+        ring.release(seq)
+        thread.join(1)
+        self.assertEqual(len(written), 1)
+
+        grabbed, frame, seq = ring.read()
+        self.assertEqual(frame[0, 0, 0], 1)
+        grabbed, frame, seq = ring.read()
+        self.assertEqual(frame[0, 0, 0], 2)
+        self.assertEqual(seq, 2)
+
+        ring.releaseOldest()
+        ring.releaseOldest()
+        self.assertEqual(len(ring.free), 2)
+
+
+    def test_shared_arena(self):
+        arena = FrameArena(2, (4, 4), shared=True)
+        other = FrameArena.attach(arena.getName(), 2, (4, 4))
+        arena.frames[1, 2, 3] = 42
+        self.assertEqual(other.frames[1, 2, 3], 42)
+        other.release()
+        arena.release()
@@ -0,0 +1,52 @@
+import unittest
+import numpy as np
+
+from model import RecordedHit
+from multicam import CamHit, HitStream, Mosaic
+
+
+class MultiCamTest(unittest.TestCase):
+    def test_hitstream(self):
+        hitStream = HitStream()
+        for (camId, captureTime) in [(1, 10.2), (0, 10.1), (1, 10.0)]:
+            hit = RecordedHit()
+            hit.captureTime = captureTime
+            hitStream.put(CamHit(camId, 1, hit))
+
+        hits = hitStream.getHits()
+        self.assertEqual([camHit.captureTime for camHit in hits], [10.0, 10.1, 10.2])
+        self.assertEqual([camHit.camId for camHit in hits], [1, 0, 1])
+        self.assertEqual(hitStream.getHits(), [])
+
+
+    def test_hitstream_watermark(self):
+        # cam 1 is behind: the hit of cam 0 waits until cam 1 is past it
+        hitStream = HitStream([0, 1])
+        for (camId, captureTime) in [(0, 10.5), (1, 10.2)]:
+            hit = RecordedHit()
+            hit.captureTime = captureTime
+            hitStream.put(CamHit(camId, 1, hit))
+        hitStream.advance(0, 10.6)
+        hitStream.advance(1, 10.3)
+        self.assertEqual([camHit.captureTime for camHit in hitStream.getHits()], [10.2])
+
+        hitStream.advance(1, 10.6)
+        self.assertEqual([camHit.captureTime for camHit in hitStream.getHits()], [10.5])
+
+        # a stopped camera is not waited for
+        hit = RecordedHit()
+        hit.captureTime = 11.0
+        hitStream.put(CamHit(0, 2, hit))
+        hitStream.advance(0, 11.0)
+        self.assertEqual(hitStream.getHits(), [])
+        hitStream.finish(1)
+        self.assertEqual(len(hitStream.getHits()), 1)
+
+
+    def test_mosaic(self):
+        mosaic = Mosaic(3, tileWidth=64, tileHeight=36)
+        self.assertEqual(mosaic.image.shape, (72, 128, 3))
+
+        mosaic.put(2, np.full((720, 1280, 3), 255, np.uint8))
+        self.assertTrue((mosaic.getTile(2) == 255).all())
+        self.assertTrue((mosaic.image[:36] == 0).all())
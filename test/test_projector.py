@@ -1,23 +1,24 @@
 import unittest
 from detector import Detector
 from projector import Projector
-import cv2
 
 Basepath = 'test/data/'
 
 class ArurcoTest(unittest.TestCase):
     def test_aruco_projection(self):
-        projector = Projector()
-        projector.initFrame()
-        projector.drawAruco()
-        frame = projector.frame
+        projector = Projector(withWindow=False)
+        # white border right at the edge of the markers, as with the trackbars in the projector window
+        projector.trackbarCallbackLineHalfWidth(projector.lineWidth >> 1)
+        projector.fsckInit()
+        frame = projector.picAruco
 
-        detector = Detector(thresh=14)
-        detector.initFrame(frame)
+        detector = Detector(None)
+        detector.initFrame(frame, 14)
 
         (corners, ids, rejected) = detector.findAruco()
         self.assertEqual(len(corners), 4)
         self.assertEqual(len(ids), 4)
+        self.assertEqual(sorted(ids.ravel()), [42, 241, 1001, 1007])
         #print("A: {}".format(len(corners)))
         #print("B: {}".format(len(rejected)))
 
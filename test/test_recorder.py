@@ -0,0 +1,62 @@
+import os
+import cv2
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from recorder import Recorder
+from videostream import FileVideoStream
+
+
+class RecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def test_record(self):
+        filename = os.path.join(self.tmpdir, 'record.avi')
+        recorder = Recorder(filename, skip=2, scale=0.5, slots=20)  # enough slots to never drop
+        for n in range(20):
+            frame = np.full((120, 160, 3), n * 10, np.uint8)
+            recorder.add(frame, n)
+        recorder.close()
+        self.assertEqual(recorder.getStats(), {'recorded': 10, 'skipped': 10, 'dropped': 0})
+
+        capture = cv2.VideoCapture(filename)
+        frames = 0
+        while True:
+            (grabbed, frame) = capture.read()
+            if not grabbed:
+                break
+            self.assertEqual(frame.shape, (60, 80, 3))
+            frames += 1
+        capture.release()
+        self.assertEqual(frames, 10)
+
+
+    def test_fps(self):
+        # recorded at the frame rate of the source
+        source = os.path.join(self.tmpdir, 'source.avi')
+        writer = cv2.VideoWriter(source, cv2.VideoWriter_fourcc(*'MJPG'), 120, (160, 120))
+        for n in range(4):
+            writer.write(np.zeros((120, 160, 3), np.uint8))
+        writer.release()
+        videoStream = FileVideoStream(threaded=False, endless=False)
+        videoStream.initFile(source)
+        self.assertEqual(videoStream.getSourceFps(), 120)
+
+        filename = os.path.join(self.tmpdir, 'record.avi')
+        recorder = Recorder(filename, fps=videoStream.getSourceFps(), skip=2)
+        for n in range(4):
+            recorder.add(videoStream.getFrame()[1], n)
+        recorder.close()
+        videoStream.release()
+
+        capture = cv2.VideoCapture(filename)
+        self.assertEqual(capture.get(cv2.CAP_PROP_FPS), 60)
+        capture.release()
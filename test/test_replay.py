@@ -0,0 +1,33 @@
+import os
+import cv2
+import unittest
+import tempfile
+import numpy as np
+
+from evidencewriter import EvidenceWriter
+from framehistory import FrameHistory
+from replay import ReplayWriter
+
+
+class ReplayWriterTest(unittest.TestCase):
+    def test_replay(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            history = FrameHistory(5)
+            for n in range(5):
+                history.push(np.full((120, 160, 3), n * 50, np.uint8), n)
+
+            evidenceWriter = EvidenceWriter()
+            replayWriter = ReplayWriter(os.path.join(tmpDir, 'vid'), evidenceWriter, fps=120)
+            replayWriter.add(2, history.lend(0, 4))
+            for n in range(5, 10):  # history goes on while the replay gets written
+                history.push(np.zeros((120, 160, 3), np.uint8), n)
+            evidenceWriter.close()
+
+            (hitFrameNr, frames) = replayWriter.getLast()
+            self.assertEqual(hitFrameNr, 2)
+            self.assertEqual([frame[0, 0, 0] for (frameNr, frame) in frames], [0, 50, 100, 150, 200])
+
+            capture = cv2.VideoCapture(os.path.join(tmpDir, 'vid_2_replay.avi'))
+            self.assertEqual(capture.get(cv2.CAP_PROP_FPS), 120)
+            self.assertEqual(capture.get(cv2.CAP_PROP_FRAME_COUNT), 5)
+            capture.release()
@@ -0,0 +1,47 @@
+import os
+import cv2
+import unittest
+import tempfile
+import numpy as np
+
+from seekindex import SeekIndex
+from inputstream import SimpleInputStream
+
+
+class SeekIndexTest(unittest.TestCase):
+    def test_keyframe(self):
+        seekIndex = SeekIndex('test.mp4')
+        seekIndex.keyframes = [0, 12, 24]
+        self.assertEqual(seekIndex.getKeyframe(0), 0)
+        self.assertEqual(seekIndex.getKeyframe(11), 0)
+        self.assertEqual(seekIndex.getKeyframe(12), 12)
+        self.assertEqual(seekIndex.getKeyframe(100), 24)
+
+        seekIndex.keyframes = None
+        self.assertEqual(seekIndex.getKeyframe(5), None)
+
+
+    def test_seek(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            filename = os.path.join(tmpDir, 'test.avi')
+            writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'MJPG'), 30, (160, 120))
+            for n in range(20):
+                frame = np.zeros((120, 160, 3), np.uint8)
+                cv2.circle(frame, (5 + n * 7, 60), 4, (255, 255, 255), -1)
+                writer.write(frame)
+            writer.release()
+
+            inputStream = SimpleInputStream(filename)
+            inputStream.initStream()
+            for frameNr in (15, 3, 4, 19):
+                inputStream.seek(frameNr)
+                grabbed, frame, captureTime = inputStream.read()
+                (minVal, maxVal, minLoc, maxLoc) = cv2.minMaxLoc(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+                self.assertAlmostEqual(maxLoc[0], 5 + frameNr * 7, delta=3)
+            inputStream.release()
+
+            # saved next to the video
+            self.assertTrue(os.path.isfile(filename + '.seek.json'))
+            seekIndex = SeekIndex(filename)
+            seekIndex.load()
+            self.assertEqual(seekIndex.frameCount, 20)
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from model import RecordedHit
+from sessionlog import SessionLog, readSessionLog, convertInfoYaml, UNKNOWN
+
+
+class SessionLogTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'session.hits')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def test_append_read(self):
+        for n in range(3):
+            sessionLog = SessionLog(self.filename, lane=n)  # appends to the same file
+            hit = RecordedHit()
+            hit.x = 100 + n
+            hit.y = 200
+            hit.radius = 5
+            hit.distance = 42
+            hit.time = 7
+            hit.captureTime = 1000.5
+            sessionLog.add(hit, 10 * n)
+            sessionLog.close()
+
+        records = readSessionLog(self.filename)
+        self.assertEqual(len(records), 3)
+        self.assertEqual(list(records['frameNr']), [0, 10, 20])
+        self.assertEqual(list(records['x']), [100, 101, 102])
+        self.assertEqual(list(records['lane']), [0, 1, 2])
+        self.assertEqual(records['captureTime'][0], 1000.5)
+        self.assertEqual(np.sum(records['distance'] == 42), 3)
+
+        # a partly written record is ignored
+        with open(self.filename, 'ab') as f:
+            f.write(b'\x01\x02')
+        self.assertEqual(len(readSessionLog(self.filename)), 3)
+
+        # and cut off before appending
+        sessionLog = SessionLog(self.filename)
+        hit.x = 103
+        sessionLog.add(hit, 30)
+        sessionLog.close()
+        records = readSessionLog(self.filename)
+        self.assertEqual(list(records['frameNr']), [0, 10, 20, 30])
+        self.assertEqual(list(records['x']), [100, 101, 102, 103])
+
+
+    def test_not_a_log(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'something else entirely')
+        self.assertRaises(ValueError, readSessionLog, self.filename)
+
+
+    def test_convert(self):
+        for (frameNr, x) in [(40, 440), (10, 410)]:
+            with open(os.path.join(self.tmpdir, 'vid_{}_info.yaml'.format(frameNr)), 'w') as f:
+                f.write("x: {}\ny: 501\nradius: 11\n".format(x))
+        yamlFiles = [os.path.join(self.tmpdir, name) for name in os.listdir(self.tmpdir)]
+        records = convertInfoYaml(yamlFiles, lane=2)
+        self.assertEqual(list(records['frameNr']), [10, 40])
+        self.assertEqual(list(records['x']), [410, 440])
+        self.assertEqual(list(records['lane']), [2, 2])
+        self.assertEqual(list(records['distance']), [UNKNOWN, UNKNOWN])
+        self.assertEqual(list(records['captureTime']), [UNKNOWN, UNKNOWN])
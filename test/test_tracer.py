@@ -0,0 +1,59 @@
+import unittest
+import os
+import json
+import tempfile
+from threading import Thread
+
+from tracer import Tracer
+
+
+class TracerTest(unittest.TestCase):
+    def test_trace(self):
+        tracer = Tracer()
+
+        # disabled: nothing recorded
+        with tracer.span('Detector.initFrame', 1):
+            pass
+        self.assertEqual(len(tracer.events), 0)
+
+        tracer.enable()
+        with tracer.span('Detector.initFrame', 2):
+            with tracer.span('Detector.findHits', 2):
+                pass
+        tracer.disable()
+        self.assertEqual(len(tracer.events), 2)
+
+        filename = os.path.join(tempfile.mkdtemp(), 'trace.json')
+        tracer.save(filename)
+        with open(filename) as file:
+            trace = json.load(file)
+        events = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+        self.assertEqual([e['name'] for e in events], ['Detector.findHits', 'Detector.initFrame'])
+        self.assertEqual(events[0]['args']['frameNr'], 2)
+        self.assertLessEqual(events[1]['ts'], events[0]['ts'])
+        os.remove(filename)
+
+
+    def test_save_while_tracing(self):
+        # other threads keep adding events (and new threads) while saving
+        tracer = Tracer(maxEvents=20000)
+        tracer.enable()
+        stopped = []
+        def work():
+            for n in range(5000):
+                if stopped:
+                    break
+                with tracer.span('work', n):
+                    pass
+        threads = [Thread(target=work) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        filename = os.path.join(tempfile.mkdtemp(), 'trace.json')
+        for n in range(5):
+            tracer.save(filename)
+        stopped.append(True)
+        for thread in threads:
+            thread.join()
+        with open(filename) as file:
+            self.assertGreater(len(json.load(file)['traceEvents']), 0)
+        os.remove(filename)
@@ -0,0 +1,46 @@
+import unittest
+from unittest import mock
+
+from videotests import scoreHits, mergeShards
+
+
+class VideoTestsTest(unittest.TestCase):
+    def test_score_hits(self):
+        groundTruth = {
+            10: {'x': 410, 'y': 501},
+            40: {'x': 440, 'y': 501},
+            70: {'x': 470, 'y': 501},
+        }
+        hits = [
+            {'frameNr': 10, 'x': 412, 'y': 500},
+            {'frameNr': 40, 'x': 480, 'y': 501},  # wrong position
+            {'frameNr': 55, 'x': 100, 'y': 100},  # not in ground truth
+        ]
+        score = scoreHits(hits, groundTruth)
+        self.assertEqual(score['correct'], 1)
+        self.assertEqual(score['wrongPosition'], [40])
+        self.assertEqual(score['falsePositives'], [55])
+        self.assertEqual(score['missed'], [70])
+
+
+    def test_merge_shards(self):
+        def shard(startFrame, warmupFrame, hits, warmupHits):
+            return {
+                'filename': 'test.mp4', 'startFrame': startFrame, 'endFrame': startFrame + 100, 'warmupFrame': warmupFrame,
+                'hits': [{'frameNr': nr} for nr in hits], 'warmupHits': [{'frameNr': nr} for nr in warmupHits],
+            }
+        shards = [shard(0, 0, [10, 90], []), shard(100, 70, [120], [90]), shard(200, 170, [210], [])]
+        with mock.patch('videotests.analyzeShard') as analyzeShard:
+            hits, mismatches = mergeShards(shards)
+        self.assertEqual([hit['frameNr'] for hit in hits], [10, 90, 120, 210])
+        self.assertEqual(mismatches, 0)
+        analyzeShard.assert_not_called()
+
+        # the warm-up of the second shard missed the hit at 95: it gets analyzed again from frame 0
+        shards[0] = shard(0, 0, [10, 95], [])
+        again = shard(100, 0, [125], [10, 95])
+        with mock.patch('videotests.analyzeShard', return_value=again) as analyzeShard:
+            hits, mismatches = mergeShards(shards)
+        self.assertEqual(mismatches, 1)
+        self.assertEqual(analyzeShard.call_args[1]['warmupFrame'], 0)
+        self.assertEqual([hit['frameNr'] for hit in hits], [10, 95, 125, 210])
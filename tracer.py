@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Span(object):
+    """Measures the time spent in a with block"""
+    __slots__ = ('tracer', 'name', 'frameNr', 'start')
+
+    def __init__(self, tracer, name, frameNr):
+        self.tracer = tracer
+        self.name = name
+        self.frameNr = frameNr
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add(self.name, self.start, time.perf_counter_ns(), self.frameNr)
+        return False
+
+
+class NoSpan(object):
+    """Used when tracing is disabled, does nothing"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_SPAN = NoSpan()
+
+
+class Tracer(object):
+    """Records spans of the processing stages (capture, detect, plugins, display) per frame
+    and thread. Can be switched on and off at runtime, and saved as Chrome trace-event JSON
+    (open in chrome://tracing or ui.perfetto.dev)"""
+
+    def __init__(self, maxEvents=1000000):
+        self.enabled = False
+        self.maxEvents = maxEvents  # stop recording instead of eating all memory
+        self.events = []
+        self.threadNames = {}
+        self.lock = threading.Lock()  # the threads add events while save() reads them
+        self.startNs = time.perf_counter_ns()
+
+
+    def enable(self):
+        with self.lock:
+            self.events = []
+            self.threadNames = {}
+        self.enabled = True
+        logger.info("Tracing enabled")
+
+
+    def disable(self):
+        self.enabled = False
+        logger.info("Tracing disabled, {} events".format(len(self.events)))
+
+
+    def span(self, name, frameNr=None):
+        """Use as: with tracer.span('name', frameNr): ..."""
+        if not self.enabled:
+            return NO_SPAN
+        return Span(self, name, frameNr)
+
+
+    def add(self, name, startNs, endNs, frameNr=None):
+        if not self.enabled:
+            return
+        tid = threading.get_ident()
+        with self.lock:
+            if len(self.events) >= self.maxEvents:
+                return
+            if tid not in self.threadNames:
+                self.threadNames[tid] = threading.current_thread().name
+            self.events.append((name, startNs, endNs, tid, frameNr))
+
+
+    def save(self, filename):
+        """Write all recorded events as Chrome trace-event JSON"""
+        with self.lock:
+            events = list(self.events)
+            threadNames = dict(self.threadNames)
+
+        pid = os.getpid()
+        traceEvents = []
+        for tid, threadName in threadNames.items():
+            traceEvents.append({
+                'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                'args': {'name': threadName},
+            })
+        for (name, startNs, endNs, tid, frameNr) in events:
+            event = {
+                'name': name,
+                'ph': 'X',  # complete event
+                'ts': (startNs - self.startNs) / 1000,  # in us
+                'dur': (endNs - startNs) / 1000,
+                'pid': pid,
+                'tid': tid,
+            }
+            if frameNr is not None:
+                event['args'] = {'frameNr': frameNr}
+            traceEvents.append(event)
+
+        logger.info("Save trace to: " + filename)
+        with open(filename, 'w') as outfile:
+            json.dump({'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}, outfile)
+
+
+# one tracer for the whole process
+tracer = Tracer()
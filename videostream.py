@@ -3,15 +3,31 @@ import os
 import logging
 
 from fps import Fps
-from inputstream import SimpleInputStream, QueueInputStream
-from model import CamConfig
+from inputstream import SimpleInputStream, QueueInputStream, RingInputStream, CachedInputStream
+from framelru import FrameLru, FramePrefetcher
+from gfxutils import getTime
+from model import CamConfig, DropPolicy
+from tracer import tracer
 
 logger = logging.getLogger(__name__)
 
 
 class VideoStream(object):
-    def __init__(self, threaded):
+    def __init__(self, threaded, ring=False, dropPolicy=DropPolicy.block, lowLatency=False, cached=False):
         self.threaded = threaded
+        self.cached = cached  # files only: read grey frames from a FrameCache instead of decoding
+        self.dropPolicy = dropPolicy  # threaded only: what to do if the detector can't keep up
+        self.ring = ring  # threaded only: decode into preallocated frames (RingInputStream)
+        self.ringCapacity = 16  # more than the frames held by DetectorThread.Q and Lazer
+        self.queueSize = 8
+
+        # threaded only: only keep the newest frame, instead of a queue of old ones.
+        # Also used by DetectorThread
+        self.lowLatency = lowLatency
+        if lowLatency:
+            self.dropPolicy = DropPolicy.dropOldest
+            self.queueSize = 1
+            self.ringCapacity = 4  # DetectorThread, its queue, Lazer and the newest frame
 
         self.inputStream = None
         self.crop = None
@@ -33,14 +49,53 @@ class VideoStream(object):
         self.fps.tack()
         self.frameNr += 1
 
-        isTrue, frame = self.inputStream.read()
-        if isTrue and self.crop is not None:
+        with tracer.span('InputStream.read', self.frameNr):
+            isTrue, frame, captureTime = self.readFrame()
+        if isTrue and self.crop is not None and not self.inputStream.cropped:
             frame = self.doCrop(frame)
 
-        return isTrue, frame, self.frameNr
+        return isTrue, frame, self.frameNr, captureTime
+
+
+    def readFrame(self):
+        """(grabbed, frame, captureTime) of self.frameNr"""
+        return self.inputStream.read()
+
+
+    def releaseFrame(self):
+        """The consumer is done with the oldest frame it got from getFrame()"""
+        self.inputStream.releaseFrame()
+
+
+    def getDroppedFrames(self):
+        return self.inputStream.getDroppedFrames()
+
+
+    def getSourceFps(self):
+        """Frame rate of the video or cam, 30 if it does not tell (or something unlikely)"""
+        fps = 0
+        if self.inputStream is not None:
+            fps = self.inputStream.getFps()
+        if not 0 < fps <= 1000:
+            return 30
+        return fps
+
+
+    def createInputStream(self, path):
+        if self.cached:
+            # crop is applied when filling the cache, if it is already set
+            return CachedInputStream(path, crop=self.crop)
+        if not self.threaded:
+            return SimpleInputStream(path)
+        if self.ring:
+            return RingInputStream(path, capacity=self.ringCapacity, policy=self.dropPolicy)
+        return QueueInputStream(path, policy=self.dropPolicy, maxsize=self.queueSize)
 
 
     def setCrop(self, crop):
+        if self.inputStream is not None and self.inputStream.cropped:
+            logger.warning("Frames are already cropped by the frame cache, ignoring the new crop. Restart with it instead")
+            return
         self.crop = crop
 
 
@@ -67,10 +122,18 @@ class VideoStream(object):
 
 
 class FileVideoStream(VideoStream):
-    def __init__(self, threaded, endless):
-        super().__init__(threaded)
+    def __init__(self, threaded, endless, ring=False, cached=False, lruBytes=0):
+        super().__init__(threaded, ring, cached=cached)
         self.endless = endless
 
+        # non-threaded only: keep recently decoded frames, and decode the ones around
+        # the playhead after a seek in the background. For stepping through a video
+        self.lruBytes = lruBytes
+        self.frameLru = None
+        self.prefetcher = None
+        self.capturePos = 0  # next frame self.inputStream decodes
+        self.scrubbing = False  # frames are only kept once somebody steps or seeks
+
 
     def initFile(self, filename):
         if not os.path.isfile(filename):
@@ -78,41 +141,84 @@ class FileVideoStream(VideoStream):
             return False
         self.filename = filename
 
+        self.inputStream = self.createInputStream(filename)
+        self.inputStream.initStream()
         if self.threaded:
-            self.inputStream = QueueInputStream(filename)
-            self.inputStream.initStream()
             self.inputStream.start()  # start the reader thread
-        else:
-            self.inputStream = SimpleInputStream(filename)
-            self.inputStream.initStream()
 
-        self.width = int(self.inputStream.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
-        self.height = int(self.inputStream.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        (self.width, self.height) = self.inputStream.getResolution()
+
+        if self.lruBytes > 0 and not self.threaded and not self.cached:
+            self.frameLru = FrameLru(self.lruBytes)
+            self.prefetcher = FramePrefetcher(filename, self.frameLru)
+            self.prefetcher.start()
 
         return True
 
 
     def getFrame(self):
-        isTrue, frame, frameNr = super().getFrame()
+        isTrue, frame, frameNr, captureTime = super().getFrame()
         if not isTrue and self.endless:  # if file ends, continue at the beginning
-            self.setFrame(0)  # seamlessly start at the beginning
+            self.rewind()  # seamlessly start at the beginning
             return super().getFrame()
 
-        return isTrue, frame, frameNr
+        return isTrue, frame, frameNr, captureTime
+
+
+    def readFrame(self):
+        if self.frameLru is None:
+            return self.inputStream.read()
+        if not self.scrubbing:  # plain playback, no need to copy the frames
+            self.capturePos = self.frameNr + 1
+            return self.inputStream.read()
+
+        frame = self.frameLru.get(self.frameNr)
+        if frame is not None:
+            return True, frame.copy(), getTime()  # the consumer draws on it
+
+        if self.capturePos != self.frameNr:  # setFrame() does not seek, or the prefetcher decoded the frames
+            self.inputStream.seek(self.frameNr)
+        isTrue, frame, captureTime = self.inputStream.read()
+        self.capturePos = self.frameNr + 1
+        if isTrue:
+            if self.frameLru.getCount() == 0:
+                self.prefetcher.setFrameBytes(frame.nbytes)
+            self.frameLru.put(self.frameNr, frame.copy())
+        return isTrue, frame, captureTime
 
 
     def setFrame(self, frameNr):
-        if self.threaded:  # not implemented for now
-            logging.warn("SetFrame on threaded videostream?")
+        """Next getFrame() returns frameNr. Threaded: the caller has to make sure
+        nobody is in getFrame() at the same time (see DetectorThread.setFrameNr())"""
+        if self.frameLru is not None:
+            # keep the frames from now on, and seek lazily, the frame may be cached already
+            self.scrubbing = True
+            self.prefetcher.setPlayhead(frameNr)
+        else:
+            self.inputStream.seek(frameNr)
+        self.frameNr = frameNr - 1
+
+
+    def rewind(self):
+        """Continue at the first frame. Unlike setFrame(0), this does not start the scrub cache"""
+        if self.scrubbing:
+            self.setFrame(0)
             return
+        self.inputStream.seek(0)
+        self.capturePos = 0
+        self.frameNr = -1
 
-        self.inputStream.capture.set(cv2.CAP_PROP_POS_FRAMES, frameNr)
-        self.frameNr = frameNr - 1
+
+    def release(self):
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+        super().release()
 
 
 class CamVideoStream(VideoStream):
-    def __init__(self, threaded):
-        super().__init__(threaded)
+    def __init__(self, threaded, ring=False, dropPolicy=DropPolicy.dropOldest, lowLatency=False):
+        # for live shooting we want the newest frame, not a queue of old ones
+        super().__init__(threaded, ring, dropPolicy, lowLatency)
         c = CamConfig()
         self.exposure = c.exposure
         self.gain = c.gain
@@ -122,18 +228,14 @@ class CamVideoStream(VideoStream):
     def initCam(self, camId, resolution):
         self.filename = "cam_" + str(camId) + ".mp4"
         print("Initialize the cam. This can take some time...")
+        self.inputStream = self.createInputStream(camId)
+        self.inputStream.initStream()
+        self.inputStream.capture.set(3, resolution['width'])
+        self.inputStream.capture.set(4, resolution['height'])
+        if self.lowLatency:
+            self.inputStream.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # not supported by all backends
         if self.threaded:
-            self.inputStream = QueueInputStream(camId)
-            self.inputStream.initStream()
-            self.inputStream.capture.set(3, resolution['width'])
-            self.inputStream.capture.set(4, resolution['height'])
             self.inputStream.start()  # start the reader thread
-        else:
-            self.inputStream = SimpleInputStream(camId)
-            self.inputStream.initStream()
-
-            self.inputStream.capture.set(3, resolution['width'])
-            self.inputStream.capture.set(4, resolution['height'])
 
         #self.width = int(self.inputStream.capture.get(cv2.CAP_PROP_FRAME_WIDTH ))
         #self.height = int(self.inputStream.capture.get(cv2.CAP_PROP_FRAME_HEIGHT ))
@@ -1,14 +1,20 @@
 
+import cv2
 import glob
 import time
+import json
 import yaml
-import os.path
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
 
 from gfxutils import getTime, readVideoFileConfig
 from lazer import Lazer
 from videostream import FileVideoStream
 from model import *
 
+logger = logging.getLogger(__name__)
+
 
 tests = [
     # surface book
@@ -36,12 +42,15 @@ tests = [
 
 BASEDIR = "test_video/"
 
-def doTestsQuick():
+SHARD_FRAMES = 1800  # frames per shard of a video for the parallel analysis (~1min)
+SHARD_OVERLAP = 30  # frames analyzed before a shard, at least PluginHits.hitGraceTime. Checked by mergeShards()
+
+def doTestsQuick(cached=False):
     results = []
 
     for test in tests: 
         start = getTime()
-        frameCnt = testcaseQuick(test)
+        frameCnt = testcaseQuick(test, cached)
         end = getTime()
         res = {
             'test': test,
@@ -53,47 +62,51 @@ def doTestsQuick():
         print("Times: " + result['test'] + ": " + str( result['time'] ))
 
 
-def testcaseQuick(basename):
+def testcaseQuick(basename, cached=False):
     print("Test file: " + basename)
     filename = BASEDIR + basename + ".mp4"
 
     videoFileConfig = readVideoFileConfig(filename)
 
-    videoStream = FileVideoStream(threaded=False, endless=False)
+    videoStream = FileVideoStream(threaded=False, endless=False, cached=cached)
     videoStream.setCrop(videoFileConfig['crop'])
+    if not videoStream.initFile(filename):
+        return 0
 
-    lazer = Lazer(videoStream, thresh=videoFileConfig['thresh'], saveFrames=False, saveHits=False)
+    lazer = Lazer(videoStream, mode=Mode.main, thresh=videoFileConfig['thresh'], saveFrames=False, saveHits=False)
     
     # get all testcases to check if all triggered
     yamlFilenameList = glob.glob(BASEDIR + basename + "_*.yaml")
     yamlFilenameList = [i.replace('\\', '/') for i in yamlFilenameList]
 
-    for yamlFile in yamlFilenameList:
+    for yamlFile in list(yamlFilenameList):
         print("  YamlFile: " + yamlFile)
-        videoStream.initFile(filename)
 
-        frameNr = int(yamlFile.split('_')[-2])
+        frameNr = int(yamlFile[len(BASEDIR + basename) + 1:].split('_')[0])
         videoStream.setFrame(frameNr)
-        lazer.nextFrame()
+        hasFrame, data = lazer.nextFrame()
+        if not hasFrame:
+            print("Err: Frame not found: " + str(frameNr))
+            continue
 
-        recordedHits = lazer.detectAndDrawHits(staticImage=True)
+        recordedHits = data['recordedHits']
         if len(recordedHits) > 0:
             recordedHit = recordedHits[0]
-            print("Checking dot in frame " + str(videoStream.frameNr))
-            testHandleHit(recordedHit, basename, videoStream.frameNr, yamlFilenameList)
+            print("Checking dot in frame " + str(lazer.frameNr))
+            testHandleHit(recordedHit, basename, lazer.frameNr, yamlFilenameList)
         else:
             print("Err: No hits detected :( ")
-        lazer.release()
+    lazer.release()
 
     return 0
 
 
-def doTests():
+def doTests(hitAlgo=HitAlgo.contour, cached=False):
     results = []
 
     for test in tests: 
         start = getTime()
-        frameCnt = testcase(test)
+        frameCnt = testcase(test, hitAlgo, cached)
         end = getTime()
         
         res = {
@@ -103,21 +116,24 @@ def doTests():
         }
         results.append(res)
 
+    print("Hit detection: " + hitAlgo.name)
     for result in results:
         print("FPS: " + result['test'] + ": " + str( int(result['frames'] / result['time']) ))
 
 
-def testcase(basename):
+def testcase(basename, hitAlgo=HitAlgo.contour, cached=False):
     print("Test file: " + basename)
     filename = BASEDIR + basename + ".mp4"
 
     videoFileConfig = readVideoFileConfig(filename)
 
-    videoStream = FileVideoStream(threaded=True, endless=False)
-    videoStream.initFile(filename)
+    videoStream = FileVideoStream(threaded=True, endless=False, cached=cached)
     videoStream.setCrop(videoFileConfig['crop'])
+    videoStream.initFile(filename)
 
-    lazer = Lazer(videoStream, mode=Mode.main, thresh=videoFileConfig['thresh'], saveFrames=False, saveHits=False)
+    lazer = Lazer(
+        videoStream, mode=Mode.main, thresh=videoFileConfig['thresh'], saveFrames=False, saveHits=False,
+        hitAlgo=hitAlgo)
 
     # get all testcases to check if all triggered
     yamlFilenameList = glob.glob(BASEDIR + basename + "_*.yaml")
@@ -170,18 +186,255 @@ def testHandleHit(recordedHit, filename, frameNr, yamlFilenameList):
             print("  yamlRecordHit.y: " + str(yamlRecordedHit['y']))
 
 
-def writeVideoInfo(filename):
-    print("Write info of file: " + filename)
+def readGroundTruth(basename, basedir=None):
+    """Hits of a test video from its *_info.yaml files, as {frameNr: {'x', 'y', ...}}"""
+    if basedir is None:
+        basedir = BASEDIR
+    groundTruth = {}
+    for yamlFile in glob.glob(basedir + basename + "_*.yaml"):
+        yamlFile = yamlFile.replace('\\', '/')
+        try:
+            frameNr = int(yamlFile[len(basedir + basename) + 1:].split('_')[0])
+        except ValueError:
+            continue
+        with open(yamlFile) as file:
+            groundTruth[frameNr] = yaml.load(file, Loader=yaml.FullLoader)
+    return groundTruth
+
+
+def scoreHits(hits, groundTruth, maxDistance=10):
+    """Compare hits (dicts with frameNr, x, y) with the ground truth of readGroundTruth()"""
+    score = {
+        'hits': len(hits),
+        'expected': len(groundTruth),
+        'correct': 0,
+        'wrongPosition': [],  # frameNr
+        'falsePositives': [],  # frameNr
+        'missed': [],  # frameNr
+    }
+    found = set()
+    for hit in hits:
+        expected = groundTruth.get(hit['frameNr'])
+        if expected is None:
+            score['falsePositives'].append(hit['frameNr'])
+            continue
+        found.add(hit['frameNr'])
+        if abs(hit['x'] - expected['x']) > maxDistance or abs(hit['y'] - expected['y']) > maxDistance:
+            score['wrongPosition'].append(hit['frameNr'])
+        else:
+            score['correct'] += 1
+    score['missed'] = sorted(set(groundTruth) - found)
+    return score
+
+
+def getFrameCount(filename):
+    capture = cv2.VideoCapture(filename)
+    frameCount = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    return frameCount
 
-    videoStream = FileVideoStream(threaded=True, endless=False)
-    videoStream.initFile(filename)
-    lazer = Lazer(videoStream, saveFrames=False, saveHits=True)
 
+def makeShards(filename, shardFrames=SHARD_FRAMES):
+    """Split a video into (filename, startFrame, endFrame) frame ranges"""
+    frameCount = getFrameCount(filename)
+    if frameCount <= 0:  # unknown, do it in one go
+        return [(filename, 0, None)]
+    return [(filename, start, min(start + shardFrames, frameCount)) for start in range(0, frameCount, shardFrames)]
+
+
+def initShardWorker():
+    # the pool already uses all cores, no need for opencv threads on top
+    cv2.setNumThreads(1)
+
+
+def analyzeShard(filename, startFrame, endFrame, hitAlgoName, saveHits=False, cached=False, warmupFrame=None):
+    """Process: detect hits in frames startFrame to endFrame (exclusive, None for all) of filename.
+
+    Starts at warmupFrame (default: SHARD_OVERLAP frames earlier), so hits just before the shard
+    start the grace time like they would when playing the whole video.
+    Hits of these warm-up frames are returned separately (they belong to the previous shard)"""
+    videoFileConfig = readVideoFileConfig(filename)
+
+    videoStream = FileVideoStream(threaded=False, endless=False, cached=cached)
+    videoStream.setCrop(videoFileConfig['crop'])
+    if not videoStream.initFile(filename):
+        return None
+    if warmupFrame is None:
+        warmupFrame = startFrame - SHARD_OVERLAP
+    warmupFrame = max(0, warmupFrame)
+    if warmupFrame > 0:
+        videoStream.setFrame(warmupFrame)
+
+    lazer = Lazer(
+        videoStream, mode=Mode.main, thresh=videoFileConfig['thresh'], saveFrames=False, saveHits=False,
+        hitAlgo=HitAlgo[hitAlgoName])
+
+    hits = []
+    warmupHits = []
+    frames = 0
+    start = time.perf_counter()
     while True:
-        isTrue = lazer.nextFrame()  # gets next frame, and creates mask
-        if not isTrue:
-            break
-        lazer.detectAndDrawHits()  # all in one for now
+        # only save the hits of our own frames
+        lazer.saveHits = saveHits and videoStream.frameNr + 1 >= startFrame
 
+        hitCount = len(lazer.hits)
+        hasFrame, data = lazer.nextFrame()
+        if not hasFrame:
+            break
+        if lazer.frameNr >= startFrame:
+            frames += 1
+        for hit in lazer.hits[hitCount:]:
+            hit = {'frameNr': lazer.frameNr, 'x': int(hit.x), 'y': int(hit.y), 'radius': int(hit.radius)}
+            if lazer.frameNr < startFrame:
+                warmupHits.append(hit)
+            else:
+                hits.append(hit)
+
+        if endFrame is not None and lazer.frameNr + 1 >= endFrame:
+            break
+    duration = time.perf_counter() - start
     lazer.release()
 
+    return {
+        'filename': filename,
+        'startFrame': startFrame,
+        'endFrame': endFrame,
+        'warmupFrame': warmupFrame,
+        'frames': frames,
+        'time': duration,
+        'hits': hits,
+        'warmupHits': warmupHits,
+    }
+
+
+def buildFrameCache(filename):
+    """Process: decode filename into its FrameCache, if not done yet"""
+    videoStream = FileVideoStream(threaded=False, endless=False, cached=True)
+    videoStream.setCrop(readVideoFileConfig(filename)['crop'])
+    videoStream.initFile(filename)
+    videoStream.release()
+
+
+def runShards(shards, hitAlgo, workers=None, saveHits=False, cached=False):
+    """Analyze all (filename, startFrame, endFrame) shards in a process pool.
+    Returns the results per file, with the shards in order"""
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=initShardWorker) as executor:
+        if cached:
+            # once per file, instead of every shard decoding it at the same time
+            list(executor.map(buildFrameCache, sorted(set(s[0] for s in shards))))
+
+        # longest first, so a long video does not end up alone at the end
+        shards = sorted(shards, key=lambda s: s[2] - s[1] if s[2] is not None else 0, reverse=True)
+        futures = [
+            executor.submit(analyzeShard, filename, startFrame, endFrame, hitAlgo.name, saveHits, cached)
+            for (filename, startFrame, endFrame) in shards
+        ]
+        for future in futures:
+            shardResult = future.result()
+            if shardResult is None:
+                continue
+            results.setdefault(shardResult['filename'], []).append(shardResult)
+
+    for filename in results:
+        results[filename].sort(key=lambda r: r['startFrame'])
+    return results
+
+
+def mergeShards(shardResults, hitAlgo=HitAlgo.contour, saveHits=False, cached=False):
+    """Hits of all shards of one video in order, and the number of shard boundaries where
+    the warm-up did not see the same hits as the shard before.
+
+    There, the hits may be in another state (grace time) than when playing the whole video.
+    Such a shard is analyzed again, here, from where the shard before started: it then
+    gets to the boundary exactly like the shard before"""
+    hits = []
+    mismatches = 0
+    previousResult = None
+    for shardResult in shardResults:
+        previous = [hit['frameNr'] for hit in hits if hit['frameNr'] >= shardResult['warmupFrame']]
+        if previousResult is not None and previous != [hit['frameNr'] for hit in shardResult['warmupHits']]:
+            logger.info("{}: shard at frame {} started with different hits, analyzing it again from frame {}".format(
+                shardResult['filename'], shardResult['startFrame'], previousResult['warmupFrame']))
+            mismatches += 1
+            shardResult = analyzeShard(
+                shardResult['filename'], shardResult['startFrame'], shardResult['endFrame'],
+                hitAlgo.name, saveHits, cached, warmupFrame=previousResult['warmupFrame'])
+        hits += shardResult['hits']
+        previousResult = shardResult
+    return hits, mismatches
+
+
+def doTestsParallel(hitAlgo=HitAlgo.contour, workers=None, shardFrames=SHARD_FRAMES, reportFile=None, cached=False):
+    """Like doTests(), but spreads the videos (split in shards) over a process pool.
+    Writes a JSON report with accuracy against the *_info.yaml files and throughput"""
+    start = getTime()
+    shards = []
+    for test in tests:
+        filename = BASEDIR + test + ".mp4"
+        if not os.path.isfile(filename):
+            logger.error("File not found: " + filename)
+            continue
+        shards += makeShards(filename, shardFrames)
+    print("Analyzing {} videos in {} shards with {} workers".format(len(tests), len(shards), workers or os.cpu_count()))
+
+    results = runShards(shards, hitAlgo, workers, cached=cached)
+    wallTime = getTime() - start
+
+    report = {
+        'hitAlgo': hitAlgo.name,
+        'workers': workers or os.cpu_count(),
+        'shardFrames': shardFrames,
+        'wallTime': round(wallTime, 2),
+        'videos': [],
+    }
+    totalFrames = 0
+    totalCorrect = 0
+    totalExpected = 0
+    for test in tests:
+        filename = BASEDIR + test + ".mp4"
+        if filename not in results:
+            continue
+        hits, mismatches = mergeShards(results[filename], hitAlgo, cached=cached)
+        frames = sum(r['frames'] for r in results[filename])
+        cpuTime = sum(r['time'] for r in results[filename])
+        score = scoreHits(hits, readGroundTruth(test))
+        report['videos'].append({
+            'test': test,
+            'frames': frames,
+            'shards': len(results[filename]),
+            'shardMismatches': mismatches,
+            'fps': int(frames / cpuTime) if cpuTime > 0 else 0,  # per worker
+            'score': score,
+            'hits': hits,
+        })
+        totalFrames += frames
+        totalCorrect += score['correct']
+        totalExpected += score['expected']
+
+        print("{:20} {:6} frames {:5} fps  {}/{} correct, {} false positives, {} missed".format(
+            test, frames, report['videos'][-1]['fps'], score['correct'], score['expected'],
+            len(score['falsePositives']), len(score['missed'])))
+
+    report['frames'] = totalFrames
+    report['fps'] = int(totalFrames / wallTime) if wallTime > 0 else 0  # all workers
+    report['correct'] = totalCorrect
+    report['expected'] = totalExpected
+    print("Hit detection: {}  {}/{} correct  {} frames in {:.1f}s ({} fps)".format(
+        hitAlgo.name, totalCorrect, totalExpected, totalFrames, wallTime, report['fps']))
+
+    if reportFile is not None:
+        with open(reportFile, 'w') as outfile:
+            json.dump(report, outfile, indent=2)
+        print("Report saved to: " + reportFile)
+    return report
+
+
+def writeVideoInfo(filename, workers=None):
+    """Save jpg+yaml of all hits of a video file, shards processed in parallel"""
+    print("Write info of file: " + filename)
+    results = runShards(makeShards(filename), HitAlgo.contour, workers, saveHits=True)
+    if filename not in results:
+        return
+    hits, mismatches = mergeShards(results[filename], saveHits=True)
+    print("Wrote {} hits".format(len(hits)))
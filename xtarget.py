@@ -2,12 +2,14 @@ import cv2
 import argparse
 
 from lazer import Lazer
-from model import Mode
-from videotests import writeVideoInfo
+from model import Mode, HitAlgo, DropPolicy
+from videotests import writeVideoInfo, doTests, doTestsQuick, doTestsParallel
 from gfxutils import readVideoFileConfig
 #import curses
 from playback import Playback
+from multicam import MultiCam
 from videostream import FileVideoStream, CamVideoStream
+from tracer import tracer
 
 import logging
 
@@ -36,9 +38,10 @@ def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--video", help="Play a video file")
     ap.add_argument("--image", help="Play a image")
-    ap.add_argument("--cam", help="Capture from webcam id (starting at 0)")
+    ap.add_argument("--cam", help="Capture from webcam id (starting at 0), or several: 0,1")
     ap.add_argument("--camProjector", help="Cam: Use projector (with Aruco)", action='store_true')
     ap.add_argument("--test", help="Perform analysis of test-videos and validate (slow)", action='store_true')
+    ap.add_argument("--testParallel", help="Like --test, but on all cores, with a JSON report (--report)", action='store_true')
     ap.add_argument("--testQuick", help="Perform analysis of test-pics and validate (fast)", action='store_true')
     ap.add_argument("--target", help="Try to detect iTarget", action='store_true')
     ap.add_argument("--write", help="Write hits from video file as jpg+yaml files")
@@ -48,32 +51,84 @@ def main():
     # options
     ap.add_argument("--saveHits", help='Option: Save jpg+yaml of all detected hits', action='store_true', default=False)
     ap.add_argument("--saveFrames", help='Option: Save jpg+yaml of every frame', action='store_true', default=False)
+    ap.add_argument("--saveSnippets", help='Option: Save small crops of the frames around hits into one tar per session', action='store_true', default=False)
+    ap.add_argument("--replay", help='Option: Save the frames 0.5s before and after every hit as video (show the last with i)', action='store_true', default=False)
+    ap.add_argument("--record", help='Option: Record the window (with hits and UI) as video, encoded in another process', action='store_true', default=False)
+    ap.add_argument("--recordSkip", help='Option: Record only every n-th frame', type=int, default=1)
+    ap.add_argument("--recordScale", help='Option: Resolution of the recording, relative to the frames', type=float, default=1.0)
+    ap.add_argument("--recordFormat", help='Option: avi (MJPEG) or mp4', choices=['avi', 'mp4'], default='avi')
+    ap.add_argument("--detectorWorkers", help='Performance: Detect in this many frames in parallel (not with --hitAlgo diff)', type=int, default=1)
+    ap.add_argument("--decimate", help='Performance: Only detect every n-th frame until there is a hit (high fps sources)', type=int, default=1)
+    ap.add_argument("--accumulate", help='Performance: With --decimate, check the brightest pixels of every n frames, to not miss short laser dots', action='store_true', default=False)
+    ap.add_argument("--sessionLog", help='Option: Append all hits to this session log file (see sessionlog.py)')
+    ap.add_argument("--lane", help='Option: Lane number of the hits in the session log (with several --cam: the camera id)', type=int, default=0)
+    ap.add_argument("--saveFormat", help='Option: Image format for --saveHits/--saveFrames', choices=['jpg', 'png'], default='jpg')
     #ap.add_argument("--curses", help='Camera option: Show curses ui in terminal for webcam settings (broken)', action='store_true', default=False)
+    ap.add_argument("--roi", help='Option: Only detect hits around the target in main mode (faster)', action='store_true', default=False)
+    ap.add_argument("--hitAlgo", help='Option: How to detect hits in main mode', choices=[a.name for a in HitAlgo], default=HitAlgo.contour.name)
+    ap.add_argument("--ring", help='Camera option: Decode into preallocated frames instead of a queue', action='store_true', default=False)
+    ap.add_argument("--dropPolicy", help='Camera option: Which frame to drop if detection is too slow', choices=[p.name for p in DropPolicy], default=DropPolicy.dropOldest.name)
+    ap.add_argument("--lowLatency", help='Camera option: Only process the newest frame, no queues', action='store_true', default=False)
+    ap.add_argument("--trace", help='Option: Record a trace of all processing stages (also: r)', action='store_true', default=False)
+    ap.add_argument("--cached", help='Video option: decode the video once into a grey frame cache (.framecache/), and read from it', action='store_true', default=False)
+    ap.add_argument("--scrubCache", help="Video option: MB of decoded frames to keep for stepping back and forth (d/e/f), 0 to disable", type=int, default=512)
+    ap.add_argument("--workers", help="Test option: number of processes (default: all cores)", type=int)
+    ap.add_argument("--report", help="Test option: JSON file to write the results of --testParallel to")
     ap.add_argument("--width", help="Camera option: resolution width", type=int)
     ap.add_argument("--height", help="Camera option: resolution height", type=int)
     args = ap.parse_args()
 
     logging.basicConfig(level=logging.INFO)
+    if args.trace:
+        tracer.enable()
 
     if args.video is not None:
         filename = args.video
         videoFileConfig = readVideoFileConfig(filename)
 
-        videoStream = FileVideoStream(threaded=False, endless=True)
+        # the detector workers need the frames read ahead by a thread
+        videoStream = FileVideoStream(
+            threaded=args.detectorWorkers > 1, endless=True, cached=args.cached, lruBytes=args.scrubCache * 1024 * 1024)
+        videoStream.setCrop(videoFileConfig['crop'])
         if not videoStream.initFile(filename):
             return
-        videoStream.setCrop(videoFileConfig['crop'])
 
         playback = Playback(
             videoStream, withProjector=args.camProjector,
             thresh=videoFileConfig['thresh'],
-            saveFrames=args.saveFrames, saveHits=args.saveHits, enableTarget=args.target)
+            saveFrames=args.saveFrames, saveHits=args.saveHits, enableTarget=args.target, roi=args.roi,
+            hitAlgo=HitAlgo[args.hitAlgo], saveFormat=args.saveFormat, saveSnippets=args.saveSnippets,
+            sessionLog=args.sessionLog, lane=args.lane, replay=args.replay,
+            record=args.record, recordSkip=args.recordSkip, recordScale=args.recordScale, recordFormat=args.recordFormat,
+            detectorWorkers=args.detectorWorkers, decimate=args.decimate, accumulate=args.accumulate)
         playback.init()
         playback.play()
 
+    elif args.cam is not None and ',' in args.cam:
+        camIds = [int(camId) for camId in args.cam.split(',')]
+        resolution = {'width': 1920, 'height': 1080}
+        if args.width is not None and args.height is not None:
+            resolution = {'width': args.width, 'height': args.height}
+
+        videoStreams = []
+        for camId in camIds:
+            videoStream = CamVideoStream(
+                threaded=True, ring=args.ring, dropPolicy=DropPolicy[args.dropPolicy], lowLatency=args.lowLatency)
+            videoStream.initCam(camId, resolution=resolution)
+            videoStreams.append(videoStream)
+
+        multiCam = MultiCam(
+            videoStreams, camIds, sessionLog=args.sessionLog,
+            saveFrames=args.saveFrames, saveHits=args.saveHits, enableTarget=args.target, roi=args.roi,
+            hitAlgo=HitAlgo[args.hitAlgo], saveFormat=args.saveFormat, saveSnippets=args.saveSnippets,
+            replay=args.replay, detectorWorkers=args.detectorWorkers, decimate=args.decimate, accumulate=args.accumulate)
+        multiCam.init()
+        multiCam.play()
+
     elif args.cam is not None:
         camId = int(args.cam)
-        videoStream = CamVideoStream(threaded=True)
+        videoStream = CamVideoStream(
+            threaded=True, ring=args.ring, dropPolicy=DropPolicy[args.dropPolicy], lowLatency=args.lowLatency)
 
         resolution = {'width': 1920, 'height': 1080}
         if args.width is not None and args.height is not None:
@@ -82,7 +137,11 @@ def main():
         videoStream.initCam(camId, resolution=resolution)
         playback = Playback(
             videoStream, withProjector=args.camProjector, 
-            saveFrames=args.saveFrames, saveHits=args.saveHits, enableTarget=args.target)
+            saveFrames=args.saveFrames, saveHits=args.saveHits, enableTarget=args.target, roi=args.roi,
+            hitAlgo=HitAlgo[args.hitAlgo], saveFormat=args.saveFormat, saveSnippets=args.saveSnippets,
+            sessionLog=args.sessionLog, lane=args.lane, replay=args.replay,
+            record=args.record, recordSkip=args.recordSkip, recordScale=args.recordScale, recordFormat=args.recordFormat,
+            detectorWorkers=args.detectorWorkers, decimate=args.decimate, accumulate=args.accumulate)
         playback.init()
         playback.play()
 
@@ -101,9 +160,11 @@ def main():
         key = cv2.waitKey(0)
 
     elif args.test:
-        doTests()
+        doTests(HitAlgo[args.hitAlgo], cached=args.cached)
+    elif args.testParallel:
+        doTestsParallel(HitAlgo[args.hitAlgo], workers=args.workers, reportFile=args.report, cached=args.cached)
     elif args.testQuick:
-        doTestsQuick()
+        doTestsQuick(cached=args.cached)
 
     elif args.showframe is not None:
         filename = args.showframe
@@ -111,7 +172,7 @@ def main():
 
     elif args.write:
         filename = args.write
-        writeVideoInfo(filename)
+        writeVideoInfo(filename, workers=args.workers)
 
 
 def startCursesThread():